@@ -1,278 +1,3909 @@
-from flask import Flask, render_template, send_from_directory, jsonify, abort, request
+from flask import Flask, render_template, send_from_directory, send_file, jsonify, abort, request, g
+from werkzeug.security import safe_join
 import os
 import litellm  # For Grok API integration
 from datetime import datetime
 from dotenv import load_dotenv  # Load environment variables from .env
 import base64  # For encoding image files
-import win32file  # For setting/checking hidden attribute on Windows
-import win32con  # For Windows file attributes
+import io  # For re-encoding images in memory before tagging
+import mimetypes  # For labelling images sent to the vision model
+import bisect  # For prefix lookups in the sorted search vocabulary
+import json  # For persisting the search index
+import re  # For tokenizing paths, tags and descriptions
+import threading  # For guarding shared in-memory state
+import time  # For throttling index persistence
+import atexit  # For flushing the search index on shutdown
+import sqlite3  # For the embedded metadata store
+import queue  # For the watcher's bounded event queue
+import hashlib  # For content-addressed thumbnail cache keys
+import collections  # For the tagging rate limiter's sliding window
+import random  # For jittered retry backoff
+from concurrent.futures import ProcessPoolExecutor  # For eager thumbnail generation during scans
+import multiprocessing  # For spawning pool workers instead of forking the threaded server
+import stat  # For reading Windows file attributes from os.scandir results
+import contextlib  # For the metadata file lock context manager
+import abc  # For the metadata store interface
+import functools  # For caching semantic query embeddings
+import shutil  # For spooling uploaded catalogs
+import tempfile  # For spooling uploaded catalogs
+import click  # For the catalog CLI commands' options
+from urllib.parse import quote  # For X-Accel-Redirect locations
+import cProfile  # For per-request profiling
+import pstats  # For text summaries of request profiles
 import logging  # For detailed logging
 
+try:
+    import fcntl  # Advisory file locks on POSIX
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt  # Advisory file locks on Windows
+except ImportError:
+    msvcrt = None
+
+try:
+    import win32file  # Optional: hiding bookkeeping files with the Windows hidden attribute
+    import win32con
+except ImportError:
+    win32file = None
+    win32con = None
+
+try:
+    from watchdog.observers import Observer  # Optional: native filesystem events for the library watcher
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+try:
+    import xxhash  # Optional: faster content hashing; BLAKE2b is used without it
+    CONTENT_HASH_ALGORITHM = "xxh128"
+except ImportError:
+    xxhash = None
+    CONTENT_HASH_ALGORITHM = "blake2b"
+
+try:
+    import numpy as np  # Optional: vector math for semantic search
+except ImportError:
+    np = None
+
+try:
+    import hnswlib  # Optional: approximate nearest-neighbour index for semantic search over large libraries
+except ImportError:
+    hnswlib = None
+
+try:
+    import pyarrow as pa  # Optional: Parquet catalog export and import
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler  # Optional: readable per-request profiles
+except ImportError:
+    PyinstrumentProfiler = None
+
+try:
+    from PIL import Image, ImageOps  # Optional: thumbnail generation; originals are served without it
+except ImportError:
+    Image = None
+    ImageOps = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+app = Flask(__name__)
+
+# Load environment variables from .env file explicitly
+load_dotenv('.env')
+
+# Root folder to scan (updated to your path; VISIONVAULT_ROOT overrides it)
+ROOT_FOLDER = os.environ.get('VISIONVAULT_ROOT', r"C:\Users\monse\Pictures\X")
+
+# Set Grok API key from environment variable
+litellm.api_key = os.environ.get('XAI_API_KEY')
+litellm.api_base = "https://api.grok.xai"  # Adjust based on xAI's API endpoint (check docs)
+
+# Metadata backend: "sqlite" (default) or "tagsfile" (the legacy hidden .tags.txt files)
+METADATA_BACKEND = os.environ.get('VISIONVAULT_METADATA_BACKEND', 'sqlite')
+METADATA_DB_FILENAME = '.visionvault.db'  # Also matches its -wal/-shm companions
+TAGGING_QUEUE_FILENAME = '.tagging_queue.db'
+CONTENT_HASHES_FILENAME = '.content_hashes.json'  # Content hashes and tag cache for the tagsfile backend
+SQLITE_MAX_PARAMS = 500  # Bound parameters per IN (...) query
+
+# Background library watcher (VISIONVAULT_WATCH=1 to enable)
+WATCHER_ENABLED = os.environ.get('VISIONVAULT_WATCH', '0') == '1'
+WATCHER_BACKEND = os.environ.get('VISIONVAULT_WATCH_BACKEND', 'auto')  # "auto", "watchdog" or "polling"
+WATCHER_DEBOUNCE = float(os.environ.get('VISIONVAULT_WATCH_DEBOUNCE', '1.0'))  # Seconds of quiet before applying
+WATCHER_QUEUE_SIZE = 10000
+WATCHER_POLL_INTERVAL = 5  # Seconds between passes of the polling fallback
+
+# Thumbnails for the file grid, cached outside the library
+THUMBNAIL_CACHE_DIR = os.environ.get('VISIONVAULT_THUMBNAIL_DIR',
+                                     os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'thumbs'))
+THUMBNAIL_SIZES = (128, 256, 512, 1024)  # Allowed bounding boxes, in pixels
+THUMBNAIL_DEFAULT_SIZE = 256  # Used by the file grid and pre-generated during scans
+THUMBNAIL_FORMAT = os.environ.get('VISIONVAULT_THUMBNAIL_FORMAT', 'webp')  # "webp" or "jpeg"
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get('VISIONVAULT_THUMBNAIL_CACHE_MB', '2048')) * 1024 * 1024
+THUMBNAIL_PREGENERATE = os.environ.get('VISIONVAULT_THUMBNAIL_PREGENERATE', '1') == '1'
+
+# Serving library files. URLs carrying the file's version (?v=<mtime>-<size>) are cached for a year; others are
+# revalidated against a strong ETag. Behind nginx, set VISIONVAULT_ACCEL_REDIRECT to an internal location that
+# aliases ROOT_FOLDER to hand /files off with X-Accel-Redirect; VISIONVAULT_X_SENDFILE=1 uses X-Sendfile instead
+# (Apache mod_xsendfile, lighttpd).
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('VISIONVAULT_ACCEL_REDIRECT', '')
+app.config['USE_X_SENDFILE'] = os.environ.get('VISIONVAULT_X_SENDFILE', '0') == '1'
+
+# Metrics, served at /metrics in the Prometheus text format
+METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_TAGGING_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+# Per-request profiling (VISIONVAULT_PROFILING=1, then add ?profile=1 to a URL). Reports are written to PROFILE_DIR
+# as pyinstrument HTML when it is installed, otherwise as cProfile stats with a text summary.
+PROFILING_ENABLED = os.environ.get('VISIONVAULT_PROFILING', '0') == '1'
+PROFILE_DIR = os.environ.get('VISIONVAULT_PROFILE_DIR',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'profiles'))
+
+# Content hashing for duplicate detection and the tag cache
+CONTENT_HASHING = os.environ.get('VISIONVAULT_CONTENT_HASHING', '1') == '1'
+PERCEPTUAL_HASHING = os.environ.get('VISIONVAULT_PERCEPTUAL_HASHING', '1') == '1'  # dHash of images (Pillow)
+NEAR_DUPLICATE_THRESHOLD = 6  # Max differing dHash bits for /api/duplicates near-duplicates (at most 7)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Worker processes shared by thumbnail generation and content hashing
+PROCESS_POOL_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# AI tagging worker pool (VISIONVAULT_TAGGING=1 to start it with the app). Point TAGGING_API_BASE at a local
+# OpenAI-compatible stub (with e.g. VISIONVAULT_TAGGING_MODEL=openai/stub) to test without the real API.
+TAGGING_ENABLED = os.environ.get('VISIONVAULT_TAGGING', '0') == '1'
+TAGGING_MODEL = os.environ.get('VISIONVAULT_TAGGING_MODEL', "xai/grok-2-vision-1212")
+TAGGING_API_BASE = os.environ.get('VISIONVAULT_TAGGING_API_BASE', litellm.api_base)
+TAGGING_API_KEY = os.environ.get('VISIONVAULT_TAGGING_API_KEY', litellm.api_key)
+TAGGING_TIMEOUT = 120  # Seconds per request
+TAGGING_WORKERS = int(os.environ.get('VISIONVAULT_TAGGING_WORKERS', '4'))
+TAGGING_REQUESTS_PER_MINUTE = int(os.environ.get('VISIONVAULT_TAGGING_RPM', '60'))
+TAGGING_TOKENS_PER_MINUTE = int(os.environ.get('VISIONVAULT_TAGGING_TPM', '100000'))
+TAGGING_MAX_EDGE = int(os.environ.get('VISIONVAULT_TAGGING_MAX_EDGE', '1024'))  # Longest edge sent, in pixels
+TAGGING_IMAGE_FORMAT = os.environ.get('VISIONVAULT_TAGGING_IMAGE_FORMAT', 'jpeg')  # "jpeg" or "webp"
+TAGGING_IMAGE_QUALITY = 85
+TAGGING_ORIGINAL_FORMATS = ("JPEG", "PNG", "WEBP")  # Sent unchanged when that is smaller than re-encoding them
+TAGGING_TOKENS_PER_IMAGE = 1500  # Estimate reserved against the token budget until the real usage is known
+TAGGING_MAX_RETRIES = 3
+TAGGING_BACKOFF_BASE = 2  # Seconds; doubled per retry, with jitter
+TAGGING_BACKOFF_MAX = 60
+TAGGING_BATCH_SIZE = 20  # Results written back per metadata batch
+TAGGING_FLUSH_INTERVAL = 10  # Seconds before a partial batch is written anyway
+TAGGING_DISCOVERY_INTERVAL = 60  # Seconds between looking for newly untagged images while idle
+
+# Tags stored for files that have not been tagged yet
+PLACEHOLDER_TAGS = ("untagged", "Pending tags")
+PLACEHOLDER_DESCRIPTIONS = ("No description available", "Error processing image")
+
+# Search index settings
+SEARCH_INDEX_FILENAME = '.search_index.json'
+SEARCH_DEFAULT_LIMIT = 200
+SEARCH_MAX_LIMIT = 1000
+SEARCH_INDEX_SAVE_INTERVAL = 30  # Seconds between persisting incremental index changes
+# Relative weight of a token match per field when ranking search results
+SEARCH_FIELD_WEIGHTS = {"tags": 3, "path": 2, "description": 1}
+# Query syntax: words, "quoted phrases" and field filters, any of them negated with a leading "-"
+SEARCH_QUERY_PATTERN = re.compile(r'(-?)(?:([a-z]+):)?(?:"([^"]*)"?|(\S+))', re.IGNORECASE)
+SEARCH_FILTER_FIELDS = ("tag", "format", "in", "after", "before")
+SEARCH_FACET_LIMIT = 20  # Top tags returned with search results
+
+# Folder listing pagination for the file grid
+LISTING_DEFAULT_LIMIT = 200
+LISTING_MAX_LIMIT = 1000
+LISTING_SORT_KEYS = ("name", "mtime", "size", "type")
+LISTING_CACHE_SIZE = 64  # Folders whose sorted listings are kept in memory
+LISTING_VIEWS_PER_FOLDER = 8  # Sort/filter combinations cached per folder
+
+# Operations accepted by a single /api/bulk request
+BULK_MAX_OPERATIONS = 10000
+
+# Startup scan manifest (per-directory mtime, subdirectory names and file names)
+SCAN_MANIFEST_FILENAME = '.scan_manifest.json'
+# Directories modified this close to the scan are re-listed next time, since a same-tick change could be missed
+SCAN_MTIME_GRACE = 2
+
+# Semantic search (VISIONVAULT_EMBEDDINGS=1; needs NumPy and sentence-transformers). A local model embeds images
+# and their descriptions into one vector space on the CPU, in batches, in a dedicated worker process. Vectors
+# are kept in a float16 matrix memory-mapped from a bookkeeping file.
+EMBEDDINGS_ENABLED = os.environ.get('VISIONVAULT_EMBEDDINGS', '0') == '1'
+EMBEDDING_MODEL = os.environ.get('VISIONVAULT_EMBEDDING_MODEL', 'clip-ViT-B-32')
+EMBEDDING_THREADS = int(os.environ.get('VISIONVAULT_EMBEDDING_THREADS', '2'))  # CPU threads used by the model
+EMBEDDING_BATCH_SIZE = 32  # Images per inference batch
+EMBEDDING_IMAGE_SIZE = 224  # Images are decoded at about the model's input size
+EMBEDDING_TEXT_WORDS = 50  # Descriptions and queries are cut to fit the text encoder's context
+EMBEDDINGS_FILENAME = '.embeddings.f16'
+EMBEDDING_ROWS_FILENAME = '.embeddings.json'
+EMBEDDING_INITIAL_ROWS = 1024  # The matrix file starts this large and doubles when full
+EMBEDDING_SAVE_INTERVAL = 30  # Seconds between persisting incremental index changes
+EMBEDDING_QUERY_TIMEOUT = 120  # Seconds; the first query also loads the model
+EMBEDDING_QUERY_CACHE_SIZE = 256
+EMBEDDING_SCORE_CHUNK = 65536  # Rows converted to float32 at a time when scoring every vector
+EMBEDDING_ANN_THRESHOLD = 100000  # Vectors beyond which an hnswlib index (if installed) narrows the candidates
+EMBEDDING_ANN_REBUILD_INTERVAL = 600  # Seconds between background rebuilds of the hnswlib index after changes
+SIMILAR_DEFAULT_LIMIT = 50
+SEMANTIC_MAX_RESULTS = 1000  # Nearest images a semantic query ranks; pages end there
+
+# Bookkeeping files that live inside the library but are never listed or tagged
+INSTANCE_LOCK_FILENAME = '.visionvault.instance'  # Held by the one process serving the library
+METADATA_FILENAMES = {'.tags.txt', SEARCH_INDEX_FILENAME, SCAN_MANIFEST_FILENAME, CONTENT_HASHES_FILENAME,
+                      EMBEDDINGS_FILENAME, EMBEDDING_ROWS_FILENAME, INSTANCE_LOCK_FILENAME}
+
+# How bookkeeping files are hidden: "auto" (the hidden attribute on Windows, dot-prefixed names elsewhere),
+# "windows", "dotfile" or "sidecar" (kept in a dot-prefixed directory inside each folder)
+HIDDEN_FILES_MODE = os.environ.get('VISIONVAULT_HIDDEN_FILES', 'auto')
+METADATA_SIDECAR_DIRNAME = '.visionvault'
+
+# Bookkeeping files are replaced atomically via a temp file, and read-modify-write cycles hold a lock file
+METADATA_TEMP_SUFFIX = '.tmp'
+METADATA_LOCK_SUFFIX = '.lock'
+# .tags.txt records are filename:format:tags:description lines. Files starting with TAGS_FILE_HEADER escape
+# backslashes, colons and line breaks in every field; files without it are read in the original unescaped format
+TAGS_FILE_HEADER = "#visionvault-tags v2"
+TAGS_FILE_ESCAPES = str.maketrans({"\\": "\\\\", ":": "\\c", "\n": "\\n", "\r": "\\r"})
+TAGS_FILE_UNESCAPE_PATTERN = re.compile(r'\\(.)')
+TAGS_FILE_UNESCAPES = {"c": ":", "n": "\n", "r": "\r"}
+
+# Catalog export and import: JSON Lines, or Parquet with pyarrow installed
+CATALOG_FORMATS = {"jsonl": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+CATALOG_BATCH_SIZE = 10000  # Records per store query, Parquet row group and import batch
+CATALOG_SPOOL_SIZE = 64 * 1024 * 1024  # Uploaded Parquet catalogs larger than this are spooled to disk
+CATALOG_TIMESTAMP_NANOSECONDS = {"s": 10 ** 9, "ms": 10 ** 6, "us": 10 ** 3, "ns": 1}  # Per Parquet time unit
+
+# Changes to the root .tags.txt are buffered and written once no new change arrived for ROOT_TAGS_WRITE_DELAY
+# seconds, or ROOT_TAGS_WRITE_MAX_DELAY seconds after the first buffered change at the latest
+ROOT_TAGS_WRITE_DELAY = 0.5
+ROOT_TAGS_WRITE_MAX_DELAY = 5
+
+
+class HiddenFiles:
+    """Keeps VisionVault's bookkeeping files out of sight and recognises files and folders the user has hidden.
+
+    hide() is called once, when a bookkeeping file is created, and is_hidden() works from os.scandir entries, so
+    reading or rewriting metadata never touches attributes and listing a folder costs no extra syscalls. This
+    base class is the POSIX convention: bookkeeping files are dot-prefixed already, and so are hidden files.
+    """
+
+    name = "dotfile"
+
+    def metadata_path(self, folder, filename):
+        """Return where the bookkeeping file filename of folder lives."""
+        return os.path.join(folder, filename)
+
+    def hide(self, path):
+        pass
+
+    def is_hidden(self, entry):
+        return entry.name.startswith('.')
+
+
+class WindowsHiddenFiles(HiddenFiles):
+    """The Windows hidden attribute, set once on creation and read from the attributes os.scandir returned."""
+
+    name = "windows"
+
+    def hide(self, path):
+        if win32file is None:
+            logger.warning(f"pywin32 is not installed; {path} is left visible")
+            return
+        try:
+            attrs = win32file.GetFileAttributes(path)
+            win32file.SetFileAttributes(path, attrs | win32con.FILE_ATTRIBUTE_HIDDEN)
+        except Exception as e:
+            logger.error(f"Error hiding {path}: {e}")
+
+    def is_hidden(self, entry):
+        # On Windows a DirEntry's lstat comes from the directory listing itself
+        attrs = getattr(entry.stat(follow_symlinks=False), "st_file_attributes", 0)
+        return bool(attrs & stat.FILE_ATTRIBUTE_HIDDEN)
+
+
+class SidecarHiddenFiles(HiddenFiles):
+    """Bookkeeping files live in a dot-prefixed sidecar directory per folder instead of beside the media."""
+
+    name = "sidecar"
+
+    def metadata_path(self, folder, filename):
+        return os.path.join(folder, METADATA_SIDECAR_DIRNAME, filename)
+
+
+HIDDEN_FILES_BACKENDS = {"dotfile": HiddenFiles, "windows": WindowsHiddenFiles, "sidecar": SidecarHiddenFiles}
+hidden_files = HIDDEN_FILES_BACKENDS[
+    ("windows" if os.name == "nt" else "dotfile") if HIDDEN_FILES_MODE == "auto" else HIDDEN_FILES_MODE]()
+
+
+def metadata_path(folder, filename):
+    """Return the path of a bookkeeping file (.tags.txt, the databases, the index...) belonging to folder."""
+    return hidden_files.metadata_path(folder, filename)
+
+
+def write_metadata_file(path, content):
+    """Atomically replace the contents of a bookkeeping file.
+
+    The content goes to a temp file in the same directory, which is fsynced, hidden and renamed over the target,
+    so a crash leaves either the old or the new file and never a truncated one. Hiding the temp file before the
+    rename means the file is hidden from creation and never needs unhiding to be rewritten.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.urandom(6).hex()}{METADATA_TEMP_SUFFIX}"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        hidden_files.hide(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+    if os.name != "nt":
+        # Make the rename itself durable
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class MetadataFileLocks:
+    """Per-file locks for read-modify-write cycles on bookkeeping files.
+
+    Each path gets a re-entrant in-process lock and, while the outermost holder has it, an advisory lock on a
+    companion lock file (flock on POSIX, msvcrt.locking on Windows), so the server's threads and other tools
+    touching the same files (such as the export-tags command) serialise their updates. The lock file is never
+    replaced, unlike the file it guards. This does not make several servers on one library safe; see
+    acquire_instance_lock().
+    """
+
+    def __init__(self):
+        self.locks = {}  # path -> threading.RLock
+        self.depth = {}  # path -> nesting depth of the thread holding its lock
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def locked(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            path_lock = self.locks.setdefault(path, threading.RLock())
+        with path_lock:
+            depth = self.depth.get(path, 0)
+            self.depth[path] = depth + 1
+            try:
+                lock_file = self.acquire_file_lock(path) if depth == 0 else None
+                try:
+                    yield
+                finally:
+                    if lock_file is not None:
+                        self.release_file_lock(lock_file)
+            finally:
+                self.depth[path] = depth
+
+    @staticmethod
+    def acquire_file_lock(path):
+        lock_path = path + METADATA_LOCK_SUFFIX
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        created = not os.path.exists(lock_path)
+        lock_file = open(lock_path, 'a+b')
+        try:
+            if created:
+                hidden_files.hide(lock_path)
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            elif msvcrt is not None:
+                lock_file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue  # LK_LOCK gives up after about ten seconds; keep waiting
+        except BaseException:
+            lock_file.close()
+            raise
+        return lock_file
+
+    @staticmethod
+    def release_file_lock(lock_file):
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            lock_file.close()
+
+
+metadata_locks = MetadataFileLocks()
+instance_lock_file = None
+
+
+def acquire_instance_lock():
+    """Claim ROOT_FOLDER for this process, failing if another VisionVault process already serves it.
+
+    Each process keeps its own search index, listing and folder tree caches and root .tags.txt write buffer,
+    which writes made by another process would leave stale, so a library must be served by a single process.
+    The lock is released when the process exits. Raises RuntimeError if the library is taken.
+    """
+    global instance_lock_file
+    if instance_lock_file is not None:
+        return
+    lock_path = metadata_path(ROOT_FOLDER, INSTANCE_LOCK_FILENAME)
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    created = not os.path.exists(lock_path)
+    lock_file = open(lock_path, 'a+b')
+    try:
+        if created:
+            hidden_files.hide(lock_path)
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock_file.seek(0)
+        owner = lock_file.read().decode('ascii', 'replace').strip() or "unknown"
+        lock_file.close()
+        raise RuntimeError(f"{ROOT_FOLDER} is already served by another VisionVault process (pid {owner}); "
+                           f"run a single process per library")
+    lock_file.truncate(0)
+    lock_file.write(str(os.getpid()).encode('ascii'))
+    lock_file.flush()
+    instance_lock_file = lock_file
+
+
+class Metrics:
+    """Counters and histograms for /metrics, in the Prometheus text exposition format.
+
+    Metrics are declared once with their label names, then updated from any thread with inc() and observe().
+    One lock guards all values, which costs little next to the file and network I/O being measured. Gauges
+    are callbacks read when /metrics is scraped.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}  # name -> {"type", "help", "labels", "buckets", "values": {label values: value}}
+        self.gauges = {}  # name -> (help, callback)
+
+    def counter(self, name, help_text, labels=()):
+        self.metrics[name] = {"type": "counter", "help": help_text, "labels": labels, "values": {}}
+
+    def histogram(self, name, help_text, labels=(), buckets=METRICS_LATENCY_BUCKETS):
+        self.metrics[name] = {"type": "histogram", "help": help_text, "labels": labels, "buckets": buckets,
+                              "values": {}}
+
+    def gauge(self, name, help_text, callback):
+        self.gauges[name] = (help_text, callback)
+
+    def inc(self, name, value=1, **labels):
+        metric = self.metrics[name]
+        key = tuple(str(labels[label]) for label in metric["labels"])
+        with self.lock:
+            metric["values"][key] = metric["values"].get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        metric = self.metrics[name]
+        key = tuple(str(labels[label]) for label in metric["labels"])
+        with self.lock:
+            counts = metric["values"].get(key)
+            if counts is None:
+                counts = metric["values"][key] = [0] * (len(metric["buckets"]) + 1) + [0.0]  # Buckets, +Inf, sum
+            counts[bisect.bisect_left(metric["buckets"], value)] += 1
+            counts[-1] += value
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the with block in a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def format_labels(names, values, extra=()):
+        pairs = [*zip(names, values), *extra]
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        """Return every metric in the Prometheus text format."""
+        lines = []
+        with self.lock:
+            snapshot = {name: dict(metric, values={key: (list(value) if isinstance(value, list) else value)
+                                                   for key, value in metric["values"].items()})
+                        for name, metric in self.metrics.items()}
+        for name, metric in snapshot.items():
+            lines += [f"# HELP {name} {metric['help']}", f"# TYPE {name} {metric['type']}"]
+            for key, value in sorted(metric["values"].items()):
+                if metric["type"] == "counter":
+                    lines.append(f"{name}{self.format_labels(metric['labels'], key)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip([*metric["buckets"], "+Inf"], value[:-1]):
+                    cumulative += count
+                    labels = self.format_labels(metric["labels"], key, [("le", bound)])
+                    lines.append(f"{name}_bucket{labels} {cumulative}")
+                lines.append(f"{name}_sum{self.format_labels(metric['labels'], key)} {value[-1]:.6f}")
+                lines.append(f"{name}_count{self.format_labels(metric['labels'], key)} {cumulative}")
+        for name, (help_text, callback) in self.gauges.items():
+            try:
+                value = callback()
+            except Exception as e:
+                logger.debug(f"Skipping gauge {name}: {e}")
+                continue
+            if value is not None:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.counter("visionvault_http_requests_total", "HTTP requests by endpoint, method and status.",
+                ("endpoint", "method", "status"))
+metrics.histogram("visionvault_http_request_duration_seconds",
+                  "Time to produce a response, by endpoint (streamed file bodies are sent afterwards).", ("endpoint",))
+metrics.counter("visionvault_http_response_bytes_total",
+                "Response body bytes by endpoint (files handed off with X-Accel-Redirect count as 0).", ("endpoint",))
+metrics.histogram("visionvault_tags_file_seconds", "Reads and writes of .tags.txt files.", ("operation",))
+metrics.histogram("visionvault_directory_scan_seconds",
+                  "os.scandir passes over library folders: file listings and folder tree levels.", ("kind",))
+metrics.histogram("visionvault_image_tagging_seconds",
+                  "Vision model calls from process_image() and the tagging workers, by result.", ("result",),
+                  buckets=METRICS_TAGGING_BUCKETS)
+metrics.gauge("visionvault_search_index_records", "Records in the search index.",
+              lambda: len(search_index.records) if search_index.loaded else None)
+metrics.gauge("visionvault_thumbnail_cache_bytes", "Size of the thumbnail cache.", lambda: thumbnail_cache.total_bytes)
+metrics.gauge("visionvault_watcher_queue_depth", "Filesystem events waiting to be applied.",
+              lambda: watcher.events.qsize() if watcher is not None else None)
+metrics.gauge("visionvault_tagging_queue_depth", "Images waiting for AI tagging.",
+              lambda: tagging_worker.queue.counts().get("pending", 0) if tagging_worker is not None else None)
+metrics.gauge("visionvault_embedded_images", "Images in the semantic search index.",
+              lambda: len(embedding_worker.index) if embedding_worker is not None else None)
+
+
+def prepare_image_payload(file_path):
+    """Return (bytes, MIME type) of an image prepared for the vision model.
+
+    The image is decoded once, downscaled so its longest edge is at most TAGGING_MAX_EDGE, and re-encoded as
+    TAGGING_IMAGE_FORMAT, which also drops EXIF and other metadata. A cached thumbnail at least that large is
+    used instead of the original when one exists, and sent as-is when it is exactly the target size. An original
+    in one of TAGGING_ORIGINAL_FORMATS that is already within the size limit and has no EXIF data is sent
+    unchanged when it is smaller than its re-encoded version. Without Pillow, or for files it cannot decode, the
+    original bytes are sent with their real MIME type.
+    """
+    if Image is not None:
+        source_path = file_path
+        try:
+            rel_path = to_rel_path(os.path.relpath(file_path, ROOT_FOLDER))
+            file_stat = os.stat(file_path)
+            for size in sorted(size for size in THUMBNAIL_SIZES if size >= TAGGING_MAX_EDGE):
+                thumb_path = thumbnail_cache_path(rel_path, file_stat, size)
+                if os.path.exists(thumb_path):
+                    if size == TAGGING_MAX_EDGE:
+                        with open(thumb_path, 'rb') as f:
+                            return f.read(), f"image/{THUMBNAIL_FORMAT}"
+                    source_path = thumb_path
+                    break
+        except (OSError, ValueError):
+            pass
+        try:
+            with Image.open(source_path) as img:
+                original_mime_type = Image.MIME.get(img.format)
+                original_fits = (source_path == file_path and img.format in TAGGING_ORIGINAL_FORMATS
+                                 and max(img.size) <= TAGGING_MAX_EDGE and not img.getexif())
+                img.draft('RGB', (TAGGING_MAX_EDGE, TAGGING_MAX_EDGE))
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail((TAGGING_MAX_EDGE, TAGGING_MAX_EDGE))
+                if img.mode not in ('RGB', 'L') and TAGGING_IMAGE_FORMAT == 'jpeg':
+                    img = img.convert('RGB')
+                buffer = io.BytesIO()
+                img.save(buffer, TAGGING_IMAGE_FORMAT.upper(), quality=TAGGING_IMAGE_QUALITY)
+            if original_fits and os.path.getsize(file_path) <= buffer.tell():
+                with open(file_path, 'rb') as f:
+                    return f.read(), original_mime_type
+            return buffer.getvalue(), f"image/{TAGGING_IMAGE_FORMAT}"
+        except Exception as e:
+            logger.warning(f"Could not re-encode {file_path} for tagging, sending the original: {e}")
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    return data, mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+
+
+class TaggingReplyError(ValueError):
+    """The vision model answered, but without anything usable as tags; tokens is what the reply cost."""
+
+    def __init__(self, message, tokens=0):
+        super().__init__(message)
+        self.tokens = tokens
+
+
+def tag_image(file_path):
+    """Ask the vision model for tags and a description of an image.
+
+    Returns (tags, description, tokens used). Raises on API errors and on replies without usable tags (as
+    TaggingReplyError), so callers can retry and eventually give up instead of storing a placeholder.
+    """
+    start = time.perf_counter()
+    result = "error"
+    try:
+        image_bytes, mime_type = prepare_image_payload(file_path)
+        encoded_image = base64.b64encode(image_bytes).decode('utf-8')
+        response = litellm.completion(
+            model=TAGGING_MODEL,
+            api_base=TAGGING_API_BASE,
+            api_key=TAGGING_API_KEY,
+            timeout=TAGGING_TIMEOUT,
+            max_retries=0,  # Retries and backoff are handled by TaggingWorker
+            messages=[{"role": "user", "content": [
+                {"type": "text",
+                 "text": "Describe this image and provide 3-5 general descriptive tags (e.g., cat, beach, sunset)."},
+                {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{encoded_image}"}}
+            ]}]
+        )
+        usage = getattr(response, "usage", None)
+        tokens = getattr(usage, "total_tokens", None) or TAGGING_TOKENS_PER_IMAGE
+        content = response.choices[0].message.content or ""
+        description = " ".join(content.split())  # One line
+        tags = [tag.strip().splitlines()[0].lower() for tag in content.split(',')[:5] if tag.strip()]
+        if not tags:
+            raise TaggingReplyError(f"No tags in the model reply {content[:100]!r}", tokens)
+        result = "success"
+        return tags, description, tokens
+    finally:
+        metrics.observe("visionvault_image_tagging_seconds", time.perf_counter() - start, result=result)
+
+
+def process_image(file_path):
+    """Process an image with Grok API and return general descriptive tags and description."""
+    try:
+        tags, description, _ = tag_image(file_path)
+        return tags, description
+    except Exception as e:
+        logger.error(f"Error processing image {file_path}: {e}")
+        return ["Pending tags"], "Error processing image"
+
+
+def unescape_tags_field(value):
+    if "\\" not in value:
+        return value
+    return TAGS_FILE_UNESCAPE_PATTERN.sub(lambda match: TAGS_FILE_UNESCAPES.get(match.group(1), match.group(1)), value)
+
+
+def read_tags_file(tags_file):
+    """Read tags from a .tags.txt file and return a dictionary."""
+    tags_data = {}
+    if os.path.exists(tags_file):
+        try:
+            with metrics.timer("visionvault_tags_file_seconds", operation="read"), \
+                    open(tags_file, 'r', encoding='utf-8') as f:
+                escaped = f.readline().rstrip("\n") == TAGS_FILE_HEADER
+                if not escaped:
+                    f.seek(0)
+                for line in f:
+                    if escaped:
+                        parts = [unescape_tags_field(part) for part in line.rstrip("\n").split(':', 3)]
+                    elif ':' in line:
+                        parts = line.strip().split(':', 3)
+                    else:
+                        continue
+                    if len(parts) == 4:
+                        filename, file_format, tags, desc = parts
+                        tags_data[filename] = {"format": file_format, "tags": tags, "description": desc}
+            logger.debug(f"Successfully read and closed {tags_file}")
+        except PermissionError as e:
+            logger.error(f"Permission denied reading {tags_file}: {e}")
+        except Exception as e:
+            logger.error(f"Error reading tags for {tags_file}: {e}")
+    return tags_data
+
+
+def write_tags_file(tags_file, tags_data):
+    """Write tags to a .tags.txt file, escaping colons and line breaks in the fields."""
+    try:
+        with metrics.timer("visionvault_tags_file_seconds", operation="write"):
+            write_metadata_file(tags_file, TAGS_FILE_HEADER + "\n" + "".join(
+                ":".join(str(field).translate(TAGS_FILE_ESCAPES)
+                         for field in (filename, data['format'], data['tags'], data['description'])) + "\n"
+                for filename, data in tags_data.items()))
+        logger.debug(f"Successfully wrote and closed {tags_file}")
+    except PermissionError as e:
+        logger.error(f"Permission denied writing to {tags_file}: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"Error writing tags for {tags_file}: {e}")
+        raise
+
+
+def split_tags(tags):
+    """Split a comma-separated tags string into lowercased, stripped tags."""
+    return [tag.strip().lower() for tag in (tags or "").split(",") if tag.strip()]
+
+
+def parse_search_date(value):
+    """Parse YYYY, YYYY-MM or YYYY-MM-DD (local time) into a timestamp; raises ValueError otherwise."""
+    for date_format in ("%Y-%m-%d", "%Y-%m", "%Y"):
+        try:
+            return datetime.strptime(value, date_format).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date '{value}': use YYYY, YYYY-MM or YYYY-MM-DD.")
+
+
+def parse_search_query(query):
+    """Parse a search query into a plan: a list of (field, value, negated) clauses.
+
+    Supported: tag:cat, format:image, in:trips/, after:2023-01-01, before:2024, "exact phrase" and plain words,
+    each negatable with "-" (e.g. -tag:blurry). field is one of SEARCH_FILTER_FIELDS, "phrase" or "text";
+    dates become timestamps. Unknown fields are kept as plain text. Raises ValueError for invalid dates.
+    """
+    clauses = []
+    for match in SEARCH_QUERY_PATTERN.finditer(query):
+        negated, field, quoted, bare = match.groups()
+        negated = bool(negated)
+        field = field.lower() if field else None
+        value = quoted if quoted is not None else bare
+        if field in ("after", "before"):
+            clauses.append((field, parse_search_date(value), negated))
+        elif field == "in":
+            clauses.append((field, to_rel_path(value).lower(), negated))
+        elif field in SEARCH_FILTER_FIELDS:
+            clauses.append((field, value.strip().lower(), negated))
+        elif field is None and quoted is not None:
+            clauses.append(("phrase", quoted.lower(), negated))
+        else:
+            text = match.group(0)[1:] if negated else match.group(0)
+            # Text without word characters (e.g. "-") can only be matched as a substring
+            clauses.append(("text" if SearchIndex.tokenize(text) else "phrase", text.lower(), negated))
+    return clauses
+
+
+class SearchIndex:
+    """In-memory inverted index over path tokens, tags and description words of the root .tags.txt records.
+
+    Secondary indexes map each tag and format to its paths and keep the paths sorted (case-insensitively) for
+    folder prefix lookups, so field filters in a query never scan the records. Each record also keeps the file's
+    mtime from when it was indexed, so date filters never touch the disk.
+    """
+
+    TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.records = {}  # full path -> {"format", "tags", "description", "mtime"}
+        self.postings = {}  # token -> {full path: field weight}
+        self.vocabulary = []  # sorted list of tokens, for prefix lookups
+        self.tag_index = {}  # lowercased tag -> set of full paths
+        self.format_index = {}  # format -> set of full paths
+        self.sorted_paths = []  # sorted (lowercased path, full path) pairs, for folder lookups
+        self.loaded = False
+        self.dirty = False
+        self.save_lock = threading.Lock()  # Keeps a slower, older snapshot from replacing a newer one
+
+    @classmethod
+    def tokenize(cls, text):
+        return cls.TOKEN_PATTERN.findall(text.lower()) if text else []
+
+    def _entry_tokens(self, full_path, entry):
+        """Return {token: weight} for a record, keeping the strongest field weight per token."""
+        weights = {}
+        fields = (("path", full_path), ("tags", entry.get("tags", "")), ("description", entry.get("description", "")))
+        for field, text in fields:
+            for token in self.tokenize(text):
+                weights[token] = max(weights.get(token, 0), SEARCH_FIELD_WEIGHTS[field])
+        return weights
+
+    def _add(self, full_path, entry):
+        self.records[full_path] = entry
+        for token, weight in self._entry_tokens(full_path, entry).items():
+            paths = self.postings.get(token)
+            if paths is None:
+                paths = self.postings[token] = {}
+                bisect.insort(self.vocabulary, token)
+            paths[full_path] = weight
+        self._add_fields(full_path, entry)
+        bisect.insort(self.sorted_paths, (full_path.lower(), full_path))
+
+    def _add_fields(self, full_path, entry):
+        for tag in split_tags(entry.get("tags")):
+            self.tag_index.setdefault(tag, set()).add(full_path)
+        self.format_index.setdefault(entry.get("format", ""), set()).add(full_path)
+
+    def _remove(self, full_path):
+        entry = self.records.pop(full_path, None)
+        if entry is None:
+            return
+        for index, keys in ((self.tag_index, split_tags(entry.get("tags"))),
+                            (self.format_index, [entry.get("format", "")])):
+            for key in keys:
+                paths = index.get(key)
+                if paths is not None:
+                    paths.discard(full_path)
+                    if not paths:
+                        del index[key]
+        i = bisect.bisect_left(self.sorted_paths, (full_path.lower(), full_path))
+        if i < len(self.sorted_paths) and self.sorted_paths[i][1] == full_path:
+            del self.sorted_paths[i]
+        for token in self._entry_tokens(full_path, entry):
+            paths = self.postings.get(token)
+            if paths is None:
+                continue
+            paths.pop(full_path, None)
+            if not paths:
+                del self.postings[token]
+                i = bisect.bisect_left(self.vocabulary, token)
+                if i < len(self.vocabulary) and self.vocabulary[i] == token:
+                    del self.vocabulary[i]
+
+    @staticmethod
+    def file_mtime(full_path):
+        try:
+            return os.stat(os.path.join(ROOT_FOLDER, full_path)).st_mtime
+        except OSError:
+            return 0
+
+    def update(self, full_path, entry):
+        """Add or replace a single record."""
+        record = {**entry, "mtime": self.file_mtime(full_path)} if entry is not None else None
+        with self.lock:
+            self._remove(full_path)
+            if record is not None:
+                self._add(full_path, record)
+            self.dirty = True
+
+    def set_mtimes(self, mtimes):
+        """Record new file mtimes ({full path: seconds}) for files changed in place, which keep their entries."""
+        with self.lock:
+            for full_path, mtime in mtimes.items():
+                record = self.records.get(full_path)
+                if record is not None and record.get("mtime") != mtime:
+                    record["mtime"] = mtime
+                    self.dirty = True
+
+    def delete(self, full_path):
+        """Remove a single record."""
+        with self.lock:
+            if full_path in self.records:
+                self._remove(full_path)
+                self.dirty = True
+
+    def rebuild(self, all_tags):
+        """Replace the whole index with the given {full path: entry} mapping."""
+        records = {full_path: {**entry, "mtime": self.file_mtime(full_path)} for full_path, entry in all_tags.items()}
+        with self.lock:
+            self.records, self.postings, self.vocabulary = {}, {}, []
+            self.tag_index, self.format_index, self.sorted_paths = {}, {}, []
+            for full_path, record in records.items():
+                self._add(full_path, record)
+            self.loaded = True
+            self.dirty = True
+
+    def reconcile(self, all_tags):
+        """Bring a loaded index in line with the given {full path: entry} mapping, touching only what differs.
+
+        The saved file can lag the store: changes made within SEARCH_INDEX_SAVE_INTERVAL of a crash, or by
+        import-tags, never reach it, and the entry count alone doesn't reveal an edit.
+        """
+        with self.lock:
+            changed = 0
+            for full_path in [full_path for full_path in self.records if full_path not in all_tags]:
+                self._remove(full_path)
+                changed += 1
+            for full_path, entry in all_tags.items():
+                record = self.records.get(full_path)
+                if record is None or any(record.get(key) != value for key, value in entry.items()):
+                    self._remove(full_path)
+                    self._add(full_path, {**entry, "mtime": self.file_mtime(full_path)})
+                    changed += 1
+            if changed:
+                self.dirty = True
+                logger.info(f"Updated {changed} search index entries that were out of date")
+            return changed
+
+    def _match_token(self, query_token):
+        """Return {full path: score} for records containing a token that equals, starts with or contains query_token."""
+        scores = {}
+        start = bisect.bisect_left(self.vocabulary, query_token)
+        prefixed = set()
+        for token in self.vocabulary[start:]:
+            if not token.startswith(query_token):
+                break
+            prefixed.add(token)
+            factor = 3 if token == query_token else 2
+            for path, weight in self.postings[token].items():
+                scores[path] = max(scores.get(path, 0), factor * weight)
+        for token in self.vocabulary:
+            if token not in prefixed and query_token in token:
+                for path, weight in self.postings[token].items():
+                    scores[path] = max(scores.get(path, 0), weight)
+        return scores
+
+    def _filter_paths(self, field, value):
+        """Return the set of paths matching a tag, format or folder filter, from the secondary indexes."""
+        if field == "tag":
+            return set(self.tag_index.get(value, ()))
+        if field == "format":
+            return set(self.format_index.get(value, ()))
+        if not value:
+            return set(self.records)
+        prefix = value + "/"
+        start = bisect.bisect_left(self.sorted_paths, (prefix,))
+        end = bisect.bisect_left(self.sorted_paths, (value + "0",))  # "0" sorts right after "/"
+        return {full_path for _, full_path in self.sorted_paths[start:end]}
+
+    def search(self, query, limit=SEARCH_DEFAULT_LIMIT, offset=0):
+        """Run a query (see parse_search_query) and return (total, [(full path, entry), ...], facets).
+
+        Tag, format and folder filters are set operations on the secondary indexes and words use the token
+        postings; only quoted phrases and date filters check the remaining candidates one by one. Results rank
+        by word match quality, then path. facets counts the top tags and all formats across every match.
+        """
+        clauses = parse_search_query(query)
+        with self.lock:
+            candidates = None  # None stands for every record
+            excluded = set()
+            scores = None
+            for field, value, negated in clauses:
+                if field in ("tag", "format", "in"):
+                    paths = self._filter_paths(field, value)
+                    if negated:
+                        excluded |= paths
+                    else:
+                        candidates = paths if candidates is None else candidates & paths
+            for field, value, negated in clauses:
+                if field != "text":
+                    continue
+                for query_token in dict.fromkeys(self.tokenize(value)):
+                    if negated:
+                        excluded.update(self._match_token(query_token))  # Exactly what the word would match
+                        continue
+                    matches = self._match_token(query_token)
+                    if scores is None:
+                        scores = matches
+                    else:
+                        scores = {path: score + matches[path] for path, score in scores.items() if path in matches}
+            if scores is not None:
+                candidates = set(scores) if candidates is None else candidates & set(scores)
+            paths = (set(self.records) if candidates is None else candidates) - excluded
+
+            # Phrases and dates are checked per remaining record
+            for field, value, negated in clauses:
+                if field == "phrase":
+                    paths = {path for path in paths
+                             if (value in path.lower() or value in self.records[path]["tags"].lower()
+                                 or value in self.records[path]["description"].lower()) != negated}
+                elif field in ("after", "before"):
+                    on_or_after = (field == "after") != negated
+                    paths = {path for path in paths if (self.records[path]["mtime"] >= value) == on_or_after}
+
+            scores = scores or {}
+            ranked = sorted(paths, key=lambda path: (-scores.get(path, 0), path))
+            tag_counts = collections.Counter(tag for path in ranked for tag in split_tags(self.records[path]["tags"]))
+            format_counts = collections.Counter(self.records[path]["format"] for path in ranked)
+            facets = {"tags": [{"value": tag, "count": count}
+                               for tag, count in tag_counts.most_common(SEARCH_FACET_LIMIT)],
+                      "formats": [{"value": file_format, "count": count}
+                                  for file_format, count in format_counts.most_common()]}
+            page = ranked[offset:offset + limit]
+            return len(ranked), [(path, self.records[path]) for path in page], facets
+
+    def save(self, index_file):
+        """Persist the index (records and postings) to a hidden JSON file.
+
+        Only a shallow copy is taken under the lock; serializing and writing it doesn't hold up searches.
+        """
+        with self.save_lock:
+            with self.lock:
+                records = dict(self.records)
+                postings = {token: dict(token_postings) for token, token_postings in self.postings.items()}
+                self.dirty = False
+            paths = sorted(records)
+            ids = {path: i for i, path in enumerate(paths)}
+            payload = {
+                "version": 2,
+                "paths": paths,
+                "records": [records[path] for path in paths],
+                "postings": {token: [[ids[path], weight] for path, weight in token_postings.items()]
+                             for token, token_postings in postings.items()}
+            }
+            try:
+                write_metadata_file(index_file, json.dumps(payload, separators=(',', ':')))
+                logger.info(f"Saved search index with {len(paths)} entries to {index_file}")
+            except Exception as e:
+                self.dirty = True
+                logger.error(f"Error saving search index to {index_file}: {e}")
+
+    def load(self, index_file):
+        """Load a persisted index. Returns False if it is missing or unreadable."""
+        if not os.path.exists(index_file):
+            return False
+        try:
+            with open(index_file, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+            if payload.get("version") != 2:
+                return False
+            paths = payload["paths"]
+            with self.lock:
+                self.records = dict(zip(paths, payload["records"]))
+                self.postings = {token: {paths[i]: weight for i, weight in postings}
+                                 for token, postings in payload["postings"].items()}
+                self.vocabulary = sorted(self.postings)
+                self.tag_index, self.format_index = {}, {}
+                for full_path, entry in self.records.items():
+                    self._add_fields(full_path, entry)
+                self.sorted_paths = sorted((full_path.lower(), full_path) for full_path in self.records)
+                self.loaded = True
+                self.dirty = False
+            logger.info(f"Loaded search index with {len(paths)} entries from {index_file}")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading search index from {index_file}: {e}")
+            return False
+
+
+search_index = SearchIndex()
+
+
+def get_search_index():
+    """Return the search index, loading it from disk or building it from the metadata store on first use.
+
+    A loaded index is only a starting point: it is reconciled against the store before it is used.
+    """
+    with search_index.lock:
+        if not search_index.loaded:
+            all_tags = get_metadata_store().get_all()
+            if search_index.load(metadata_path(ROOT_FOLDER, SEARCH_INDEX_FILENAME)):
+                search_index.reconcile(all_tags)
+            else:
+                search_index.rebuild(all_tags)
+    return search_index
+
+
+search_index_saver = None
+search_index_saver_lock = threading.Lock()
+
+
+def run_search_index_saver():
+    while True:
+        time.sleep(SEARCH_INDEX_SAVE_INTERVAL)
+        try:
+            if search_index.dirty:
+                search_index.save(metadata_path(ROOT_FOLDER, SEARCH_INDEX_FILENAME))
+        except Exception as e:
+            logger.error(f"Error in the search index saver: {e}")
+
+
+def save_search_index(force=False):
+    """Persist the search index if it changed.
+
+    Forced saves (end of a scan, shutdown) happen right away in the caller. Other changes are left to a
+    background thread that saves every SEARCH_INDEX_SAVE_INTERVAL seconds, so request threads never serialize
+    the index.
+    """
+    global search_index_saver
+    if force:
+        if search_index.dirty:
+            search_index.save(metadata_path(ROOT_FOLDER, SEARCH_INDEX_FILENAME))
+        return
+    with search_index_saver_lock:
+        if search_index_saver is None:
+            search_index_saver = threading.Thread(target=run_search_index_saver, name="search-index-saver",
+                                                  daemon=True)
+            search_index_saver.start()
+
+
+atexit.register(save_search_index, force=True)
+
+
+def get_file_type(filename):
+    """Return the format stored for a file: "image" for known image extensions, otherwise the bare extension."""
+    file_extension = os.path.splitext(filename)[1].lower() or "unknown"
+    return "image" if file_extension in ('.jpg', '.jpeg', '.png', '.webp') else file_extension[1:]
+
+
+def to_rel_path(*parts):
+    """Join path parts into a forward-slash path relative to ROOT_FOLDER ("" for the root itself)."""
+    parts = [part.replace("\\", "/").strip("/") for part in parts if part and part != "."]
+    return "/".join(part for part in parts if part)
+
+
+def is_metadata_file(filename):
+    """Return True for VisionVault's own bookkeeping files, which must never be listed or tagged.
+
+    This includes their companions: SQLite -wal/-shm files, lock files and temp files from atomic writes.
+    """
+    return filename.startswith((*METADATA_FILENAMES, METADATA_DB_FILENAME, TAGGING_QUEUE_FILENAME))
+
+
+def update_root_tags(root_tags_file, upserts=None, deletes=()):
+    """Apply a batch of full path entries to the root .tags.txt with a single locked read and write."""
+    with metadata_locks.locked(root_tags_file):
+        existing_tags = read_tags_file(root_tags_file)
+        root_tags = dict(existing_tags)
+        root_tags.update(upserts or {})
+        for full_path in deletes:
+            root_tags.pop(full_path, None)
+        if root_tags == existing_tags:
+            return
+        try:
+            write_tags_file(root_tags_file, root_tags)
+        except Exception as e:
+            logger.warning(f"Root .tags.txt out of sync: {e}. Sync will be corrected on restart with initialize_tags()")
+            raise
+
+
+class RootTagsWriter:
+    """Write-behind buffer for the root .tags.txt, the one file every metadata change touches.
+
+    Changes are merged in memory and written by a background thread with a single update_root_tags() call
+    once no new change has arrived for ROOT_TAGS_WRITE_DELAY seconds, so a burst of updates costs one rewrite
+    of the library-wide file instead of one per request. overlay() lets readers see buffered changes that are
+    not on disk yet; close() (also run at exit) writes whatever is still buffered.
+    """
+
+    def __init__(self, root_tags_file, delay=None, max_delay=None):
+        self.root_tags_file = root_tags_file
+        self.delay = ROOT_TAGS_WRITE_DELAY if delay is None else delay
+        self.max_delay = ROOT_TAGS_WRITE_MAX_DELAY if max_delay is None else max_delay
+        self.pending = {}  # full_path -> entry, or None for a delete
+        self.flushing = {}  # Changes being written right now
+        self.first_change = None
+        self.last_change = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def submit(self, upserts=None, deletes=()):
+        with self.lock:
+            self.pending.update(upserts or {})
+            for full_path in deletes:
+                self.pending[full_path] = None
+            now = time.time()
+            self.first_change = self.first_change or now
+            self.last_change = now
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="root-tags-writer", daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def overlay(self, entries):
+        """Apply buffered changes to {full_path: entry} read from the root file."""
+        with self.lock:
+            for changes in (self.flushing, self.pending):
+                for full_path, entry in changes.items():
+                    if entry is None:
+                        entries.pop(full_path, None)
+                    else:
+                        entries[full_path] = entry
+        return entries
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                self.flushing, self.pending = self.pending, {}
+                self.first_change = None
+                self.wakeup.clear()
+            if not self.flushing:
+                return
+            try:
+                update_root_tags(self.root_tags_file,
+                                 {full_path: entry for full_path, entry in self.flushing.items() if entry is not None},
+                                 [full_path for full_path, entry in self.flushing.items() if entry is None])
+            except Exception:
+                # Keep the changes buffered (newer ones win) for the next attempt
+                with self.lock:
+                    self.pending = {**self.flushing, **self.pending}
+                    self.first_change = self.first_change or time.time()
+                raise
+            finally:
+                with self.lock:
+                    self.flushing = {}
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            while True:
+                with self.lock:
+                    if self.first_change is None:
+                        break
+                    due = min(self.last_change + self.delay, self.first_change + self.max_delay)
+                remaining = due - time.time()
+                if remaining <= 0:
+                    break
+                time.sleep(remaining)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error writing buffered changes to {self.root_tags_file}: {e}")
+                time.sleep(self.max_delay)
+                self.wakeup.set()
+
+    def close(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error writing buffered changes to {self.root_tags_file}: {e}")
+
+
+class MetadataStore(abc.ABC):
+    """Storage backend for per-file metadata, keyed by forward-slash path relative to ROOT_FOLDER.
+
+    Entries are {"format", "tags", "description"} dictionaries, as parsed from .tags.txt records. Alongside
+    them the store keeps content hashes per file ({"size", "mtime", "hash", "phash"}) and a cache mapping a
+    content hash to the tags and description it was given, which survives renames, moves and deletions.
+    """
+
+    def get(self, rel_path):
+        """Return the entry for a single file, or None."""
+        folder, name = os.path.split(rel_path)
+        return self.get_folder(folder).get(name)
+
+    @abc.abstractmethod
+    def get_folder(self, folder_rel):
+        """Return {filename: entry} for the files directly inside a folder."""
+
+    @abc.abstractmethod
+    def get_all(self):
+        """Return {rel_path: entry} for the whole library."""
+
+    def count(self):
+        """Return the number of entries in the store."""
+        return len(self.get_all())
+
+    def get_subtree(self, folder_rel):
+        """Return {rel_path: entry} for every file at any depth under a folder."""
+        prefix = to_rel_path(folder_rel) + "/"
+        return {rel_path: entry for rel_path, entry in self.get_all().items() if rel_path.startswith(prefix)}
+
+    def iter_entries(self, batch_size=CATALOG_BATCH_SIZE):
+        """Yield lists of (rel_path, entry, hash record or None) in path order, batch_size entries at a time."""
+        all_tags = self.get_all()
+        rel_paths = sorted(all_tags)
+        for i in range(0, len(rel_paths), batch_size):
+            chunk = rel_paths[i:i + batch_size]
+            hashes = self.get_hashes(chunk)
+            yield [(rel_path, all_tags[rel_path], hashes.get(rel_path)) for rel_path in chunk]
+
+    @abc.abstractmethod
+    def apply(self, upserts=None, deletes=()):
+        """Insert/replace the given {rel_path: entry} mapping and remove the given paths as one batch."""
+
+    @abc.abstractmethod
+    def get_hashes(self, rel_paths=None):
+        """Return {rel_path: {"size", "mtime", "hash", "phash"}} for the given paths (default: all hashed files)."""
+
+    @abc.abstractmethod
+    def set_hashes(self, hashes):
+        """Store {rel_path: {"size", "mtime", "hash", "phash"}} for files that have an entry."""
+
+    @abc.abstractmethod
+    def find_by_hash(self, content_hashes):
+        """Return {hash: [rel_path, ...]} for files with any of the given content hashes."""
+
+    @abc.abstractmethod
+    def get_cached_tags(self, content_hashes):
+        """Return {hash: {"tags", "description"}} for hashes that have been tagged before."""
+
+    @abc.abstractmethod
+    def cache_tags(self, tagged):
+        """Remember {hash: {"tags", "description"}} for future copies of the same content."""
+
+    def replace_all(self, all_tags):
+        """Make the store hold exactly the given {rel_path: entry} mapping, writing only the differences."""
+        existing = self.get_all()
+        upserts = {rel_path: entry for rel_path, entry in all_tags.items() if existing.get(rel_path) != entry}
+        deletes = [rel_path for rel_path in existing if rel_path not in all_tags]
+        if upserts or deletes:
+            self.apply(upserts, deletes)
+
+    def close(self):
+        pass
+
+
+class TagsFileMetadataStore(MetadataStore):
+    """Metadata kept in the hidden per-folder .tags.txt files plus the aggregated root .tags.txt.
+
+    The root folder has no file of its own: its entries are the root .tags.txt records without a folder part.
+    Folders whose own file is missing fall back to their records in the root file.
+    """
+
+    def __init__(self, root_folder):
+        self.root_folder = root_folder
+        self.root_tags_file = metadata_path(root_folder, '.tags.txt')
+        self.root_writer = RootTagsWriter(self.root_tags_file)
+        atexit.register(self.root_writer.close)
+        self.hashes_file = metadata_path(root_folder, CONTENT_HASHES_FILENAME)
+        self.hashes_lock = threading.Lock()
+        self.hashes = None  # Content hashes and tag cache live in a hidden JSON sidecar, loaded lazily
+        self.hashes_stamp = None
+
+    def _hashes_stamp(self):
+        try:
+            file_stat = os.stat(self.hashes_file)
+            return file_stat.st_mtime_ns, file_stat.st_size
+        except OSError:
+            return None
+
+    def _load_hashes(self):
+        # Re-read the file whenever another process has replaced it since it was loaded
+        stamp = self._hashes_stamp()
+        if self.hashes is None or stamp != self.hashes_stamp:
+            self.hashes = {"files": {}, "tags": {}}
+            if stamp is not None:
+                try:
+                    with open(self.hashes_file, 'r', encoding='utf-8') as f:
+                        self.hashes = json.load(f)
+                except Exception as e:
+                    logger.error(f"Error reading {self.hashes_file}: {e}")
+            self.hashes_stamp = stamp
+        return self.hashes
+
+    def _save_hashes(self):
+        try:
+            write_metadata_file(self.hashes_file, json.dumps(self.hashes, separators=(',', ':')))
+            self.hashes_stamp = self._hashes_stamp()
+        except Exception as e:
+            logger.error(f"Error writing {self.hashes_file}: {e}")
+
+    def _read_root_tags(self):
+        return self.root_writer.overlay(read_tags_file(self.root_tags_file))
+
+    def get_hashes(self, rel_paths=None):
+        with self.hashes_lock:
+            files = self._load_hashes()["files"]
+            if rel_paths is None:
+                return dict(files)
+            return {rel_path: files[rel_path] for rel_path in rel_paths if rel_path in files}
+
+    def set_hashes(self, hashes):
+        with self.hashes_lock, metadata_locks.locked(self.hashes_file):
+            self._load_hashes()["files"].update(hashes)
+            self._save_hashes()
+
+    def find_by_hash(self, content_hashes):
+        content_hashes = set(content_hashes)
+        found = {}
+        for rel_path, record in self.get_hashes().items():
+            if record["hash"] in content_hashes:
+                found.setdefault(record["hash"], []).append(rel_path)
+        return found
+
+    def get_cached_tags(self, content_hashes):
+        with self.hashes_lock:
+            cache = self._load_hashes()["tags"]
+            return {content_hash: cache[content_hash] for content_hash in content_hashes if content_hash in cache}
+
+    def cache_tags(self, tagged):
+        with self.hashes_lock, metadata_locks.locked(self.hashes_file):
+            self._load_hashes()["tags"].update(tagged)
+            self._save_hashes()
+
+    def get_folder(self, folder_rel):
+        folder_rel = to_rel_path(folder_rel)
+        tags_file = metadata_path(os.path.join(self.root_folder, folder_rel), '.tags.txt')
+        if folder_rel and os.path.exists(tags_file):
+            return read_tags_file(tags_file)
+        return {os.path.basename(rel_path): entry for rel_path, entry in self._read_root_tags().items()
+                if os.path.dirname(rel_path) == folder_rel}
+
+    def get_all(self):
+        return self.root_writer.overlay(read_all_tags_files(self.root_folder))
+
+    def count(self):
+        return len(self._read_root_tags())
+
+    def apply(self, upserts=None, deletes=()):
+        upserts = upserts or {}
+        by_folder = {}
+        for rel_path, entry in upserts.items():
+            folder, name = os.path.split(rel_path)
+            by_folder.setdefault(folder, ({}, []))[0][name] = entry
+        for rel_path in deletes:
+            folder, name = os.path.split(rel_path)
+            by_folder.setdefault(folder, ({}, []))[1].append(name)
+        # One rewrite per affected folder file, then one rewrite of the root file
+        for folder, (folder_upserts, folder_deletes) in by_folder.items():
+            if not folder:
+                continue  # Root entries live in the root file
+            folder_path = os.path.join(self.root_folder, folder)
+            tags_file = metadata_path(folder_path, '.tags.txt')
+            if not os.path.isdir(folder_path):
+                continue
+            with metadata_locks.locked(tags_file):
+                existing_tags = self.get_folder(folder)
+                tags_data = dict(existing_tags)
+                tags_data.update(folder_upserts)
+                for name in folder_deletes:
+                    tags_data.pop(name, None)
+                if tags_data != existing_tags:
+                    write_tags_file(tags_file, tags_data)
+        if by_folder:
+            self.root_writer.submit(upserts, deletes)
+        if deletes:
+            with self.hashes_lock, metadata_locks.locked(self.hashes_file):
+                files = self._load_hashes()["files"]
+                if any(rel_path in files for rel_path in deletes):
+                    for rel_path in deletes:
+                        files.pop(rel_path, None)
+                    self._save_hashes()
+
+    def replace_all(self, all_tags):
+        by_folder = {}
+        for rel_path, entry in all_tags.items():
+            folder, name = os.path.split(rel_path)
+            by_folder.setdefault(folder, {})[name] = entry
+        for folder, tags_data in by_folder.items():
+            if not folder:
+                continue  # Root entries live in the root file
+            tags_file = metadata_path(os.path.join(self.root_folder, folder), '.tags.txt')
+            with metadata_locks.locked(tags_file):
+                if read_tags_file(tags_file) != tags_data:
+                    write_tags_file(tags_file, tags_data)
+        self.root_writer.flush()
+        with metadata_locks.locked(self.root_tags_file):
+            if read_tags_file(self.root_tags_file) != all_tags:
+                write_tags_file(self.root_tags_file, all_tags)
+
+    def close(self):
+        self.root_writer.close()
+
+
+class SqliteMetadataStore(MetadataStore):
+    """Metadata kept in an embedded SQLite database (WAL mode) in ROOT_FOLDER."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            folder TEXT NOT NULL,
+            name TEXT NOT NULL,
+            format TEXT NOT NULL,
+            tags TEXT NOT NULL,
+            description TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+        CREATE TABLE IF NOT EXISTS tag_cache (
+            hash TEXT PRIMARY KEY,
+            tags TEXT NOT NULL,
+            description TEXT NOT NULL
+        );
+    """
+    # Columns added after the first release, created on databases that predate them
+    MIGRATIONS = {
+        "size": "ALTER TABLE files ADD COLUMN size INTEGER",
+        "mtime": "ALTER TABLE files ADD COLUMN mtime INTEGER",
+        "hash": "ALTER TABLE files ADD COLUMN hash TEXT",
+        "phash": "ALTER TABLE files ADD COLUMN phash TEXT",
+    }
+
+    def __init__(self, root_folder):
+        self.root_folder = root_folder
+        self.db_file = metadata_path(root_folder, METADATA_DB_FILENAME)
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        self.local = threading.local()
+        is_new = not os.path.exists(self.db_file)
+        with self.connection() as conn:
+            conn.executescript(self.SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(files)")}
+            for column, statement in self.MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+            conn.execute("CREATE INDEX IF NOT EXISTS files_hash ON files (hash)")
+        if is_new:
+            hidden_files.hide(self.db_file)
+            import_tags_files(self, root_folder)
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    @staticmethod
+    def _entry(row):
+        return {"format": row[0], "tags": row[1], "description": row[2]}
+
+    def get(self, rel_path):
+        row = self.connection().execute(
+            "SELECT format, tags, description FROM files WHERE path = ?", (rel_path,)).fetchone()
+        return self._entry(row) if row else None
+
+    def get_folder(self, folder_rel):
+        rows = self.connection().execute(
+            "SELECT name, format, tags, description FROM files WHERE folder = ?", (to_rel_path(folder_rel),))
+        return {row[0]: self._entry(row[1:]) for row in rows}
+
+    def get_all(self):
+        rows = self.connection().execute("SELECT path, format, tags, description FROM files")
+        return {row[0]: self._entry(row[1:]) for row in rows}
+
+    def count(self):
+        return self.connection().execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def get_subtree(self, folder_rel):
+        prefix = to_rel_path(folder_rel).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "/"
+        rows = self.connection().execute(
+            "SELECT path, format, tags, description FROM files WHERE path LIKE ? ESCAPE '\\'", (prefix + "%",))
+        return {row[0]: self._entry(row[1:]) for row in rows}
+
+    def iter_entries(self, batch_size=CATALOG_BATCH_SIZE):
+        # Keyset pages rather than one open cursor, so the generator can be resumed from any thread
+        last_path = ""
+        while True:
+            rows = self.connection().execute(
+                "SELECT path, format, tags, description, size, mtime, hash, phash FROM files WHERE path > ? "
+                "ORDER BY path LIMIT ?", (last_path, batch_size)).fetchall()
+            if not rows:
+                return
+            yield [(row[0], self._entry(row[1:4]),
+                    {"size": row[4], "mtime": row[5], "hash": row[6], "phash": row[7]} if row[6] else None)
+                   for row in rows]
+            last_path = rows[-1][0]
+
+    def apply(self, upserts=None, deletes=()):
+        rows = []
+        for rel_path, entry in (upserts or {}).items():
+            folder, name = os.path.split(rel_path)
+            rows.append((rel_path, folder, name, entry["format"], entry["tags"], entry["description"]))
+        with self.connection() as conn:  # One transaction for the whole batch
+            if deletes:
+                conn.executemany("DELETE FROM files WHERE path = ?", [(rel_path,) for rel_path in deletes])
+            if rows:
+                # Upsert rather than replace, so hash columns survive tag edits
+                conn.executemany(
+                    "INSERT INTO files (path, folder, name, format, tags, description) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (path) DO UPDATE SET format = excluded.format, tags = excluded.tags, "
+                    "description = excluded.description", rows)
+
+    def get_hashes(self, rel_paths=None):
+        query = "SELECT path, size, mtime, hash, phash FROM files WHERE hash IS NOT NULL"
+        if rel_paths is None:
+            rows = self.connection().execute(query).fetchall()
+        else:
+            rel_paths = list(rel_paths)
+            rows = []
+            for i in range(0, len(rel_paths), SQLITE_MAX_PARAMS):
+                chunk = rel_paths[i:i + SQLITE_MAX_PARAMS]
+                rows.extend(self.connection().execute(
+                    f"{query} AND path IN ({','.join('?' * len(chunk))})", chunk).fetchall())
+        return {row[0]: {"size": row[1], "mtime": row[2], "hash": row[3], "phash": row[4]} for row in rows}
+
+    def set_hashes(self, hashes):
+        with self.connection() as conn:
+            conn.executemany("UPDATE files SET size = ?, mtime = ?, hash = ?, phash = ? WHERE path = ?",
+                             [(record["size"], record["mtime"], record["hash"], record["phash"], rel_path)
+                              for rel_path, record in hashes.items()])
+
+    def find_by_hash(self, content_hashes):
+        content_hashes = list(content_hashes)
+        found = {}
+        for i in range(0, len(content_hashes), SQLITE_MAX_PARAMS):
+            chunk = content_hashes[i:i + SQLITE_MAX_PARAMS]
+            rows = self.connection().execute(
+                f"SELECT hash, path FROM files WHERE hash IN ({','.join('?' * len(chunk))})", chunk)
+            for content_hash, rel_path in rows:
+                found.setdefault(content_hash, []).append(rel_path)
+        return found
+
+    def get_cached_tags(self, content_hashes):
+        content_hashes = list(content_hashes)
+        cached = {}
+        for i in range(0, len(content_hashes), SQLITE_MAX_PARAMS):
+            chunk = content_hashes[i:i + SQLITE_MAX_PARAMS]
+            rows = self.connection().execute(
+                f"SELECT hash, tags, description FROM tag_cache WHERE hash IN ({','.join('?' * len(chunk))})", chunk)
+            cached.update({row[0]: {"tags": row[1], "description": row[2]} for row in rows})
+        return cached
+
+    def cache_tags(self, tagged):
+        with self.connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO tag_cache (hash, tags, description) VALUES (?, ?, ?)",
+                             [(content_hash, record["tags"], record["description"])
+                              for content_hash, record in tagged.items()])
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+
+METADATA_BACKENDS = {"sqlite": SqliteMetadataStore, "tagsfile": TagsFileMetadataStore}
+metadata_store = None
+metadata_store_lock = threading.Lock()
+
+
+def get_metadata_store():
+    """Return the configured metadata store for ROOT_FOLDER, creating it on first use."""
+    global metadata_store
+    with metadata_store_lock:
+        if metadata_store is None or metadata_store.root_folder != ROOT_FOLDER:
+            if metadata_store is not None:
+                metadata_store.close()
+            metadata_store = METADATA_BACKENDS[METADATA_BACKEND](ROOT_FOLDER)
+    return metadata_store
+
+
+def apply_metadata_changes(upserts=None, deletes=()):
+    """Write a batch of metadata changes to the store and mirror them into the search index and tag cache."""
+    store = get_metadata_store()
+    store.apply(upserts, deletes)
+    listing_cache.invalidate({os.path.dirname(rel_path) for rel_path in [*(upserts or {}), *deletes]})
+    tagged = {rel_path: entry for rel_path, entry in (upserts or {}).items() if entry["tags"] not in PLACEHOLDER_TAGS}
+    if tagged and CONTENT_HASHING:
+        store.cache_tags({record["hash"]: {"tags": tagged[rel_path]["tags"],
+                                           "description": tagged[rel_path]["description"]}
+                          for rel_path, record in store.get_hashes(tagged).items()})
+    index = get_search_index()
+    for rel_path in deletes:
+        index.delete(rel_path)
+    for rel_path, entry in (upserts or {}).items():
+        index.update(rel_path, entry)
+    save_search_index()
+    if deletes:
+        duplicate_cache.invalidate()  # Their content hash records went with them
+    if tagging_worker is not None and deletes:
+        tagging_worker.queue.forget(deletes)
+    if embedding_worker is not None:
+        images = [rel_path for rel_path, entry in (upserts or {}).items() if entry["format"] == "image"]
+        embedding_worker.enqueue(images, deletes)
+
+
+def read_all_tags_files(root_folder):
+    """Merge the root .tags.txt with every per-folder .tags.txt into {rel_path: entry}."""
+    entries = read_tags_file(metadata_path(root_folder, '.tags.txt'))
+    for root, dirs, files in os.walk(root_folder):
+        dirs[:] = [name for name in dirs if name != METADATA_SIDECAR_DIRNAME]
+        tags_file = metadata_path(root, '.tags.txt')
+        if not os.path.exists(tags_file):
+            continue
+        folder_rel = to_rel_path(os.path.relpath(root, root_folder))
+        for name, entry in read_tags_file(tags_file).items():
+            if os.path.isfile(os.path.join(root, name)):
+                entries[to_rel_path(folder_rel, name)] = entry  # Folder files are written first, so they win
+    return entries
+
+
+def import_tags_files(store, root_folder):
+    """One-shot import of existing .tags.txt files (root and per-folder) into a metadata store."""
+    entries = read_all_tags_files(root_folder)
+    if entries:
+        store.apply(entries)
+        logger.info(f"Imported {len(entries)} entries from .tags.txt files into {type(store).__name__}")
+    return len(entries)
+
+
+def export_tags_files(store, root_folder):
+    """Write the store's contents back out as per-folder and root .tags.txt files."""
+    all_tags = store.get_all()
+    TagsFileMetadataStore(root_folder).replace_all(all_tags)
+    logger.info(f"Exported {len(all_tags)} entries to .tags.txt files")
+    return len(all_tags)
+
+
+def catalog_format(filename):
+    """Guess a catalog's format from its file name: Parquet for .parquet files, JSON Lines otherwise."""
+    return "parquet" if filename.lower().endswith(".parquet") else "jsonl"
+
+
+def catalog_parquet_schema():
+    # Microseconds with a time zone, which pyarrow turns into datetimes without needing pandas
+    return pa.schema([("path", pa.string()), ("format", pa.string()), ("tags", pa.list_(pa.string())),
+                      ("description", pa.string()), ("size", pa.int64()), ("mtime", pa.timestamp("us", tz="UTC")),
+                      ("hash", pa.string()), ("phash", pa.string())])
+
+
+def catalog_record(rel_path, entry, hashed):
+    """Return the export record of a store entry, with the file's size and mtime (ns) and its content hashes.
+
+    Placeholder tags and descriptions are exported empty, so they never pass for real metadata. Files that
+    haven't been hashed yet are stat'ed for their size and mtime and exported without hashes.
+    """
+    if hashed is None:
+        hashed = {"size": None, "mtime": None, "hash": None, "phash": None}
+        try:
+            file_stat = os.stat(os.path.join(ROOT_FOLDER, rel_path))
+            hashed.update(size=file_stat.st_size, mtime=file_stat.st_mtime_ns)
+        except OSError:
+            pass
+    tags = parse_tag_list(entry["tags"]) if entry["tags"] not in PLACEHOLDER_TAGS else []
+    description = entry["description"] if entry["description"] not in PLACEHOLDER_DESCRIPTIONS else ""
+    return {"path": rel_path, "format": entry["format"], "tags": tags,
+            "description": description, "size": hashed["size"], "mtime": hashed["mtime"],
+            "hash": hashed["hash"], "phash": hashed["phash"]}
+
+
+class CatalogSink(io.RawIOBase):
+    """Write-only file object collecting what pyarrow writes, so a Parquet file can be streamed as it grows."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        """Return and forget everything written since the last call."""
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_catalog(store, fmt="jsonl", batch_size=CATALOG_BATCH_SIZE):
+    """Yield the store's catalog as JSON Lines or Parquet bytes, one chunk (Parquet row group) per store batch.
+
+    Only one batch of entries is held at a time on the SQLite backend, so large libraries stream in bounded
+    memory. Each record holds the path, format, tags as a list, description, size, mtime (ns) and hashes.
+    """
+    batches = ([catalog_record(*item) for item in batch] for batch in store.iter_entries(batch_size))
+    if fmt == "parquet":
+        schema = catalog_parquet_schema()
+        sink = CatalogSink()
+        with pq.ParquetWriter(sink, schema) as writer:
+            for records in batches:
+                for record in records:
+                    record["mtime"] = record["mtime"] // 1000 if record["mtime"] is not None else None
+                writer.write_table(pa.Table.from_pylist(records, schema))
+                yield sink.take()
+        yield sink.take()  # The footer, written on close
+        return
+    for records in batches:
+        yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode('utf-8')
+
+
+def read_catalog(file, fmt="jsonl", batch_size=CATALOG_BATCH_SIZE):
+    """Yield lists of records read from a binary file object holding a JSON Lines or Parquet catalog.
+
+    JSON Lines input is read line by line; lines that aren't valid JSON are yielded as None. Parquet input must
+    be seekable and is read one batch of rows at a time, with timestamps turned into integer nanoseconds.
+    """
+    if fmt == "parquet":
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=batch_size):
+            columns = {}
+            for name, column in zip(batch.schema.names, batch.columns):
+                if pa.types.is_timestamp(column.type):
+                    factor = CATALOG_TIMESTAMP_NANOSECONDS[column.type.unit]
+                    columns[name] = [None if value is None else value * factor
+                                     for value in column.cast(pa.int64()).to_pylist()]
+                else:
+                    columns[name] = column.to_pylist()
+            yield [dict(zip(columns, values)) for values in zip(*columns.values())]
+        return
+    records = []
+    for line in file:
+        if line.strip():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                records.append(None)
+        if len(records) >= batch_size:
+            yield records
+            records = []
+    if records:
+        yield records
+
+
+def catalog_entry(record):
+    """Validate a catalog record and return (rel_path, store entry); raises ValueError or TypeError."""
+    if not isinstance(record, dict):
+        raise TypeError("record must be a JSON object")
+    rel_path = record.get("path")
+    if not isinstance(rel_path, str) or not to_rel_path(rel_path):
+        raise ValueError("path must be a non-empty string")
+    rel_path = to_rel_path(rel_path)
+    if is_metadata_file(os.path.basename(rel_path)) or METADATA_SIDECAR_DIRNAME in rel_path.split("/"):
+        raise ValueError(f"{rel_path} is a VisionVault bookkeeping file")
+    description = record.get("description") or "No description available"
+    if not isinstance(description, str):
+        raise ValueError("description must be a string")
+    tags = ", ".join(parse_tag_list(record.get("tags") or [])) or "untagged"
+    return rel_path, {"format": get_file_type(rel_path), "tags": tags, "description": description}
+
+
+def import_catalog(batches):
+    """Restore metadata from batches of catalog records, one metadata write per batch.
+
+    Records for files that no longer exist are skipped, and records without tags or a description never replace
+    an existing entry. A record's content hash is restored only while the file still has the exported size and
+    mtime (to the microsecond, as Parquet keeps it), so files changed since the export are rehashed by the next
+    scan. Returns counts of imported, untagged, missing and invalid records and of restored hashes.
+    """
+    store = get_metadata_store()
+    stats = {"imported": 0, "untagged": 0, "missing": 0, "invalid": 0, "hashes": 0}
+    for records in batches:
+        upserts = {}
+        hashes = {}
+        for record in records:
+            try:
+                rel_path, entry = catalog_entry(record)
+                full_path = safe_join(ROOT_FOLDER, rel_path)
+                if full_path is None:
+                    raise ValueError(f"{rel_path} is outside the library")
+            except (TypeError, ValueError) as e:
+                stats["invalid"] += 1
+                logger.debug(f"Skipping catalog record {str(record)[:200]}: {e}")
+                continue
+            try:
+                file_stat = os.stat(full_path)
+            except OSError:
+                file_stat = None
+            if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
+                stats["missing"] += 1
+                continue
+            upserts[rel_path] = entry
+            if (isinstance(record.get("hash"), str) and record.get("size") == file_stat.st_size
+                    and isinstance(record.get("mtime"), int)
+                    and record["mtime"] // 1000 == file_stat.st_mtime_ns // 1000):
+                hashes[rel_path] = {"size": file_stat.st_size, "mtime": file_stat.st_mtime_ns,
+                                    "hash": record["hash"], "phash": record.get("phash")}
+        placeholders = {rel_path for rel_path, entry in upserts.items()
+                        if entry["tags"] in PLACEHOLDER_TAGS and entry["description"] in PLACEHOLDER_DESCRIPTIONS}
+        if placeholders:
+            existing = {folder: store.get_folder(folder) for folder in {os.path.dirname(p) for p in placeholders}}
+            for rel_path in placeholders:
+                if os.path.basename(rel_path) in existing[os.path.dirname(rel_path)]:
+                    del upserts[rel_path]
+                    stats["untagged"] += 1
+        if upserts:
+            apply_metadata_changes(upserts)
+        if hashes:
+            store.set_hashes(hashes)
+            duplicate_cache.invalidate()
+            tagged = {record["hash"]: {"tags": upserts[rel_path]["tags"],
+                                       "description": upserts[rel_path]["description"]}
+                      for rel_path, record in hashes.items()
+                      if rel_path in upserts and upserts[rel_path]["tags"] not in PLACEHOLDER_TAGS}
+            if tagged and CONTENT_HASHING:
+                store.cache_tags(tagged)
+        stats["imported"] += len(upserts)
+        stats["hashes"] += len(hashes)
+    save_search_index(force=True)
+    logger.info(f"Imported {stats['imported']} catalog records ({stats['hashes']} with content hashes); "
+                f"{stats['untagged']} untagged records for existing entries, {stats['missing']} missing files "
+                f"and {stats['invalid']} invalid records skipped")
+    return stats
+
+
+def import_catalog_file(file, fmt="jsonl"):
+    """Import a catalog from a binary file object, spooling Parquet input that can't seek (stdin, uploads)."""
+    if fmt == "parquet" and not file.seekable():
+        with tempfile.SpooledTemporaryFile(CATALOG_SPOOL_SIZE) as spool:
+            shutil.copyfileobj(file, spool)
+            spool.seek(0)
+            return import_catalog(read_catalog(spool, fmt))
+    return import_catalog(read_catalog(file, fmt))
+
+
+def update_tags(folder_path):
+    """Scan a folder, process only untagged files, and update its metadata in one batch."""
+    full_path = os.path.join(ROOT_FOLDER, folder_path) if folder_path else ROOT_FOLDER
+    if not os.path.exists(full_path):
+        return
+    folder_rel = to_rel_path(folder_path)
+    tags_data = {}
+    existing_tags = get_metadata_store().get_folder(folder_rel)
+    try:
+        files, _ = list_folder(full_path)
+        for item in files:
+            if item not in existing_tags or existing_tags[item]["tags"] == "Pending tags":
+                # Note: process_image() is not called here as per your request, to be handled later
+                tags = ["Pending tags"]  # Placeholder until process_image() is used
+                description = "No description available"  # Placeholder
+                tags_data[item] = {"format": get_file_type(item), "tags": ", ".join(tags),
+                                   "description": description}
+            else:
+                tags_data[item] = existing_tags[item]
+        stale = [to_rel_path(folder_rel, item) for item in existing_tags if item not in tags_data]
+        if tags_data or stale:
+            apply_metadata_changes({to_rel_path(folder_rel, item): data for item, data in tags_data.items()}, stale)
+    except Exception as e:
+        logger.error(f"Error updating tags for {full_path}: {e}")
+
+
+def load_scan_manifest(store):
+    """Load the startup scan manifest, or return {} if it is missing or no longer matches the store."""
+    manifest_file = metadata_path(ROOT_FOLDER, SCAN_MANIFEST_FILENAME)
+    if not os.path.exists(manifest_file):
+        return {}
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if (manifest.get("version") != 2 or manifest.get("backend") != METADATA_BACKEND
+                or (manifest.get("entries") and not store.count())):
+            logger.info(f"Scan manifest {manifest_file} does not match the metadata store; doing a full scan")
+            return {}
+        return manifest["dirs"]
+    except Exception as e:
+        logger.error(f"Error loading scan manifest {manifest_file}: {e}")
+        return {}
+
+
+def save_scan_manifest(store, dirs):
+    """Persist the startup scan manifest as a hidden JSON file."""
+    manifest_file = metadata_path(ROOT_FOLDER, SCAN_MANIFEST_FILENAME)
+    payload = {"version": 2, "backend": METADATA_BACKEND, "entries": store.count(), "dirs": dirs}
+    try:
+        write_metadata_file(manifest_file, json.dumps(payload, separators=(',', ':')))
+    except Exception as e:
+        logger.error(f"Error saving scan manifest {manifest_file}: {e}")
+
+
+def list_folder(full_dir):
+    """List a directory with os.scandir, returning ({filename: [size, mtime_ns, inode]}, [subfolder names]).
+
+    Hidden files and folders and VisionVault's own bookkeeping files are left out.
+    """
+    files = {}
+    subdirs = []
+    with metrics.timer("visionvault_directory_scan_seconds", kind="files"), os.scandir(full_dir) as entries:
+        for entry in entries:
+            if hidden_files.is_hidden(entry):
+                continue
+            if entry.is_dir():
+                subdirs.append(entry.name)
+            elif entry.is_file() and not is_metadata_file(entry.name):
+                entry_stat = entry.stat()
+                files[entry.name] = [entry_stat.st_size, entry_stat.st_mtime_ns, entry_stat.st_ino]
+    return files, subdirs
+
+
+def folder_changes(rel_dir, files, existing_tags):
+    """Compare a folder listing with its stored entries.
+
+    Returns ({rel_path: entry} to upsert, [rel_path] to delete, number of newly added files).
+    """
+    upserts = {}
+    added = 0
+    for item in files:
+        existing = existing_tags.get(item)
+        if existing is None or existing["tags"] == "Pending tags":
+            # Note: process_image() is not called here as per your request, to be handled later
+            tags = ["untagged"]  # Placeholder until process_image() is used
+            description = "No description available"  # Placeholder
+            upserts[to_rel_path(rel_dir, item)] = {"format": get_file_type(item), "tags": ", ".join(tags),
+                                                   "description": description}
+            added += existing is None
+    deletes = [to_rel_path(rel_dir, item) for item in existing_tags if item not in files]
+    return upserts, deletes, added
+
+
+def initialize_tags():
+    """Scan the library, ensuring every non-hidden file has an entry in the metadata store.
+
+    Directories whose mtime matches the persisted scan manifest are not re-listed, since adding, removing or
+    renaming an entry always updates the mtime of its directory; only their known subdirectories are visited.
+    """
+    start = time.time()
+    store = get_metadata_store()
+    previous_dirs = load_scan_manifest(store)
+    dirs = {}
+    upserts = {}
+    deletes = set()
+    hash_candidates = {}
+    unlisted = []  # Files of skipped directories, checked for in-place edits by the hashing pass
+    unreadable = set()  # Directories that exist but couldn't be listed; their entries are left alone
+    stats = {"scanned": 0, "skipped": 0, "changed": 0, "added": 0, "removed": 0}
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        full_dir = os.path.join(ROOT_FOLDER, rel_dir)
+        previous = previous_dirs.get(rel_dir)
+        try:
+            dir_mtime = os.stat(full_dir).st_mtime_ns
+            if previous and previous["mtime"] == dir_mtime:
+                stats["skipped"] += 1
+                dirs[rel_dir] = previous
+                unlisted.extend(to_rel_path(rel_dir, name) for name in previous["files"])
+                stack.extend(to_rel_path(rel_dir, name) for name in previous["subdirs"])
+                continue
+            stats["scanned"] += 1
+            files, subdirs = list_folder(full_dir)
+        except FileNotFoundError:
+            continue  # Removed since it was found; its entries are deleted below
+        except OSError as e:
+            # A transient error (permissions, a share that isn't mounted) is not a deletion
+            logger.error(f"Error scanning folder {full_dir}, keeping its entries: {e}")
+            unreadable.add(rel_dir)
+            if previous:
+                dirs[rel_dir] = {**previous, "mtime": 0}  # Re-listed by the next scan
+                stack.extend(to_rel_path(rel_dir, name) for name in previous["subdirs"])
+            continue
+
+        folder_upserts, folder_deletes, added = folder_changes(rel_dir, files, store.get_folder(rel_dir))
+        hash_candidates.update({to_rel_path(rel_dir, name): (size, mtime) for name, (size, mtime, _) in files.items()})
+        upserts.update(folder_upserts)
+        deletes.update(folder_deletes)
+        stats["added"] += added
+        stats["removed"] += len(folder_deletes)
+        stats["changed"] += bool(added or folder_deletes)
+
+        # A directory touched within the grace window is recorded as unknown so the next scan re-lists it
+        racy = abs(start - dir_mtime / 1e9) < SCAN_MTIME_GRACE
+        dirs[rel_dir] = {"mtime": 0 if racy else dir_mtime, "subdirs": subdirs, "files": sorted(files)}
+        stack.extend(to_rel_path(rel_dir, name) for name in subdirs)
+
+    def inside_unreadable(rel_dir):
+        return any(not folder or rel_dir == folder or rel_dir.startswith(folder + "/") for folder in unreadable)
+
+    # Entries in directories that no longer exist (or were never scanned, on a first run)
+    if previous_dirs:
+        for rel_dir in previous_dirs:
+            if rel_dir not in dirs and not inside_unreadable(rel_dir):
+                for item in set(store.get_folder(rel_dir)) | set(previous_dirs[rel_dir]["files"]):
+                    deletes.add(to_rel_path(rel_dir, item))
+                    stats["removed"] += 1
+    else:
+        listed = {rel_dir: set(scanned["files"]) for rel_dir, scanned in dirs.items()}
+        for rel_path in store.get_all():
+            folder, item = os.path.split(rel_path)
+            if item not in listed.get(folder, ()) and rel_path not in deletes and not inside_unreadable(folder):
+                deletes.add(rel_path)
+                stats["removed"] += 1
+
+    if upserts or deletes:
+        try:
+            apply_metadata_changes(upserts, deletes)
+        except Exception as e:
+            logger.error(f"Failed to update metadata store: {e}")
+    pregenerate_thumbnails(upserts)
+    schedule_content_hashing(hash_candidates, unlisted)
+    save_search_index(force=True)
+    if dirs != previous_dirs:
+        save_scan_manifest(store, dirs)
+    stats["elapsed"] = round(time.time() - start, 3)
+    logger.info(f"Startup scan finished in {stats['elapsed']}s: {stats['scanned']} folders scanned, "
+                f"{stats['skipped']} unchanged folders skipped, {stats['changed']} folders changed, "
+                f"{stats['added']} files added, {stats['removed']} files removed")
+    return stats
+
+
+def sync_folders(folders):
+    """Bring the metadata of the given folders in line with the filesystem as one batch.
+
+    folders maps a relative folder path to True when its whole subtree should be synced (e.g. a folder that was
+    moved in or deleted), or False to sync only its direct files. Returns the number of entries changed.
+    """
+    store = get_metadata_store()
+    upserts = {}
+    deletes = set()
+    hash_candidates = {}
+    stack = list(folders.items())
+    while stack:
+        rel_dir, recursive = stack.pop()
+        full_dir = os.path.join(ROOT_FOLDER, rel_dir)
+        if not os.path.isdir(full_dir):
+            # The folder is gone: drop everything that was stored under it
+            deletes.update(rel_path for rel_path in store.get_subtree(rel_dir))
+            continue
+        try:
+            files, subdirs = list_folder(full_dir)
+        except OSError as e:
+            logger.error(f"Error scanning folder {full_dir}: {e}")
+            continue
+        folder_upserts, folder_deletes, _ = folder_changes(rel_dir, files, store.get_folder(rel_dir))
+        hash_candidates.update({to_rel_path(rel_dir, name): (size, mtime) for name, (size, mtime, _) in files.items()})
+        upserts.update(folder_upserts)
+        deletes.update(folder_deletes)
+        if recursive:
+            stack.extend((to_rel_path(rel_dir, name), True) for name in subdirs)
+    if upserts or deletes:
+        apply_metadata_changes(upserts, deletes)
+    pregenerate_thumbnails(upserts)
+    schedule_content_hashing(hash_candidates)
+    return len(upserts) + len(deletes)
+
+
+class LibraryWatcher:
+    """Background watcher that keeps the metadata store in sync with changes under ROOT_FOLDER.
+
+    Filesystem events are reduced to the folder whose listing changed and put on a bounded queue. A worker
+    thread waits until no new event has arrived for the debounce window, coalesces the queued folders and
+    applies them with a single sync_folders() call. Events come from watchdog (inotify on Linux) when it is
+    installed, otherwise from polling directory mtimes. If the queue overflows, the next batch falls back to
+    a full initialize_tags() scan.
+    """
+
+    def __init__(self, root_folder, backend=None, debounce=None, queue_size=None, poll_interval=None):
+        self.root_folder = root_folder
+        self.backend = backend or WATCHER_BACKEND
+        if self.backend == "auto":
+            self.backend = "watchdog" if Observer is not None else "polling"
+        self.debounce = WATCHER_DEBOUNCE if debounce is None else debounce
+        self.poll_interval = WATCHER_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.events = queue.Queue(maxsize=queue_size or WATCHER_QUEUE_SIZE)
+        self.stop_event = threading.Event()
+        self.overflowed = False
+        self.threads = []
+        self.observer = None
+        self.counters = {"received": 0, "coalesced": 0, "dropped": 0, "batches": 0, "applied": 0, "rescans": 0}
+
+    def status(self):
+        return {"backend": self.backend, "running": not self.stop_event.is_set() and bool(self.threads),
+                "queue_depth": self.events.qsize(), "debounce": self.debounce, **self.counters}
+
+    def enqueue(self, rel_dir, recursive=False):
+        """Queue a folder for syncing; on overflow, remember to fall back to a full scan."""
+        self.counters["received"] += 1
+        folder_tree_cache.invalidate(rel_dir, recursive)
+        try:
+            self.events.put_nowait((rel_dir, recursive))
+        except queue.Full:
+            self.counters["dropped"] += 1
+            self.overflowed = True
+
+    def notify(self, full_path, is_directory=False):
+        """Queue the folder(s) affected by a created, deleted, moved or modified path."""
+        full_path = os.fspath(full_path)
+        if not is_directory and is_metadata_file(os.path.basename(full_path)):
+            return  # Our own bookkeeping writes
+        rel_path = to_rel_path(os.path.relpath(full_path, self.root_folder))
+        if rel_path.startswith(".."):
+            return
+        # The parent listing changed; a folder that appeared or disappeared also needs its whole subtree synced
+        self.enqueue(to_rel_path(os.path.dirname(rel_path)))
+        if is_directory:
+            self.enqueue(rel_path, recursive=True)
+
+    def start(self):
+        if self.backend == "watchdog":
+            watcher = self
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    if event.event_type not in ("created", "deleted", "moved", "modified"):
+                        return
+                    if event.is_directory and event.event_type == "modified":
+                        return  # Reported alongside the events for the entries that changed
+                    watcher.notify(event.src_path, event.is_directory)
+                    if getattr(event, "dest_path", None):
+                        watcher.notify(event.dest_path, event.is_directory)
+
+            self.observer = Observer()
+            self.observer.schedule(Handler(), self.root_folder, recursive=True)
+            self.observer.daemon = True
+            self.observer.start()
+        else:
+            self.threads.append(threading.Thread(target=self.poll, name="watcher-poll", daemon=True))
+        self.threads.append(threading.Thread(target=self.run, name="watcher-apply", daemon=True))
+        for thread in self.threads:
+            thread.start()
+        logger.info(f"Watching {self.root_folder} for changes ({self.backend}, debounce {self.debounce}s)")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def poll(self):
+        """Polling fallback: queue every folder whose mtime changed, appeared or disappeared since the last pass."""
+        previous = None
+        while not self.stop_event.is_set():
+            current = {}
+            stack = [self.root_folder]
+            while stack:
+                full_dir = stack.pop()
+                try:
+                    current[full_dir] = os.stat(full_dir).st_mtime_ns
+                    with os.scandir(full_dir) as entries:
+                        stack.extend(entry.path for entry in entries if entry.is_dir())
+                except OSError:
+                    continue
+            if previous is not None:
+                for full_dir, mtime in current.items():
+                    if previous.get(full_dir) != mtime:
+                        # New folders get their whole subtree synced; known ones only their own listing
+                        rel_dir = to_rel_path(os.path.relpath(full_dir, self.root_folder))
+                        self.enqueue(rel_dir, recursive=full_dir not in previous)
+                for full_dir in previous:
+                    if full_dir not in current:
+                        self.enqueue(to_rel_path(os.path.relpath(full_dir, self.root_folder)), recursive=True)
+            previous = current
+            self.stop_event.wait(self.poll_interval)
+
+    def run(self):
+        """Debounce, coalesce and apply queued folder changes."""
+        while not self.stop_event.is_set():
+            try:
+                first = self.events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            received = 1
+            folders = {first[0]: first[1]}
+            # Keep collecting until the queue has been quiet for a whole debounce window
+            while not self.stop_event.is_set():
+                try:
+                    rel_dir, recursive = self.events.get(timeout=self.debounce)
+                except queue.Empty:
+                    break
+                received += 1
+                folders[rel_dir] = folders.get(rel_dir, False) or recursive
+            self.counters["coalesced"] += received - len(folders)
+            self.counters["batches"] += 1
+            try:
+                if self.overflowed:
+                    self.overflowed = False
+                    self.counters["rescans"] += 1
+                    logger.warning("Watcher event queue overflowed; running a full scan")
+                    initialize_tags()
+                else:
+                    self.counters["applied"] += sync_folders(folders)
+            except Exception as e:
+                logger.error(f"Watcher failed to apply changes for {sorted(folders)}: {e}")
+
+
+watcher = None
+
+
+def start_watcher():
+    """Start the background library watcher if it is not running yet."""
+    global watcher
+    if watcher is None:
+        watcher = LibraryWatcher(ROOT_FOLDER)
+        watcher.start()
+    return watcher
+
+
+def thumbnail_cache_path(rel_path, file_stat, size):
+    """Return the content-addressed cache path for a thumbnail (keyed on path, mtime, file size and box size)."""
+    key = f"{rel_path}\0{file_stat.st_mtime_ns}\0{file_stat.st_size}\0{size}\0{THUMBNAIL_FORMAT}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(THUMBNAIL_CACHE_DIR, digest[:2], f"{digest}.{THUMBNAIL_FORMAT}")
+
+
+def generate_thumbnail(source_path, thumb_path, size, fmt=None, quality=None):
+    """Render a thumbnail of source_path fitting in a size x size box and write it atomically to thumb_path.
+
+    Runs in the thumbnail process pool as well as inline, so it only takes plain arguments.
+    """
+    fmt = fmt or THUMBNAIL_FORMAT
+    quality = quality or THUMBNAIL_QUALITY
+    if os.path.exists(thumb_path):
+        return thumb_path
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    with Image.open(source_path) as img:
+        img.draft('RGB', (size, size))  # Lets the JPEG decoder downscale while decoding
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size))
+        if fmt == 'jpeg' and img.mode != 'RGB':
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        temp_path = f"{thumb_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        img.save(temp_path, fmt.upper(), quality=quality)
+    os.replace(temp_path, thumb_path)
+    return thumb_path
+
+
+class ThumbnailCache:
+    """Tracks the size of the thumbnail cache directory and evicts least recently used thumbnails over the cap.
+
+    Recency is the thumbnail file's mtime, which is bumped on every cache hit.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total_bytes = None  # Computed lazily from the cache directory
+
+    def _scan(self):
+        files = []
+        for root, dirs, names in os.walk(THUMBNAIL_CACHE_DIR):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def touch(self, thumb_path):
+        try:
+            os.utime(thumb_path)
+        except OSError:
+            pass
+
+    def added(self, thumb_path):
+        """Account for a newly written thumbnail and evict old ones if the cache is over its cap."""
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                try:
+                    self.total_bytes += os.path.getsize(thumb_path)
+                except OSError:
+                    pass
+            if self.total_bytes > THUMBNAIL_CACHE_MAX_BYTES:
+                self._evict(keep=thumb_path)
+
+    def _evict(self, keep=None):
+        # Trim to 90% of the cap so eviction doesn't run again on the very next thumbnail
+        files = sorted(self._scan())
+        self.total_bytes = sum(size for _, size, _ in files)
+        target = THUMBNAIL_CACHE_MAX_BYTES * 0.9
+        removed = 0
+        for _, size, path in files:
+            if self.total_bytes <= target:
+                break
+            if path == keep:
+                continue  # About to be served
+            try:
+                os.remove(path)
+                self.total_bytes -= size
+                removed += 1
+            except OSError:
+                continue
+        logger.info(f"Evicted {removed} thumbnails; cache is now {self.total_bytes} bytes")
+
+
+thumbnail_cache = ThumbnailCache()
+process_pool = None
+process_pool_lock = threading.Lock()
+hashing_lock = threading.Lock()
+
+
+def get_thumbnail(rel_path, size):
+    """Return the cached thumbnail path for a library image, generating it on first request."""
+    source_path = os.path.join(ROOT_FOLDER, rel_path)
+    thumb_path = thumbnail_cache_path(rel_path, os.stat(source_path), size)
+    if os.path.exists(thumb_path):
+        thumbnail_cache.touch(thumb_path)
+        return thumb_path
+    generate_thumbnail(source_path, thumb_path, size)
+    thumbnail_cache.added(thumb_path)
+    return thumb_path
+
+
+def pregenerate_thumbnails(rel_paths, size=None):
+    """Queue thumbnail generation for new library images on the shared process pool."""
+    if Image is None or not THUMBNAIL_PREGENERATE:
+        return 0
+    size = size or THUMBNAIL_DEFAULT_SIZE
+    queued = 0
+    for rel_path in rel_paths:
+        if get_file_type(rel_path) != "image":
+            continue
+        source_path = os.path.join(ROOT_FOLDER, rel_path)
+        try:
+            thumb_path = thumbnail_cache_path(rel_path, os.stat(source_path), size)
+        except OSError:
+            continue
+        if os.path.exists(thumb_path):
+            continue
+        future = get_process_pool().submit(generate_thumbnail, source_path, thumb_path, size,
+                                       THUMBNAIL_FORMAT, THUMBNAIL_QUALITY)
+        future.add_done_callback(lambda f, path=thumb_path: f.exception() is None and thumbnail_cache.added(path))
+        queued += 1
+    if queued:
+        logger.info(f"Queued {queued} thumbnails for generation")
+    return queued
+
+
+def compute_content_hashes(full_path, perceptual=True):
+    """Return (content hash, perceptual hash or None) for a file, or (None, None) if it can't be read.
+
+    The content hash streams the file through xxHash when installed, otherwise BLAKE2b, and is prefixed with
+    the algorithm name. The perceptual hash is a 64-bit dHash of the image. Runs in the shared process pool.
+    """
+    try:
+        digest = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
+        with open(full_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        content_hash = f"{CONTENT_HASH_ALGORITHM}:{digest.hexdigest()}"
+    except OSError:
+        return None, None
+    phash = None
+    if perceptual and Image is not None:
+        try:
+            with Image.open(full_path) as img:
+                img.draft('L', (64, 64))
+                pixels = list(img.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+            # One bit per horizontally adjacent pixel pair: is the left one brighter?
+            bits = [pixels[row * 9 + col] > pixels[row * 9 + col + 1] for row in range(8) for col in range(8)]
+            phash = f"{sum(1 << i for i, bit in enumerate(bits) if bit):016x}"
+        except Exception:
+            phash = None
+    return content_hash, phash
+
+
+def get_process_pool():
+    """Return the process pool shared by thumbnail generation and content hashing.
+
+    Workers are spawned rather than forked: a fork of this multithreaded server can copy a lock some other thread
+    holds, and the child then deadlocks on it.
+    """
+    global process_pool
+    with process_pool_lock:
+        if process_pool is None:
+            process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_WORKERS,
+                                               mp_context=multiprocessing.get_context("spawn"))
+    return process_pool
+
+
+def hash_files(files):
+    """Hash files whose size or mtime changed since they were last hashed, then apply the tag cache.
+
+    files maps rel_path to (size, mtime_ns). Tagged files seed the hash -> tags cache, and untagged files whose
+    content has been tagged before (duplicates, renamed or moved files) get those tags without an API call.
+    The new mtimes also go to the search index for its date filters. Returns the number of files hashed.
+    """
+    store = get_metadata_store()
+    stored = store.get_hashes(files)
+    todo = [rel_path for rel_path, (size, mtime) in files.items()
+            if rel_path not in stored or stored[rel_path]["size"] != size or stored[rel_path]["mtime"] != mtime
+            or not stored[rel_path]["hash"].startswith(f"{CONTENT_HASH_ALGORITHM}:")]
+    if not todo:
+        return 0
+    start = time.time()
+    full_paths = [os.path.join(ROOT_FOLDER, rel_path) for rel_path in todo]
+    perceptual = [PERCEPTUAL_HASHING and get_file_type(rel_path) == "image" for rel_path in todo]
+    hashes = {}
+    results = get_process_pool().map(compute_content_hashes, full_paths, perceptual, chunksize=16)
+    for rel_path, (content_hash, phash) in zip(todo, results):
+        if content_hash is not None:
+            size, mtime = files[rel_path]
+            hashes[rel_path] = {"size": size, "mtime": mtime, "hash": content_hash, "phash": phash}
+    store.set_hashes(hashes)
+    duplicate_cache.invalidate()
+    get_search_index().set_mtimes({rel_path: record["mtime"] / 1e9 for rel_path, record in hashes.items()})
+    applied = apply_tag_cache(hashes)
+    logger.info(f"Hashed {len(hashes)} files in {time.time() - start:.2f}s; "
+                f"{applied} duplicates tagged from the tag cache")
+    return len(hashes)
+
+
+def apply_tag_cache(hashes):
+    """Seed the tag cache from tagged files among `hashes` and copy cached tags onto untagged ones."""
+    store = get_metadata_store()
+    by_folder = {}
+    for rel_path in hashes:
+        folder, name = os.path.split(rel_path)
+        by_folder.setdefault(folder, []).append(name)
+    entries = {}
+    for folder, names in by_folder.items():
+        folder_tags = store.get_folder(folder)
+        entries.update({to_rel_path(folder, name): folder_tags[name] for name in names if name in folder_tags})
+
+    tagged = {hashes[rel_path]["hash"]: {"tags": entry["tags"], "description": entry["description"]}
+              for rel_path, entry in entries.items() if entry["tags"] not in PLACEHOLDER_TAGS}
+    if tagged:
+        store.cache_tags(tagged)
+    untagged = {rel_path: entry for rel_path, entry in entries.items() if entry["tags"] in PLACEHOLDER_TAGS}
+    cached = store.get_cached_tags({hashes[rel_path]["hash"] for rel_path in untagged})
+    upserts = {}
+    for rel_path, entry in untagged.items():
+        hit = cached.get(hashes[rel_path]["hash"])
+        if hit is not None:
+            upserts[rel_path] = {"format": entry["format"], "tags": hit["tags"], "description": hit["description"]}
+    if upserts:
+        apply_metadata_changes(upserts)
+    return len(upserts)
+
+
+def schedule_content_hashing(files, unlisted=()):
+    """Hash scanned files in the background so scans and startup aren't held up, then refresh duplicate groups.
+
+    unlisted names files of directories the scan skipped: their entries are unchanged, but a file edited in
+    place doesn't change its directory's mtime, so they are stat'ed here and rehashed if they changed.
+    """
+    if not CONTENT_HASHING or not (files or unlisted):
+        return
+
+    def run():
+        with hashing_lock:  # One hashing pass at a time
+            candidates = dict(files)
+            try:
+                for rel_path in unlisted:
+                    try:
+                        file_stat = os.stat(os.path.join(ROOT_FOLDER, rel_path))
+                    except OSError:
+                        continue
+                    candidates[rel_path] = (file_stat.st_size, file_stat.st_mtime_ns)
+                hash_files(candidates)
+                duplicate_cache.get()
+            except Exception as e:
+                logger.error(f"Error hashing {len(candidates)} files: {e}")
+
+    threading.Thread(target=run, name="content-hashing", daemon=True).start()
+
+
+def find_duplicates(threshold=NEAR_DUPLICATE_THRESHOLD, near=True):
+    """Group files by identical content hash and, optionally, by perceptual hashes within `threshold` bits.
+
+    Near-duplicate candidates come from multi-index hashing: each 64-bit dHash is split into four 16-bit bands,
+    and two hashes within 7 bits of each other differ in at most threshold // 4 bits of some band. Each hash is
+    therefore compared only with hashes whose band value is within that many bits of its own, looked up in a
+    per-band table of 65536 buckets.
+    """
+    by_hash = {}
+    phashes = {}
+    for rel_path, record in get_metadata_store().get_hashes().items():
+        by_hash.setdefault(record["hash"], []).append(rel_path)
+        if record["phash"]:
+            phashes[record["hash"]] = int(record["phash"], 16)
+    exact = [{"hash": content_hash, "paths": sorted(paths)}
+             for content_hash, paths in by_hash.items() if len(paths) > 1]
+
+    near_groups = []
+    if near:
+        parent = {content_hash: content_hash for content_hash in phashes}
+
+        def find(content_hash):
+            while parent[content_hash] != content_hash:
+                parent[content_hash] = parent[parent[content_hash]]
+                content_hash = parent[content_hash]
+            return content_hash
+
+        radius = threshold // 4
+        flips = [0] + ([1 << bit for bit in range(16)] if radius else [])  # Band values within radius (<= 1)
+        tables = [{} for _ in range(4)]
+        for content_hash, value in phashes.items():
+            for band, table in enumerate(tables):
+                table.setdefault((value >> (band * 16)) & 0xFFFF, []).append(content_hash)
+        for content_hash, value in phashes.items():
+            for band, table in enumerate(tables):
+                band_value = (value >> (band * 16)) & 0xFFFF
+                for flip in flips:
+                    for other in table.get(band_value ^ flip, ()):
+                        if (other > content_hash and find(other) != find(content_hash)
+                                and bin(value ^ phashes[other]).count("1") <= threshold):
+                            parent[find(other)] = find(content_hash)
+        groups = {}
+        for content_hash in phashes:
+            groups.setdefault(find(content_hash), []).append(content_hash)
+        for members in groups.values():
+            if len(members) > 1:  # Single-content groups are already reported as exact duplicates
+                near_groups.append({"paths": sorted(path for member in members for path in by_hash[member])})
+    return {"exact": exact, "near": near_groups, "hashed": sum(len(paths) for paths in by_hash.values())}
+
+
+class DuplicateCache:
+    """find_duplicates() results per (threshold, near), dropped whenever content hashes change.
+
+    The default view is recomputed at the end of each background hashing pass, so /api/duplicates is served
+    from memory.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.results = {}
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.results = {}
+
+    def get(self, threshold=NEAR_DUPLICATE_THRESHOLD, near=True):
+        with self.lock:
+            generation = self.generation
+            cached = self.results.get((threshold, near))
+        if cached is not None:
+            return cached
+        result = find_duplicates(threshold, near)
+        with self.lock:
+            if self.generation == generation:  # Hashes didn't change while it was computed
+                self.results[(threshold, near)] = result
+        return result
+
+
+duplicate_cache = DuplicateCache()
+
+
+class RateLimiter:
+    """Sliding one-minute window limiting both the number of requests and the tokens they consume."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = collections.deque()  # (timestamp, tokens) per request in the last minute
+        self.window_tokens = 0
+        self.condition = threading.Condition()
+
+    def _prune(self, now):
+        while self.window and now - self.window[0][0] >= 60:
+            self.window_tokens -= self.window.popleft()[1]
+
+    def acquire(self, tokens, stop_event=None):
+        """Block until a request estimated at `tokens` fits in the window. Returns the slot to pass to record()."""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                fits_tokens = self.window_tokens + tokens <= self.tokens_per_minute or not self.window
+                if len(self.window) < self.requests_per_minute and fits_tokens:
+                    slot = [now, tokens]
+                    self.window.append(slot)
+                    self.window_tokens += tokens
+                    return slot
+                if stop_event is not None and stop_event.is_set():
+                    return None
+                self.condition.wait(timeout=max(0.05, 60 - (now - self.window[0][0])))
+
+    def record(self, slot, tokens):
+        """Replace a slot's estimated token count with the actual usage."""
+        with self.condition:
+            if slot in self.window:
+                self.window_tokens += tokens - slot[1]
+            slot[1] = tokens
+            self.condition.notify_all()
+
+
+class TaggingQueue:
+    """Persistent queue of images waiting for AI tagging, kept in a small SQLite database in ROOT_FOLDER.
+
+    Jobs move pending -> running -> done/failed. Jobs left running by a crash or restart go back to pending,
+    so tagging resumes where it stopped. A job's attempts count every API request made for it, across restarts,
+    and it fails for good after TAGGING_MAX_RETRIES + 1 of them.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            path TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+    """
+
+    def __init__(self, root_folder):
+        self.db_file = metadata_path(root_folder, TAGGING_QUEUE_FILENAME)
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        self.lock = threading.Lock()
+        is_new = not os.path.exists(self.db_file)
+        self.conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.lock, self.conn:
+            self.conn.executescript(self.SCHEMA)
+            self.conn.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+        if is_new:
+            hidden_files.hide(self.db_file)
+
+    def enqueue(self, rel_paths, requeue=False):
+        """Queue paths for tagging. Existing jobs are left alone, unless requeue is set: then finished (done or
+        skipped) jobs are queued again with a fresh attempt count. Running and failed jobs are never touched.
+        """
+        now = time.time()
+        conflict = ("DO UPDATE SET status = 'pending', attempts = 0, last_error = NULL, updated = excluded.updated "
+                    "WHERE status IN ('done', 'skipped')" if requeue else "DO NOTHING")
+        with self.lock, self.conn:
+            cursor = self.conn.executemany(
+                f"INSERT INTO jobs (path, status, updated) VALUES (?, 'pending', ?) ON CONFLICT (path) {conflict}",
+                [(rel_path, now) for rel_path in rel_paths])
+            return cursor.rowcount
+
+    def forget(self, rel_paths):
+        """Drop the jobs of deleted or renamed files, so a new file at the same path is queued afresh."""
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM jobs WHERE path = ?", [(rel_path,) for rel_path in rel_paths])
+
+    def claim(self):
+        """Mark the oldest pending job as running and return (path, attempts made so far), or None."""
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT path, attempts FROM jobs WHERE status = 'pending' ORDER BY updated LIMIT 1").fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE jobs SET status = 'running', updated = ? WHERE path = ?", (time.time(), row[0]))
+            return row[0], row[1]
+
+    def record_attempt(self, rel_path):
+        """Count one vision API request against the job's retry limit."""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE jobs SET attempts = attempts + 1 WHERE path = ?", (rel_path,))
+
+    def finish(self, rel_paths, status="done", error=None):
+        with self.lock, self.conn:
+            self.conn.executemany("UPDATE jobs SET status = ?, last_error = ?, updated = ? WHERE path = ?",
+                                  [(status, error, time.time(), rel_path) for rel_path in rel_paths])
+
+    def retry_failed(self):
+        with self.lock, self.conn:
+            return self.conn.execute("UPDATE jobs SET status = 'pending', attempts = 0, last_error = NULL "
+                                     "WHERE status = 'failed'").rowcount
+
+    def counts(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class TaggingWorker:
+    """Pool of threads that tag queued images with the vision model.
+
+    Requests are spread over TAGGING_WORKERS threads under the RateLimiter's requests- and tokens-per-minute
+    budgets, retried with exponential backoff, and their results written back to the metadata store in
+    batches of TAGGING_BATCH_SIZE (or every TAGGING_FLUSH_INTERVAL seconds), after which the jobs are
+    checkpointed as done. Copies of the same content share one request, even before its result is written.
+    """
+
+    def __init__(self, root_folder, workers=None, requests_per_minute=None, tokens_per_minute=None):
+        self.root_folder = root_folder
+        self.workers = workers or TAGGING_WORKERS
+        self.queue = TaggingQueue(root_folder)
+        self.limiter = RateLimiter(requests_per_minute or TAGGING_REQUESTS_PER_MINUTE,
+                                   tokens_per_minute or TAGGING_TOKENS_PER_MINUTE)
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.results_lock = threading.Lock()
+        self.results = {}  # rel_path -> (tags, description) awaiting write-back
+        self.hash_results = {}  # content hash -> (tags, description) not yet in the store's tag cache
+        self.in_flight = {}  # content hash -> [rel_path] of copies waiting for the request running for it
+        self.last_flush = time.monotonic()
+        self.last_discovery = 0.0
+        self.discovery_lock = threading.Lock()
+        self.completed_times = collections.deque()  # Completion timestamps for throughput
+        self.threads = []
+        self.counters_lock = threading.Lock()
+        self.counters = {"requests": 0, "tagged": 0, "failed": 0, "retries": 0, "tokens": 0, "skipped": 0,
+                         "cache_hits": 0}
+
+    def count(self, name, value=1):
+        with self.counters_lock:
+            self.counters[name] += value
+
+    def discover(self, requeue=False):
+        """Queue every image whose stored tags are still a placeholder and that has no job yet.
+
+        With requeue (an explicit run request), images whose earlier job finished are queued again too.
+        """
+        with self.discovery_lock:
+            pending = [rel_path for rel_path, entry in get_metadata_store().get_all().items()
+                       if entry["format"] == "image" and entry["tags"] in PLACEHOLDER_TAGS]
+            self.last_discovery = time.monotonic()
+            queued = self.queue.enqueue(pending, requeue) if pending else 0
+        if queued:
+            logger.info(f"Queued {queued} images for AI tagging")
+            self.wake_event.set()
+        return queued
+
+    def start(self):
+        # Workers look for untagged images as soon as they find the queue empty
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.run, name=f"tagging-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"Started {self.workers} tagging workers ({self.limiter.requests_per_minute} requests/min, "
+                    f"{self.limiter.tokens_per_minute} tokens/min)")
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+        with self.limiter.condition:
+            self.limiter.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.flush()
+        self.queue.close()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self.flush()
+                if time.monotonic() - self.last_discovery >= TAGGING_DISCOVERY_INTERVAL:
+                    self.discover()
+                self.wake_event.wait(timeout=5)
+                self.wake_event.clear()
+                continue
+            self.process(*job)
+            if time.monotonic() - self.last_flush >= TAGGING_FLUSH_INTERVAL:
+                self.flush()
+
+    def process(self, rel_path, attempts=0):
+        """Tag one image, unless a copy of its content was tagged already or is being tagged right now."""
+        full_path = os.path.join(self.root_folder, rel_path)
+        if not os.path.isfile(full_path):
+            self.queue.finish([rel_path], status="skipped")
+            self.count("skipped")
+            return
+        # Copies of already tagged content reuse the cached tags instead of calling the API
+        store = get_metadata_store()
+        record = store.get_hashes([rel_path]).get(rel_path)
+        content_hash = record["hash"] if record else None
+        if content_hash is not None:
+            cached = store.get_cached_tags([content_hash]).get(content_hash)
+            with self.results_lock:
+                cached = (cached["tags"], cached["description"]) if cached else self.hash_results.get(content_hash)
+                if cached is not None:
+                    self.results[rel_path] = cached
+                elif content_hash in self.in_flight:
+                    self.in_flight[content_hash].append(rel_path)  # Finished along with the running request
+                    return
+                else:
+                    self.in_flight[content_hash] = []
+            if cached is not None:
+                self.count("cache_hits")
+                return
+
+        status, result = self.request_tags(rel_path, full_path, attempts)
+        with self.results_lock:
+            rel_paths = [rel_path, *self.in_flight.pop(content_hash, ())]
+            if status == "done":
+                for path in rel_paths:
+                    self.results[path] = result
+                if content_hash is not None:
+                    self.hash_results[content_hash] = result
+                full_batch = len(self.results) >= TAGGING_BATCH_SIZE
+        if status != "done":
+            self.queue.finish(rel_paths, status=status, error=result)
+            if status == "failed":
+                self.count("failed", len(rel_paths))
+            return
+        self.count("cache_hits", len(rel_paths) - 1)
+        if full_batch:
+            self.flush()
+
+    def request_tags(self, rel_path, full_path, attempts):
+        """Call the vision model for one image, retrying failures with exponential backoff.
+
+        attempts is the number of API requests already made for the job in earlier runs; the job fails once
+        TAGGING_MAX_RETRIES + 1 requests in total have not produced tags. Returns ("done", (tags, description)),
+        or ("failed" or "pending", error message) when it gave up or the worker is stopping.
+        """
+        attempt = attempts
+        while True:
+            if attempt > TAGGING_MAX_RETRIES:
+                logger.error(f"Giving up tagging {rel_path} after {attempt} attempts")
+                return "failed", "Too many attempts"
+            slot = self.limiter.acquire(TAGGING_TOKENS_PER_IMAGE, self.stop_event)
+            if slot is None:
+                return "pending", None
+            self.queue.record_attempt(rel_path)
+            self.count("requests")
+            try:
+                tags, description, tokens = tag_image(full_path)
+            except Exception as e:
+                tokens = getattr(e, "tokens", 0)  # Unusable replies were still paid for
+                self.limiter.record(slot, tokens)
+                self.count("tokens", tokens)
+                attempt += 1
+                if self.stop_event.is_set():
+                    return "pending", str(e)
+                if attempt > TAGGING_MAX_RETRIES:
+                    logger.error(f"Giving up tagging {rel_path} after {attempt} attempts: {e}")
+                    return "failed", str(e)
+                self.count("retries")
+                delay = min(TAGGING_BACKOFF_MAX, TAGGING_BACKOFF_BASE * 2 ** (attempt - 1))
+                delay *= 0.5 + random.random() / 2
+                logger.warning(f"Tagging {rel_path} failed ({e}); retrying in {delay:.1f}s")
+                self.stop_event.wait(delay)
+                continue
+            self.limiter.record(slot, tokens)
+            self.count("tokens", tokens)
+            return "done", (", ".join(tags), description)
+
+    def flush(self):
+        """Write buffered results to the metadata store in one batch, then checkpoint their jobs as done."""
+        with self.results_lock:
+            results, self.results = self.results, {}
+            self.last_flush = time.monotonic()
+        if not results:
+            return
+        store = get_metadata_store()
+        hashes = store.get_hashes(results)
+        tagged = {hashes[rel_path]["hash"]: {"tags": tags, "description": description}
+                  for rel_path, (tags, description) in results.items() if rel_path in hashes}
+        # Untagged copies of the same content get the same result
+        duplicates = {}
+        for content_hash, rel_paths in store.find_by_hash(tagged).items():
+            for rel_path in rel_paths:
+                if rel_path not in results:
+                    duplicates[rel_path] = (tagged[content_hash]["tags"], tagged[content_hash]["description"])
+        upserts = {}
+        for rel_path, (tags, description) in {**duplicates, **results}.items():
+            entry = store.get(rel_path)
+            # Leave entries alone if the file is gone or someone tagged it by hand in the meantime
+            if entry is not None and entry["tags"] in PLACEHOLDER_TAGS:
+                upserts[rel_path] = {"format": entry["format"], "tags": tags, "description": description}
+        try:
+            if upserts:
+                apply_metadata_changes(upserts)
+        except Exception as e:
+            logger.error(f"Failed to write {len(upserts)} tagging results: {e}")
+            self.queue.finish(list(results), status="pending")
+            return
+        self.queue.finish(list(results) + list(duplicates))
+        self.count("tagged", len(results))
+        now = time.monotonic()
+        with self.results_lock:
+            self.completed_times.extend([now] * len(results))
+            for content_hash in tagged:
+                self.hash_results.pop(content_hash, None)  # Served from the store's tag cache from now on
+        logger.info(f"Wrote AI tags for {len(upserts)} images")
+
+    def status(self):
+        counts = self.queue.counts()
+        now = time.monotonic()
+        with self.results_lock:
+            while self.completed_times and now - self.completed_times[0] > 300:
+                self.completed_times.popleft()
+            recent = len(self.completed_times)
+        with self.counters_lock:
+            counters = dict(self.counters)
+        return {
+            "running": bool(self.threads) and not self.stop_event.is_set(),
+            "workers": self.workers,
+            "queue_depth": counts.get("pending", 0),
+            "in_progress": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed_jobs": counts.get("failed", 0),
+            "throughput_per_minute": round(recent / 5, 2),  # Averaged over the last five minutes
+            "requests_per_minute_limit": self.limiter.requests_per_minute,
+            "tokens_per_minute_limit": self.limiter.tokens_per_minute,
+            **counters
+        }
+
+
+tagging_worker = None
+
+
+def start_tagging_worker():
+    """Start the AI tagging worker pool if it is not running yet."""
+    global tagging_worker
+    if tagging_worker is None:
+        tagging_worker = TaggingWorker(ROOT_FOLDER)
+        tagging_worker.start()
+    return tagging_worker
+
 
-# Load environment variables from .env file explicitly
-load_dotenv('.env')
+embedding_model = None  # Loaded once, in the embedding worker process
 
-# Root folder to scan (updated to your path)
-ROOT_FOLDER = r"C:\Users\monse\Pictures\X"
 
-# Set Grok API key from environment variable
-litellm.api_key = os.environ.get('XAI_API_KEY')
-litellm.api_base = "https://api.grok.xai"  # Adjust based on xAI's API endpoint (check docs)
+def load_embedding_model():
+    """Load EMBEDDING_MODEL on the CPU. Runs in the embedding worker process."""
+    global embedding_model
+    if embedding_model is None:
+        import torch
+        from sentence_transformers import SentenceTransformer
+        torch.set_num_threads(EMBEDDING_THREADS)
+        embedding_model = SentenceTransformer(EMBEDDING_MODEL, device='cpu')
+        logger.info(f"Loaded embedding model {EMBEDDING_MODEL}")
+    return embedding_model
 
 
-def is_hidden(filepath):
-    """Check if a file is hidden on Windows."""
-    try:
-        attrs = win32file.GetFileAttributes(filepath)
-        return bool(attrs & win32con.FILE_ATTRIBUTE_HIDDEN)
-    except Exception as e:
-        logger.warning(f"Could not check hidden status for {filepath}: {e}")
-        return filepath.startswith('.')
+def truncate_words(text, words=EMBEDDING_TEXT_WORDS):
+    return " ".join(text.split()[:words])
 
 
-def get_file_attributes(filepath):
-    """Get and log file attributes for diagnostics."""
-    try:
-        attrs = win32file.GetFileAttributes(filepath)
-        is_hidden = bool(attrs & win32con.FILE_ATTRIBUTE_HIDDEN)
-        is_readonly = bool(attrs & win32con.FILE_ATTRIBUTE_READONLY)
-        logger.info(f"File attributes for {filepath}: Hidden={is_hidden}, Readonly={is_readonly}")
-    except Exception as e:
-        logger.error(f"Error getting attributes for {filepath}: {e}")
+def compute_embeddings(full_paths, descriptions):
+    """Return one float16 unit vector per image, or None for images that can't be read.
 
+    The vector is the image embedding, averaged with the embedding of the image's description when it has one,
+    so text queries match both what an image shows and what it was described as. Runs in the embedding worker
+    process.
+    """
+    model = load_embedding_model()
+    images, readable = [], []
+    for full_path in full_paths:
+        try:
+            with Image.open(full_path) as img:
+                img.draft('RGB', (EMBEDDING_IMAGE_SIZE, EMBEDDING_IMAGE_SIZE))
+                images.append(ImageOps.exif_transpose(img).convert('RGB'))
+            readable.append(True)
+        except Exception:
+            readable.append(False)
+    if not images:
+        return [None] * len(full_paths)
+    image_vectors = iter(model.encode(images, batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True,
+                                      normalize_embeddings=True))
+    texts = [truncate_words(description) for description, ok in zip(descriptions, readable) if ok and description]
+    text_vectors = iter(model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True,
+                                     normalize_embeddings=True) if texts else ())
+    vectors = []
+    for description, ok in zip(descriptions, readable):
+        if not ok:
+            vectors.append(None)
+            continue
+        vector = next(image_vectors).astype(np.float32)
+        if description:
+            vector = vector + next(text_vectors)
+            vector /= np.linalg.norm(vector) or 1.0
+        vectors.append(vector.astype(np.float16))
+    return vectors
 
-def toggle_hidden_file(filepath, hide=True):
-    """Toggle the hidden attribute of a file."""
-    try:
-        if not os.path.exists(filepath):
-            logger.error(f"File does not exist: {filepath}")
+
+def compute_text_embedding(text):
+    """Return the float32 unit vector of a search query. Runs in the embedding worker process."""
+    model = load_embedding_model()
+    return model.encode([truncate_words(text)], convert_to_numpy=True, normalize_embeddings=True)[0]
+
+
+def embedding_version(file_stat, description):
+    """Identify the file content and description an embedding was computed from."""
+    digest = hashlib.blake2b(description.encode('utf-8'), digest_size=8).hexdigest()
+    return f"{file_version(file_stat.st_size, file_stat.st_mtime_ns)}:{digest}"
+
+
+class EmbeddingIndex:
+    """Image vectors in a float16 matrix memory-mapped from a bookkeeping file, plus a JSON row map.
+
+    Row i holds the unit vector of paths[i]. A deleted file frees its row for the next addition and the file
+    doubles in size when full, so updates never rewrite the matrix. Queries score every row with one vectorised
+    dot product per EMBEDDING_SCORE_CHUNK rows and take the top k with argpartition. Past EMBEDDING_ANN_THRESHOLD
+    vectors, an hnswlib index rebuilt in the background supplies the candidates instead, and rows written since
+    its build are scored exactly alongside them.
+    """
+
+    def __init__(self, root_folder):
+        self.matrix_file = metadata_path(root_folder, EMBEDDINGS_FILENAME)
+        self.rows_file = metadata_path(root_folder, EMBEDDING_ROWS_FILENAME)
+        self.lock = threading.RLock()
+        self.matrix = None  # capacity x dimensions float16 memmap, created with the first vector
+        self.paths = []  # row -> rel_path, or None for a free row
+        self.rows = {}  # rel_path -> row
+        self.versions = {}  # rel_path -> embedding_version() of what was embedded
+        self.free = []
+        self.dirty = False
+        self.last_saved = 0.0
+        self.ann = None  # (hnswlib index, number of rows it holds)
+        self.ann_building = False
+        self.ann_built = 0.0
+        self.changes = 0
+        self.ann_changed = {}  # row -> change number, for rows written since the ANN index was built
+        self.load()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def load(self):
+        """Open the persisted matrix and row map, or start empty if they are missing or don't match."""
+        try:
+            with open(self.rows_file, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+            if payload.get("version") != 1 or payload.get("model") != EMBEDDING_MODEL:
+                return
+            shape = (payload["capacity"], payload["dimensions"])
+            if os.path.getsize(self.matrix_file) != shape[0] * shape[1] * 2:
+                raise ValueError("matrix file size does not match the row map")
+            matrix = np.memmap(self.matrix_file, dtype=np.float16, mode='r+', shape=shape)
+        except FileNotFoundError:
             return
-        current_attrs = win32file.GetFileAttributes(filepath)
-        if hide:
-            # Add the hidden flag
-            new_attrs = current_attrs | win32con.FILE_ATTRIBUTE_HIDDEN
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Discarding embedding index {self.rows_file}: {e}")
+            return
+        with self.lock:
+            self.matrix = matrix
+            self.paths = payload["paths"]
+            self.rows = {rel_path: row for row, rel_path in enumerate(self.paths) if rel_path is not None}
+            self.versions = payload["versions"]
+            self.free = [row for row, rel_path in enumerate(self.paths) if rel_path is None]
+        logger.info(f"Loaded {len(self.rows)} embeddings from {self.matrix_file}")
+
+    def save(self, force=False):
+        """Flush the matrix and persist the row map if they changed, at most once per EMBEDDING_SAVE_INTERVAL."""
+        with self.lock:
+            if not self.dirty or self.matrix is None:
+                return
+            if not force and time.time() - self.last_saved < EMBEDDING_SAVE_INTERVAL:
+                return
+            self.matrix.flush()
+            payload = {"version": 1, "model": EMBEDDING_MODEL, "capacity": self.matrix.shape[0],
+                       "dimensions": self.matrix.shape[1], "paths": self.paths, "versions": self.versions}
+            content = json.dumps(payload, separators=(',', ':'))
+            self.dirty = False
+            self.last_saved = time.time()
+        try:
+            write_metadata_file(self.rows_file, content)
+        except Exception as e:
+            self.dirty = True
+            logger.error(f"Error saving embedding index to {self.rows_file}: {e}")
+
+    def _grow(self, dimensions, rows):
+        """Make room for at least `rows` rows, creating or doubling the matrix file."""
+        capacity = self.matrix.shape[0] if self.matrix is not None else 0
+        capacity = max(EMBEDDING_INITIAL_ROWS, capacity * 2, rows)
+        if self.matrix is None:
+            if os.path.exists(self.matrix_file):
+                os.remove(self.matrix_file)  # Left over from another model
+            with open(self.matrix_file, 'wb'):
+                pass
+            hidden_files.hide(self.matrix_file)
         else:
-            # Remove the hidden flag
-            new_attrs = current_attrs & ~win32con.FILE_ATTRIBUTE_HIDDEN
-        win32file.SetFileAttributes(filepath, new_attrs)
-        logger.info(f"{'Hid' if hide else 'Unhid'} {filepath} successfully")
-    except Exception as e:
-        logger.error(f"Error toggling hidden attribute for {filepath}: {e}")
+            self.matrix.flush()
+            self.matrix = None  # Unmap before resizing the file
+        with open(self.matrix_file, 'r+b') as f:
+            f.truncate(capacity * dimensions * 2)
+        self.matrix = np.memmap(self.matrix_file, dtype=np.float16, mode='r+', shape=(capacity, dimensions))
 
+    def set(self, vectors):
+        """Store {rel_path: (float16 vector, version)}."""
+        with self.lock:
+            for rel_path, (vector, version) in vectors.items():
+                if self.matrix is not None and self.matrix.shape[1] != len(vector):
+                    raise ValueError(f"expected {self.matrix.shape[1]}-dimensional vectors, got {len(vector)}")
+                row = self.rows.get(rel_path)
+                if row is None:
+                    if self.free:
+                        row = self.free.pop()
+                    else:
+                        row = len(self.paths)
+                        if self.matrix is None or row >= self.matrix.shape[0]:
+                            self._grow(len(vector), row + 1)
+                        self.paths.append(None)
+                    self.paths[row] = rel_path
+                    self.rows[rel_path] = row
+                self.matrix[row] = vector
+                self.versions[rel_path] = version
+                self.changes += 1
+                self.ann_changed[row] = self.changes
+            self.dirty = True
 
-def process_image(file_path):
-    """Process an image with Grok API and return general descriptive tags and description."""
-    try:
-        with open(file_path, 'rb') as f:
-            encoded_image = base64.b64encode(f.read()).decode('utf-8')
-        response = litellm.completion(
-            model="xai/grok-2-vision-1212",
-            messages=[{"role": "user", "content": [
-                {"type": "text",
-                 "text": "Describe this image and provide 3-5 general descriptive tags (e.g., cat, beach, sunset)."},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}}
-            ]}]
-        )
-        description = response.choices[0].message.content
-        tags = [tag.strip().lower() for tag in description.split(',')[:5]] or ["Pending tags"]
-        return tags, description
-    except Exception as e:
-        logger.error(f"Error processing image {file_path}: {e}")
-        return ["Pending tags"], "Error processing image"
+    def delete(self, rel_paths):
+        with self.lock:
+            for rel_path in rel_paths:
+                row = self.rows.pop(rel_path, None)
+                if row is None:
+                    continue
+                del self.versions[rel_path]
+                self.paths[row] = None
+                self.matrix[row] = 0
+                self.free.append(row)
+                self.ann_changed.pop(row, None)
+                if self.ann is not None:
+                    try:
+                        self.ann[0].mark_deleted(row)
+                    except RuntimeError:
+                        pass  # Added after the ANN index was built
+                self.dirty = True
 
+    def vector(self, rel_path):
+        """Return the stored vector of a file as float32, or None if it has not been embedded."""
+        with self.lock:
+            row = self.rows.get(rel_path)
+            return None if row is None else np.asarray(self.matrix[row], dtype=np.float32)
 
-def read_tags_file(tags_file):
-    """Read tags from a .tags.txt file and return a dictionary."""
-    tags_data = {}
-    if os.path.exists(tags_file):
+    def nearest(self, vector, k, exclude=None):
+        """Return up to k (rel_path, score) pairs with the highest cosine similarity to a unit vector, best first."""
+        query = np.asarray(vector, dtype=np.float32)
+        with self.lock:
+            if not self.rows:
+                return []
+            candidates = self._ann_candidates(query, k + 1)
+            if candidates is None:
+                candidates = np.arange(len(self.paths))
+                scores = np.empty(len(self.paths), dtype=np.float32)
+                for start in range(0, len(self.paths), EMBEDDING_SCORE_CHUNK):
+                    end = min(start + EMBEDDING_SCORE_CHUNK, len(self.paths))
+                    scores[start:end] = self.matrix[start:end].astype(np.float32) @ query
+                scores[self.free] = -np.inf
+                if exclude in self.rows:
+                    scores[self.rows[exclude]] = -np.inf
+            else:
+                scores = self.matrix[candidates].astype(np.float32) @ query
+                scores[[i for i, row in enumerate(candidates)
+                        if self.paths[row] is None or self.paths[row] == exclude]] = -np.inf
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [(self.paths[candidates[i]], float(scores[i])) for i in top if scores[i] > -np.inf]
+
+    def _ann_candidates(self, query, k):
+        """Return candidate rows from the hnswlib index, or None to score every row."""
+        if hnswlib is None or len(self.rows) < EMBEDDING_ANN_THRESHOLD:
+            return None
+        stale = self.ann is None or (self.ann_changed
+                                     and time.time() - self.ann_built >= EMBEDDING_ANN_REBUILD_INTERVAL)
+        if stale and not self.ann_building:
+            self.ann_building = True
+            threading.Thread(target=self._build_ann, name="embedding-ann", daemon=True).start()
+        if self.ann is None:
+            return None
+        index, size = self.ann
         try:
-            toggle_hidden_file(tags_file, hide=False)  # Unhide before reading
-            with open(tags_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if ':' in line:
-                        parts = line.strip().split(':', 3)
-                        if len(parts) == 4:
-                            filename, file_format, tags, desc = parts
-                            tags_data[filename] = {"format": file_format, "tags": tags, "description": desc}
-            logger.info(f"Successfully read and closed {tags_file}")
-            toggle_hidden_file(tags_file, hide=True)  # Re-hide after reading
-        except PermissionError as e:
-            logger.error(f"Permission denied reading {tags_file}: {e}")
+            index.set_ef(max(2 * k, 100))
+            labels, _ = index.knn_query(query, k=min(2 * k, size))
+        except RuntimeError:
+            return None  # Too many rows deleted since the build to find k neighbours
+        changed = np.fromiter(self.ann_changed, dtype=np.int64, count=len(self.ann_changed))
+        return np.unique(np.concatenate([labels[0].astype(np.int64), changed]))
+
+    def _build_ann(self):
+        try:
+            with self.lock:
+                rows = np.array([row for row, rel_path in enumerate(self.paths) if rel_path is not None],
+                                dtype=np.int64)
+                vectors = np.asarray(self.matrix[rows], dtype=np.float32)
+                built_at = self.changes
+            start = time.time()
+            index = hnswlib.Index(space='ip', dim=vectors.shape[1])
+            index.init_index(max_elements=len(rows), ef_construction=200, M=16)
+            index.add_items(vectors, rows)
+            with self.lock:
+                self.ann = (index, len(rows))
+                self.ann_changed = {row: change for row, change in self.ann_changed.items() if change > built_at}
+                self.ann_built = time.time()
+            logger.info(f"Built ANN index over {len(rows)} embeddings in {time.time() - start:.1f}s")
         except Exception as e:
-            logger.error(f"Error reading tags for {tags_file}: {e}")
-    return tags_data
+            logger.error(f"Error building ANN index: {e}")
+        finally:
+            self.ann_building = False
 
 
-def write_tags_file(tags_file, tags_data):
-    """Write tags to a .tags.txt file."""
-    try:
-        toggle_hidden_file(tags_file, hide=False)  # Unhide before writing
-        with open(tags_file, 'w', encoding='utf-8') as f:
-            for filename, data in tags_data.items():
-                f.write(f"{filename}:{data['format']}:{data['tags']}:{data['description']}\n")
-        get_file_attributes(tags_file)  # Log attributes after writing
-        logger.info(f"Successfully wrote and closed {tags_file}")
-        toggle_hidden_file(tags_file, hide=True)  # Re-hide after writing
-    except PermissionError as e:
-        logger.error(f"Permission denied writing to {tags_file}: {e}")
-        raise
-    except Exception as e:
-        logger.error(f"Error writing tags for {tags_file}: {e}")
-        raise
+embedding_pool = None
+embedding_pool_lock = threading.Lock()
 
 
-def update_root_tags(root_tags_file, full_path, tags_data_entry, action="update"):
-    """Update the root .tags.txt with a full path entry."""
-    root_tags = read_tags_file(root_tags_file)
-    if action == "update" or action == "add":
-        root_tags[full_path] = tags_data_entry
-    elif action == "delete":
-        root_tags.pop(full_path, None)
-    try:
-        write_tags_file(root_tags_file, root_tags)
-    except Exception as e:
-        logger.warning(f"Root .tags.txt out of sync: {e}. Sync will be corrected on restart with initialize_tags()")
-        raise
+def get_embedding_pool():
+    """Return the single worker process that holds the embedding model, so it is loaded once.
 
+    Spawned rather than forked, like the workers of get_process_pool().
+    """
+    global embedding_pool
+    with embedding_pool_lock:
+        if embedding_pool is None:
+            embedding_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return embedding_pool
 
-def update_tags(folder_path):
-    """Scan a folder, process only untagged files, and update .tags.txt (hidden file)."""
-    full_path = os.path.join(ROOT_FOLDER, folder_path) if folder_path else ROOT_FOLDER
-    if not os.path.exists(full_path):
-        return
-    tags_data = {}
-    tags_file = os.path.join(full_path, '.tags.txt')
-    existing_tags = read_tags_file(tags_file)
-    try:
-        for item in os.listdir(full_path):
-            item_path = os.path.join(full_path, item)
-            if os.path.isfile(item_path) and not is_hidden(item_path):
-                file_extension = os.path.splitext(item)[1].lower() or "unknown"
-                file_type = "image" if file_extension in ('.jpg', '.jpeg', '.png', '.webp') else file_extension[1:]
-                if item not in existing_tags or existing_tags[item]["tags"] == "Pending tags":
-                    # Note: process_image() is not called here as per your request, to be handled later
-                    tags = ["Pending tags"]  # Placeholder until process_image() is used
-                    description = "No description available"  # Placeholder
-                    tags_data[item] = {"format": file_type, "tags": ", ".join(tags), "description": description}
-                else:
-                    tags_data[item] = existing_tags[item]
-        if tags_data:
-            write_tags_file(tags_file, tags_data)
-            rel_path = os.path.relpath(full_path, ROOT_FOLDER).replace("\\", "/")
-            for item, data in tags_data.items():
-                full_item_path = os.path.join(rel_path, item).replace("\\", "/")
-                update_root_tags(os.path.join(ROOT_FOLDER, '.tags.txt'), full_item_path, data)
-    except Exception as e:
-        logger.error(f"Error updating tags for {full_path}: {e}")
 
+@functools.lru_cache(maxsize=EMBEDDING_QUERY_CACHE_SIZE)
+def embed_query(text):
+    """Return the vector of a semantic search query, computed in the embedding worker process."""
+    return get_embedding_pool().submit(compute_text_embedding, text).result(timeout=EMBEDDING_QUERY_TIMEOUT)
 
-def initialize_tags():
-    """Scan all folders and files, ensuring every non-hidden file is listed in subfolder and root .tags.txt."""
-    root_tags_file = os.path.join(ROOT_FOLDER, '.tags.txt')
-    all_tags = {}
-    for root, dirs, files in os.walk(ROOT_FOLDER):
-        rel_root = os.path.relpath(root, ROOT_FOLDER)
-        full_path_base = rel_root if rel_root != "." else ""
-        tags_file = os.path.join(root, '.tags.txt')
-        existing_tags = read_tags_file(tags_file)
-        tags_data = existing_tags.copy()
-        for item in files:
-            item_path = os.path.join(root, item)
-            if os.path.isfile(item_path) and not is_hidden(item_path):
-                full_item_path = os.path.join(full_path_base, item).replace("\\", "/")
-                file_extension = os.path.splitext(item)[1].lower() or "unknown"
-                file_type = "image" if file_extension in ('.jpg', '.jpeg', '.png', '.webp') else file_extension[1:]
-                if item not in existing_tags or existing_tags[item]["tags"] == "Pending tags":
-                    # Note: process_image() is not called here as per your request, to be handled later
-                    tags = ["untagged"]  # Placeholder until process_image() is used
-                    description = "No description available"  # Placeholder
-                    tags_data[item] = {"format": file_type, "tags": ", ".join(tags), "description": description}
-                    all_tags[full_item_path] = tags_data[item]
-                else:
-                    all_tags[full_item_path] = existing_tags[item]
-        if tags_data:
+
+class EmbeddingWorker:
+    """Thread that keeps the embedding index in step with the metadata store.
+
+    apply_metadata_changes() queues added, changed and deleted images. The thread applies them in order, in
+    batches of up to EMBEDDING_BATCH_SIZE: deletions drop their rows, and images whose file or description
+    changed since they were embedded go through the model in the embedding worker process. On start, every
+    image in the store is queued once; unchanged ones are skipped by version without running the model.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.counters = {"embedded": 0, "deleted": 0, "skipped": 0, "failed": 0}
+
+    def start(self):
+        images = {rel_path for rel_path, entry in get_metadata_store().get_all().items() if entry["format"] == "image"}
+        self.enqueue(sorted(images), [rel_path for rel_path in list(self.index.rows) if rel_path not in images])
+        self.thread = threading.Thread(target=self.run, name="embedding", daemon=True)
+        self.thread.start()
+        logger.info(f"Started embedding worker ({EMBEDDING_MODEL}, {len(self.index)} images embedded)")
+
+    def stop(self):
+        self.stop_event.set()
+        self.queue.put(None)
+        if self.thread is not None:
+            self.thread.join()
+        self.index.save(force=True)
+
+    def enqueue(self, rel_paths=(), deletes=()):
+        for rel_path in deletes:
+            self.queue.put((rel_path, True))
+        for rel_path in rel_paths:
+            self.queue.put((rel_path, False))
+
+    def run(self):
+        while not self.stop_event.is_set():
             try:
-                write_tags_file(tags_file, tags_data)
-            except Exception as e:
-                logger.error(f"Failed to update {tags_file}: {e}")
+                batch = [self.queue.get(timeout=EMBEDDING_SAVE_INTERVAL)]
+            except queue.Empty:
+                self.index.save()
                 continue
-    # Write to root .tags.txt
-    if all_tags:
+            while len(batch) < EMBEDDING_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            operations = {}  # rel_path -> deleted, the latest operation per path winning
+            for item in batch:
+                if item is not None:
+                    operations.pop(item[0], None)
+                    operations[item[0]] = item[1]
+            deletes = [rel_path for rel_path, deleted in operations.items() if deleted]
+            if deletes:
+                self.index.delete(deletes)
+                self.counters["deleted"] += len(deletes)
+            try:
+                self.embed([rel_path for rel_path, deleted in operations.items() if not deleted])
+            except Exception as e:
+                self.counters["failed"] += len(operations) - len(deletes)
+                logger.error(f"Error computing embeddings: {e}")
+            self.index.save()
+
+    def embed(self, rel_paths):
+        """Embed the images among rel_paths whose file or description changed since they were last embedded."""
+        store = get_metadata_store()
+        by_folder = {}
+        for rel_path in rel_paths:
+            folder, name = os.path.split(rel_path)
+            by_folder.setdefault(folder, []).append(name)
+        todo = {}
+        for folder, names in by_folder.items():
+            folder_tags = store.get_folder(folder)
+            for name in names:
+                entry = folder_tags.get(name)
+                if entry is None:
+                    continue  # Deleted since it was queued
+                rel_path = to_rel_path(folder, name)
+                try:
+                    file_stat = os.stat(os.path.join(ROOT_FOLDER, rel_path))
+                except OSError:
+                    continue
+                description = entry["description"] if entry["tags"] not in PLACEHOLDER_TAGS else ""
+                version = embedding_version(file_stat, description)
+                if self.index.versions.get(rel_path) == version:
+                    self.counters["skipped"] += 1
+                    continue
+                todo[rel_path] = (version, description)
+        if not todo:
+            return
+        start = time.time()
+        full_paths = [os.path.join(ROOT_FOLDER, rel_path) for rel_path in todo]
+        vectors = get_embedding_pool().submit(compute_embeddings, full_paths,
+                                              [description for _, description in todo.values()]).result()
+        embedded = {rel_path: (vector, version)
+                    for (rel_path, (version, _)), vector in zip(todo.items(), vectors) if vector is not None}
+        self.index.set(embedded)
+        self.counters["embedded"] += len(embedded)
+        self.counters["failed"] += len(todo) - len(embedded)
+        logger.debug(f"Embedded {len(embedded)} images in {time.time() - start:.2f}s")
+
+    def status(self):
+        with self.index.lock:
+            ann = self.index.ann
+            return {"running": self.thread is not None and not self.stop_event.is_set(), "model": EMBEDDING_MODEL,
+                    "embedded_images": len(self.index), "queue_depth": self.queue.qsize(),
+                    "ann_index_size": ann[1] if ann is not None else 0, **self.counters}
+
+
+embedding_worker = None
+
+
+def start_embedding_worker():
+    """Load the embedding index and start keeping it up to date, if that is not running yet."""
+    global embedding_worker
+    if embedding_worker is None:
+        if np is None or Image is None:
+            logger.error("Semantic search needs NumPy and Pillow; embeddings are disabled")
+            return None
+        embedding_worker = EmbeddingWorker(EmbeddingIndex(ROOT_FOLDER))
+        embedding_worker.start()
+        atexit.register(embedding_worker.index.save, force=True)
+    return embedding_worker
+
+
+def embedding_results(matches):
+    """Turn (rel_path, score) pairs into search result items, skipping files no longer in the search index."""
+    records = get_search_index().records
+    return [{
+        "name": os.path.basename(rel_path),
+        "path": rel_path,
+        "type": records[rel_path]["format"],
+        "tags": records[rel_path]["tags"],
+        "description": records[rel_path]["description"],
+        "score": round(score, 4)
+    } for rel_path, score in matches if rel_path in records]
+
+
+class FolderTreeCache:
+    """Subfolder names per folder, re-listed only when the folder's mtime changes or the watcher reports it.
+
+    The sidebar tree is built from these entries a level at a time, so expanding a node costs a stat per folder
+    shown instead of walking all of ROOT_FOLDER on every page load.
+    """
+
+    def __init__(self):
+        self.entries = {}  # rel_dir -> (mtime_ns, sorted subfolder names)
+        self.lock = threading.Lock()
+
+    def invalidate(self, rel_dir, recursive=False):
+        """Forget a folder's cached subfolders (and those of everything below it when recursive)."""
+        with self.lock:
+            self.entries.pop(rel_dir, None)
+            if recursive:
+                prefix = f"{rel_dir}/" if rel_dir else ""
+                for key in [key for key in self.entries if key.startswith(prefix)]:
+                    del self.entries[key]
+
+    def subfolders(self, rel_dir):
+        """Return the sorted subfolder names of a folder relative to ROOT_FOLDER; raises OSError if it is gone."""
+        full_dir = os.path.join(ROOT_FOLDER, rel_dir)
+        dir_mtime = os.stat(full_dir).st_mtime_ns
+        with self.lock:
+            entry = self.entries.get(rel_dir)
+        if entry is not None and entry[0] == dir_mtime:
+            return entry[1]
+        with metrics.timer("visionvault_directory_scan_seconds", kind="folders"), os.scandir(full_dir) as entries:
+            names = sorted((entry.name for entry in entries if entry.is_dir() and not hidden_files.is_hidden(entry)),
+                           key=str.lower)
+        # A folder modified within the mtime granularity could change again without its mtime moving
+        if time.time() - dir_mtime / 1e9 > SCAN_MTIME_GRACE:
+            with self.lock:
+                self.entries[rel_dir] = (dir_mtime, names)
+        return names
+
+
+folder_tree_cache = FolderTreeCache()
+
+
+def build_folder_nodes(rel_dir, depth=None):
+    """Return the subfolder nodes of rel_dir, nested depth levels deep (None for no limit)."""
+    nodes = []
+    for name in folder_tree_cache.subfolders(rel_dir):
+        child = to_rel_path(rel_dir, name)
         try:
-            write_tags_file(root_tags_file, all_tags)
-        except Exception as e:
-            logger.error(f"Failed to initialize root .tags.txt: {e}")
+            has_children = bool(folder_tree_cache.subfolders(child))
+        except OSError:
+            continue  # Removed since its parent was listed
+        node = {"name": name, "path": child, "has_children": has_children, "subfolders": []}
+        if has_children and (depth is None or depth > 1):
+            node["subfolders"] = build_folder_nodes(child, None if depth is None else depth - 1)
+        nodes.append(node)
+    return nodes
 
 
-def get_folder_tree(path, base_path=""):
-    """Build a nested dictionary of folders with full relative paths, excluding root."""
-    tree = []
-    if not os.path.exists(path):
-        return [{"name": "No folders found", "path": "", "subfolders": []}]
+def get_folder_tree(rel_path="", depth=None):
+    """Build a nested list of folders below rel_path with full relative paths, excluding rel_path itself.
+
+    depth limits how many levels are returned (None for the whole tree); has_children on each node tells the
+    sidebar which of the levels left out can be expanded on demand.
+    """
+    if not os.path.isdir(os.path.join(ROOT_FOLDER, rel_path)):
+        return [{"name": "No folders found", "path": "", "has_children": False, "subfolders": []}]
     try:
-        for item in os.listdir(path):
-            item_path = os.path.join(path, item)
-            rel_path = os.path.join(base_path, item) if base_path else item
-            if os.path.isdir(item_path):
-                folder = {
-                    "name": item,
-                    "path": rel_path,
-                    "subfolders": get_folder_tree(item_path, rel_path)
-                }
-                tree.append(folder)
+        return build_folder_nodes(rel_path, depth)
     except Exception as e:
-        logger.error(f"Error scanning folder {path}: {e}")
-        return [{"name": f"Error: {str(e)}", "path": "", "subfolders": []}]
-    return tree
+        logger.error(f"Error scanning folder {rel_path or ROOT_FOLDER}: {e}")
+        return [{"name": f"Error: {str(e)}", "path": "", "has_children": False, "subfolders": []}]
 
 
-def get_files_in_folder(path):
-    """Get list of all non-hidden files and subfolders in a folder."""
-    items = []
-    if not path or not os.path.exists(os.path.join(ROOT_FOLDER, path)):
-        return items  # Return empty if path doesn't exist or isn't specified
+class ListingCache:
+    """Sorted folder listings for the file grid, reused until the folder's mtime or its metadata changes.
+
+    Each folder keeps its scanned items plus one sorted, filtered view per (sort, order, type, tag) requested, so
+    paging through a large folder slices a cached list instead of re-listing and re-sorting it per page.
+    """
+
+    def __init__(self, max_dirs=LISTING_CACHE_SIZE):
+        self.max_dirs = max_dirs
+        self.entries = collections.OrderedDict()  # rel_dir -> {"mtime", "generation", "items", "views"}
+        self.generations = collections.Counter()  # rel_dir -> number of metadata changes applied to it
+        self.lock = threading.Lock()
+
+    def invalidate(self, rel_dirs):
+        """Drop cached listings of folders whose stored tags or descriptions changed."""
+        with self.lock:
+            for rel_dir in rel_dirs:
+                self.generations[rel_dir] += 1
+
+    def get(self, rel_dir, sort="name", order="asc", file_type=None, tag=None):
+        """Return the sorted, filtered items of a folder relative to ROOT_FOLDER."""
+        full_dir = os.path.join(ROOT_FOLDER, rel_dir)
+        dir_mtime = os.stat(full_dir).st_mtime_ns
+        with self.lock:
+            generation = self.generations[rel_dir]
+            entry = self.entries.get(rel_dir)
+            if entry is not None and entry["mtime"] == dir_mtime and entry["generation"] == generation:
+                self.entries.move_to_end(rel_dir)
+            else:
+                entry = None
+        if entry is None:
+            entry = {"mtime": dir_mtime, "generation": generation, "items": self.scan(rel_dir, full_dir), "views": {}}
+            # A folder modified within the mtime granularity could change again without its mtime moving
+            if time.time() - dir_mtime / 1e9 > SCAN_MTIME_GRACE:
+                with self.lock:
+                    self.entries[rel_dir] = entry
+                    self.entries.move_to_end(rel_dir)
+                    while len(self.entries) > self.max_dirs:
+                        self.entries.popitem(last=False)
+
+        view_key = (sort, order, file_type, tag)
+        view = entry["views"].get(view_key)
+        if view is None:
+            if len(entry["views"]) >= LISTING_VIEWS_PER_FOLDER:
+                entry["views"].clear()
+            view = entry["views"][view_key] = self.sort(self.filter(entry["items"], file_type, tag), sort, order)
+        return view
+
+    @staticmethod
+    def scan(rel_dir, full_dir):
+        """List a folder with os.scandir and attach each file's stored tags and description."""
+        files, subdirs = list_folder(full_dir)
+        existing_tags = get_metadata_store().get_folder(rel_dir)
+        items = [{"name": name, "path": to_rel_path(rel_dir, name), "type": "folder", "tags": ""}
+                 for name in subdirs]
+        for name, (size, mtime_ns, _inode) in files.items():
+            entry = existing_tags.get(name, {})
+            items.append({
+                "name": name,
+                "path": to_rel_path(rel_dir, name),
+                "type": get_file_type(name),
+                "tags": entry.get("tags", "untagged"),
+                "description": entry.get("description", "No description available"),
+                "size": size,
+                "mtime": mtime_ns / 1e9,
+                "version": file_version(size, mtime_ns)
+            })
+        return items
+
+    @staticmethod
+    def filter(items, file_type=None, tag=None):
+        """Keep items of one type ("folder", "image" or an extension) and/or carrying a tag (case-insensitive)."""
+        if file_type:
+            items = [item for item in items if item["type"] == file_type]
+        if tag:
+            tag = tag.strip().lower()
+            items = [item for item in items if tag in split_tags(item["tags"])]
+        return items
+
+    @staticmethod
+    def sort(items, sort="name", order="asc"):
+        """Sort folders (always first, by name) ahead of files sorted by name, mtime, size or type."""
+        sort_keys = {
+            "name": lambda item: item["name"].lower(),
+            "mtime": lambda item: (item["mtime"], item["name"].lower()),
+            "size": lambda item: (item["size"], item["name"].lower()),
+            "type": lambda item: (item["type"], item["name"].lower()),
+        }
+        folders = sorted((item for item in items if item["type"] == "folder"), key=sort_keys["name"],
+                         reverse=(order == "desc" and sort == "name"))
+        files = sorted((item for item in items if item["type"] != "folder"), key=sort_keys[sort],
+                       reverse=(order == "desc"))
+        return folders + files
+
+
+listing_cache = ListingCache()
+
+
+def encode_listing_cursor(offset, last_name):
+    """Encode the position after the last item of a page as an opaque cursor."""
+    payload = json.dumps({"offset": offset, "after": last_name}, ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_listing_cursor(cursor):
+    """Decode a cursor from encode_listing_cursor into (offset, last_name); raises ValueError if malformed."""
     try:
-        effective_path = os.path.join(ROOT_FOLDER, path)
-        tags_file = os.path.join(effective_path, '.tags.txt')
-        existing_tags = read_tags_file(tags_file)
-        for item in os.listdir(effective_path):
-            item_path = os.path.join(effective_path, item)
-            rel_path = os.path.relpath(item_path, ROOT_FOLDER).replace("\\", "/")  # Normalize to forward slashes
-            if os.path.isdir(item_path):
-                items.append({
-                    "name": item,
-                    "path": rel_path,
-                    "type": "folder",
-                    "tags": ""
-                })
-            elif os.path.isfile(item_path) and not is_hidden(item_path):
-                file_extension = os.path.splitext(item)[1].lower() or "unknown"
-                file_type = "image" if file_extension in ('.jpg', '.jpeg', '.png', '.webp') else file_extension[1:]
-                tags = existing_tags.get(item, {}).get("tags", "untagged")
-                description = existing_tags.get(item, {}).get("description", "No description available")
-                items.append({
-                    "name": item,
-                    "path": rel_path,
-                    "type": file_type,
-                    "tags": tags,
-                    "description": description
-                })
-        items.sort(key=lambda x: (x["type"] != "folder", x["name"].lower()))
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return max(int(payload["offset"]), 0), str(payload["after"])
     except Exception as e:
-        logger.error(f"Error listing items in {effective_path}: {e}")
-        return [{"name": f"Error: {str(e)}", "type": "error", "path": "", "tags": ""}]
-    return items
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def file_version(size, mtime_ns):
+    """Return the version token of a file's current contents, used in cache-busting URLs."""
+    return f"{mtime_ns:x}-{size:x}"
+
+
+def file_etag(rel_path, file_stat):
+    """Return a strong ETag for a library file: its stored content hash if still current, else its version."""
+    if CONTENT_HASHING:
+        record = get_metadata_store().get_hashes([rel_path]).get(rel_path)
+        current = (file_stat.st_size, file_stat.st_mtime_ns)
+        if record and record["hash"] and (record["size"], record["mtime"]) == current:
+            return record["hash"]
+    return file_version(file_stat.st_size, file_stat.st_mtime_ns)
+
+
+def send_media(full_path, etag, immutable=False, mimetype=None, accel_path=None):
+    """Send a file with a strong ETag, conditional GET (304) and byte-range (206) support.
+
+    immutable marks the response cacheable for a year, for URLs that change whenever the content does. With
+    MEDIA_ACCEL_REDIRECT_PREFIX set, files with an accel_path are handed to nginx, which serves ranges itself.
+    """
+    if MEDIA_ACCEL_REDIRECT_PREFIX and accel_path is not None:
+        response = app.response_class(
+            mimetype=mimetype or mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(accel_path)}"
+        response.set_etag(etag)
+        response = response.make_conditional(request)
+    else:
+        response = send_file(full_path, mimetype=mimetype, etag=etag, conditional=True)
+    if immutable:
+        response.headers['Cache-Control'] = f"public, max-age={MEDIA_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def parse_tag_list(tags):
+    """Accept tags as a list or a comma-separated string and return the stripped, non-empty tags."""
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise ValueError("tags must be a list or a comma-separated string")
+    return [tag.strip() for tag in tags if tag.strip()]
+
+
+def merge_tags(tags, added=(), removed=()):
+    """Return a tags string with tags added and removed (case-insensitively), keeping the existing order."""
+    removed = {tag.lower() for tag in removed}
+    merged = [tag.strip() for tag in tags.split(",") if tag.strip()] if tags not in PLACEHOLDER_TAGS else []
+    merged = [tag for tag in merged if tag.lower() not in removed]
+    seen = {tag.lower() for tag in merged}
+    for tag in added:
+        if tag.lower() not in seen:
+            merged.append(tag)
+            seen.add(tag.lower())
+    return ", ".join(merged) or "untagged"
+
+
+class BulkBatch:
+    """A /api/bulk request: operations applied one by one, with their metadata changes committed together.
+
+    Each folder's entries are read from the store once and then kept as the operations leave them, filesystem
+    changes happen as each operation runs, and commit() writes every metadata change in one batch, so each
+    affected .tags.txt (or the database) is written once however many files in it changed.
+    """
+
+    def __init__(self):
+        self.store = get_metadata_store()
+        self.folders = {}  # folder -> {name: entry}, as the operations so far have left it
+        self.changes = {}  # rel_path -> new entry, or None once removed
+        self.moves = {}  # new rel_path -> rel_path it had in the store, to carry content hashes over
+        self.handlers = {"retag": self.retag, "add_tags": self.add_tags, "remove_tags": self.remove_tags,
+                         "rename": self.rename, "move": self.move, "delete": self.delete}
+
+    def entries(self, folder):
+        if folder not in self.folders:
+            self.folders[folder] = dict(self.store.get_folder(folder))
+        return self.folders[folder]
+
+    def resolve(self, path):
+        """Return (rel_path, folder, name, full path) of an existing library file."""
+        rel_path = to_rel_path(path) if isinstance(path, str) else ""
+        folder, name = os.path.split(rel_path)
+        full_path = safe_join(ROOT_FOLDER, rel_path) if rel_path else None
+        if full_path is None or is_metadata_file(name) or not os.path.isfile(full_path):
+            raise FileNotFoundError(f"File not found: {path}")
+        return rel_path, folder, name, full_path
+
+    def entry(self, folder, name):
+        entry = self.entries(folder).get(name)
+        if entry is None:
+            entry = {"format": get_file_type(name), "tags": "untagged", "description": "No description available"}
+        return dict(entry)
+
+    def set_entry(self, folder, name, entry):
+        self.entries(folder)[name] = entry
+        self.changes[to_rel_path(folder, name)] = entry
+
+    def remove_entry(self, folder, name):
+        self.entries(folder).pop(name, None)
+        self.changes[to_rel_path(folder, name)] = None
+
+    def apply(self, operation):
+        """Apply one operation and return its result; raises ValueError or OSError if it can't be applied."""
+        if not isinstance(operation, dict):
+            raise ValueError("Each operation must be an object")
+        handler = self.handlers.get(operation.get("op"))
+        if handler is None:
+            raise ValueError(f"Unknown op {operation.get('op')!r}; expected one of {', '.join(self.handlers)}")
+        return handler(operation, *self.resolve(operation.get("path")))
+
+    def retag(self, operation, rel_path, folder, name, full_path):
+        entry = self.entry(folder, name)
+        entry["tags"] = merge_tags("untagged", parse_tag_list(operation.get("tags", "")))
+        if "description" in operation:
+            if not isinstance(operation["description"], str):
+                raise ValueError("description must be a string")
+            entry["description"] = operation["description"].strip() or "No description available"
+        self.set_entry(folder, name, entry)
+        return {"path": rel_path, "tags": entry["tags"]}
+
+    def add_tags(self, operation, rel_path, folder, name, full_path):
+        entry = self.entry(folder, name)
+        entry["tags"] = merge_tags(entry["tags"], added=parse_tag_list(operation.get("tags", "")))
+        self.set_entry(folder, name, entry)
+        return {"path": rel_path, "tags": entry["tags"]}
+
+    def remove_tags(self, operation, rel_path, folder, name, full_path):
+        entry = self.entry(folder, name)
+        entry["tags"] = merge_tags(entry["tags"], removed=parse_tag_list(operation.get("tags", "")))
+        self.set_entry(folder, name, entry)
+        return {"path": rel_path, "tags": entry["tags"]}
+
+    def rename(self, operation, rel_path, folder, name, full_path):
+        new_name = operation.get("name")
+        # Dot-prefixed names (bookkeeping files among them) would hide the file from listings and scans
+        if (not isinstance(new_name, str) or not new_name.strip() or new_name.strip().startswith(".")
+                or any(separator in new_name for separator in "/\\") or is_metadata_file(new_name.strip())):
+            raise ValueError("name must be a plain file name that doesn't start with a dot")
+        return self.relocate(rel_path, folder, name, full_path, folder, new_name.strip())
+
+    def move(self, operation, rel_path, folder, name, full_path):
+        target = operation.get("folder")
+        if not isinstance(target, str):
+            raise ValueError("folder must be a folder path")
+        target_rel = to_rel_path(target)
+        target_full = safe_join(ROOT_FOLDER, target_rel) if target_rel else ROOT_FOLDER
+        # Hidden folders, the metadata sidecar among them, are never listed or scanned
+        if (target_full is None or any(part.startswith(".") for part in target_rel.split("/"))
+                or not os.path.isdir(target_full)):
+            raise FileNotFoundError(f"Folder not found: {target}")
+        return self.relocate(rel_path, folder, name, full_path, target_rel, name)
+
+    def relocate(self, rel_path, folder, name, full_path, new_folder, new_name):
+        new_rel_path = to_rel_path(new_folder, new_name)
+        if new_rel_path == rel_path:
+            return {"path": rel_path}
+        new_full_path = os.path.join(ROOT_FOLDER, new_folder, new_name)
+        if os.path.exists(new_full_path):
+            raise FileExistsError(f"{new_rel_path} already exists")
+        os.rename(full_path, new_full_path)
+        entry = self.entry(folder, name)
+        entry["format"] = get_file_type(new_name)
+        self.remove_entry(folder, name)
+        self.set_entry(new_folder, new_name, entry)
+        self.moves[new_rel_path] = self.moves.pop(rel_path, rel_path)
+        return {"path": rel_path, "new_path": new_rel_path}
+
+    def delete(self, operation, rel_path, folder, name, full_path):
+        os.remove(full_path)
+        self.remove_entry(folder, name)
+        self.moves.pop(rel_path, None)
+        return {"path": rel_path}
+
+    def commit(self):
+        """Write all metadata changes as one batch, keeping the content hashes of renamed and moved files."""
+        upserts = {rel_path: entry for rel_path, entry in self.changes.items() if entry is not None}
+        deletes = [rel_path for rel_path, entry in self.changes.items() if entry is None]
+        if not upserts and not deletes:
+            return
+        hashes = self.store.get_hashes(list(self.moves.values())) if self.moves else {}
+        apply_metadata_changes(upserts, deletes)
+        moved = {new_rel_path: hashes[rel_path] for new_rel_path, rel_path in self.moves.items() if rel_path in hashes}
+        if moved:
+            self.store.set_hashes(moved)
+            duplicate_cache.invalidate()
+        logger.info(f"Bulk update wrote {len(upserts)} entries and removed {len(deletes)}")
+
+
+def apply_bulk_operations(operations):
+    """Apply /api/bulk operations in order and return one result per operation (see BulkBatch)."""
+    batch = BulkBatch()
+    results = []
+    for operation in operations:
+        try:
+            results.append({"status": "success", **batch.apply(operation)})
+        except (ValueError, OSError) as e:
+            path = operation.get("path") if isinstance(operation, dict) else None
+            results.append({"status": "error", "path": path, "error": str(e)})
+    batch.commit()
+    return results
+
+
+def get_files_in_folder(path, limit=None, cursor=None, sort="name", order="asc", file_type=None, tag=None):
+    """Get one page of non-hidden files and subfolders in a folder.
+
+    Returns (items, next_cursor, total). The cursor remembers the offset and the name of the last item served;
+    if the listing changed since, the next page resumes after that item wherever it now sorts.
+    """
+    if not path or not os.path.exists(os.path.join(ROOT_FOLDER, path)):
+        return [], None, 0  # Return empty if path doesn't exist or isn't specified
+    items = listing_cache.get(to_rel_path(path), sort, order, file_type, tag)
+
+    start = 0
+    if cursor:
+        offset, last_name = decode_listing_cursor(cursor)
+        if 0 < offset <= len(items) and items[offset - 1]["name"] == last_name:
+            start = offset
+        else:
+            start = next((i + 1 for i, item in enumerate(items) if item["name"] == last_name),
+                         min(offset, len(items)))
+    page = items[start:start + limit] if limit else items[start:]
+    end = start + len(page)
+    next_cursor = encode_listing_cursor(end, page[-1]["name"]) if page and end < len(items) else None
+    return page, next_cursor, len(items)
+
+
+profile_lock = threading.Lock()  # cProfile and pyinstrument can only profile one request at a time
+
+
+def start_profiler():
+    """Start profiling the current request, unless another request is being profiled."""
+    if not profile_lock.acquire(blocking=False):
+        return None
+    profiler = PyinstrumentProfiler() if PyinstrumentProfiler is not None else cProfile.Profile()
+    if PyinstrumentProfiler is not None:
+        profiler.start()
+    else:
+        profiler.enable()
+    return profiler
+
+
+def stop_profiler(profiler, response=None):
+    """Stop profiling and, given the response, write the report to PROFILE_DIR and name it in a header."""
+    try:
+        if PyinstrumentProfiler is not None:
+            profiler.stop()
+        else:
+            profiler.disable()
+        if response is None:
+            return
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unmatched'}-"
+                                         f"{os.urandom(3).hex()}")
+        if PyinstrumentProfiler is not None:
+            report = f"{base}.html"
+            with open(report, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+        else:
+            report = f"{base}.prof"
+            profiler.dump_stats(report)
+            with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+                pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(50)
+        response.headers['X-Profile-Report'] = os.path.basename(report)
+        logger.info(f"Wrote profile of {request.method} {request.full_path} to {report}")
+    finally:
+        profile_lock.release()
+
+
+# Request timing, and profiling with ?profile=1 when VISIONVAULT_PROFILING=1
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if PROFILING_ENABLED and request.args.get('profile') == '1':
+        g.profiler = start_profiler()
+
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or "unmatched"
+    metrics.observe("visionvault_http_request_duration_seconds", time.perf_counter() - g.request_start,
+                    endpoint=endpoint)
+    metrics.inc("visionvault_http_requests_total", endpoint=endpoint, method=request.method,
+                status=response.status_code)
+    if response.content_length:
+        metrics.inc("visionvault_http_response_bytes_total", response.content_length, endpoint=endpoint)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        stop_profiler(profiler, response)
+    return response
+
+
+@app.teardown_request
+def release_profiler(exc):
+    profiler = g.pop('profiler', None)  # Still set if the request failed before after_request ran
+    if profiler is not None:
+        stop_profiler(profiler)
 
 
 # Serve the main page with folder tree
 @app.route('/')
 def index():
-    folder_tree = get_folder_tree(ROOT_FOLDER)
+    folder_tree = get_folder_tree(depth=1)  # Deeper levels are fetched as nodes are expanded
     return render_template('index.html', folder_tree=folder_tree)
 
 
@@ -285,24 +3916,80 @@ def static_files(filename):
 # Serve actual image files
 @app.route('/files/<path:file_path>')
 def serve_file(file_path):
-    full_path = os.path.join(ROOT_FOLDER, file_path)
-    if not os.path.exists(full_path) or not os.path.isfile(full_path):
+    full_path = safe_join(ROOT_FOLDER, file_path)
+    if full_path is None or is_metadata_file(os.path.basename(full_path)):
+        abort(404)
+    try:
+        file_stat = os.stat(full_path)
+    except OSError:
         abort(404)
-    return send_from_directory(ROOT_FOLDER, file_path, as_attachment=False)
+    if not stat.S_ISREG(file_stat.st_mode):
+        abort(404)
+    rel_path = to_rel_path(file_path)
+    immutable = request.args.get('v') == file_version(file_stat.st_size, file_stat.st_mtime_ns)
+    return send_media(full_path, file_etag(rel_path, file_stat), immutable, accel_path=rel_path)
+
+
+# Serve grid thumbnails, generated on first request and cached on disk
+@app.route('/thumbs/<int:size>/<path:file_path>')
+def serve_thumbnail(size, file_path):
+    full_path = safe_join(ROOT_FOLDER, file_path)
+    if size not in THUMBNAIL_SIZES or full_path is None or not os.path.isfile(full_path):
+        abort(404)
+    if get_file_type(file_path) != "image":
+        abort(404)
+    rel_path = to_rel_path(file_path)
+    file_stat = os.stat(full_path)
+    immutable = request.args.get('v') == file_version(file_stat.st_size, file_stat.st_mtime_ns)
+    if Image is None:
+        return send_media(full_path, file_etag(rel_path, file_stat), immutable, accel_path=rel_path)
+    try:
+        thumb_path = get_thumbnail(rel_path, size)
+    except Exception as e:
+        logger.error(f"Error generating thumbnail for {file_path}: {e}")
+        return send_media(full_path, file_etag(rel_path, file_stat), immutable, accel_path=rel_path)
+    # The cache file name is already a digest of the source path, mtime, size and thumbnail settings
+    thumb_etag = os.path.splitext(os.path.basename(thumb_path))[0]
+    return send_media(thumb_path, thumb_etag, immutable, mimetype=f"image/{THUMBNAIL_FORMAT}")
 
 
-# API endpoint to fetch folder tree
+# API endpoint to fetch folder tree; path and depth fetch one branch at a time, ETags let unchanged trees 304
 @app.route('/api/folder-tree')
 def api_folder_tree():
-    folder_tree = get_folder_tree(ROOT_FOLDER)
-    return jsonify(folder_tree)
+    rel_path = to_rel_path(request.args.get('path', ''))
+    if safe_join(ROOT_FOLDER, rel_path) is None:
+        abort(404)
+    try:
+        depth = int(request.args['depth']) if request.args.get('depth') else None
+    except ValueError:
+        return jsonify({"error": "depth must be an integer."}), 400
+    if depth is not None and depth < 1:
+        return jsonify({"error": "depth must be at least 1."}), 400
+    folder_tree = get_folder_tree(rel_path, depth)
+    response = jsonify(folder_tree)
+    response.set_etag(hashlib.blake2b(response.get_data(), digest_size=16).hexdigest())
+    response.headers['Cache-Control'] = 'no-cache'  # Always revalidate; an unchanged tree costs a 304
+    return response.make_conditional(request)
 
 
 # API endpoint to fetch files and folders in a folder with path components for breadcrumbs
 @app.route('/api/files/<path:folder_path>')
 def api_files(folder_path):
     try:
-        items = get_files_in_folder(folder_path)
+        try:
+            limit = min(max(int(request.args.get('limit', LISTING_DEFAULT_LIMIT)), 1), LISTING_MAX_LIMIT)
+        except ValueError:
+            return jsonify({"error": "limit must be an integer."}), 400
+        sort = request.args.get('sort', 'name')
+        order = request.args.get('order', 'asc')
+        if sort not in LISTING_SORT_KEYS or order not in ('asc', 'desc'):
+            return jsonify({"error": f"sort must be one of {', '.join(LISTING_SORT_KEYS)} and order asc or desc."}), 400
+        try:
+            items, next_cursor, total = get_files_in_folder(
+                folder_path, limit=limit, cursor=request.args.get('cursor'), sort=sort, order=order,
+                file_type=request.args.get('type') or None, tag=request.args.get('tag') or None)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         breadcrumbs = []
         if folder_path:
             current_path = ""
@@ -310,7 +3997,8 @@ def api_files(folder_path):
                 if part:
                     current_path = os.path.join(current_path, part) if current_path else part
                     breadcrumbs.append({"name": part, "path": current_path})
-        return jsonify({"items": items, "breadcrumbs": breadcrumbs if breadcrumbs else None})
+        return jsonify({"items": items, "next_cursor": next_cursor, "total": total, "limit": limit,
+                        "breadcrumbs": breadcrumbs if breadcrumbs else None})
     except Exception as e:
         logger.error(f"API error for folder_path {folder_path}: {e}")
         return jsonify({"error": str(e)}), 500
@@ -320,24 +4008,14 @@ def api_files(folder_path):
 @app.route('/api/update-tags/<path:folder_path>', methods=['POST'])
 def update_folder_tags(folder_path):
     try:
-        full_path = os.path.join(ROOT_FOLDER, folder_path) if folder_path else ROOT_FOLDER
-        tags_file = os.path.join(full_path, '.tags.txt')
-        root_tags_file = os.path.join(ROOT_FOLDER, '.tags.txt')
         update_tags(folder_path)
-        rel_path = os.path.relpath(full_path, ROOT_FOLDER).replace("\\", "/")
-        for item in os.listdir(full_path):
-            if os.path.isfile(os.path.join(full_path, item)) and not is_hidden(os.path.join(full_path, item)):
-                full_item_path = os.path.join(rel_path, item).replace("\\", "/")
-                tags_data = read_tags_file(tags_file).get(item, {"format": "unknown", "tags": "untagged",
-                                                                 "description": "No description available"})
-                update_root_tags(root_tags_file, full_item_path, tags_data)
         return jsonify({"status": "success"})
     except Exception as e:
         logger.error(f"Error updating tags for {folder_path}: {e}")
         return jsonify({"error": str(e)}), 500
 
 
-# Update file details (name, tags, description) in .tags.txt
+# Update file details (name, tags, description) in the metadata store
 @app.route('/api/update-file/<path:file_path>', methods=['POST'])
 def update_file(file_path):
     try:
@@ -350,17 +4028,18 @@ def update_file(file_path):
         current_name = os.path.basename(file_path)
 
         full_path = os.path.join(ROOT_FOLDER, folder_path)
-        tags_file = os.path.join(full_path, '.tags.txt')
-        root_tags_file = os.path.join(ROOT_FOLDER, '.tags.txt')
+        folder_rel = to_rel_path(folder_path)
 
         if not os.path.exists(full_path) or not os.path.isfile(os.path.join(full_path, current_name)):
             return jsonify({"error": "File not found"}), 404
 
-        existing_tags = read_tags_file(tags_file)
+        existing_tags = {}
+        existing_entry = get_metadata_store().get(to_rel_path(folder_rel, current_name))
+        if existing_entry is not None:
+            existing_tags[current_name] = existing_entry
         updated = False
         if current_name in existing_tags:
-            file_extension = os.path.splitext(current_name)[1].lower() or "unknown"
-            file_type = "image" if file_extension in ('.jpg', '.jpeg', '.png', '.webp') else file_extension[1:]
+            file_type = get_file_type(current_name)
             existing_tags[current_name] = {
                 "format": file_type,
                 "tags": new_tags if new_tags != "untagged" else existing_tags[current_name]["tags"],
@@ -375,7 +4054,7 @@ def update_file(file_path):
                     os.rename(os.path.join(full_path, current_name), new_full_path)
                     if current_name in existing_tags:
                         existing_tags[new_name] = existing_tags.pop(current_name)
-                        existing_tags[new_name]["format"] = file_type
+                        existing_tags[new_name]["format"] = get_file_type(new_name)
                         existing_tags[new_name]["tags"] = new_tags if new_tags != "untagged" else \
                         existing_tags[new_name]["tags"]
                         existing_tags[new_name]["description"] = new_description
@@ -389,13 +4068,11 @@ def update_file(file_path):
 
         if updated:
             try:
-                write_tags_file(tags_file, existing_tags)
-                rel_path = os.path.relpath(full_path, ROOT_FOLDER).replace("\\", "/")
-                full_item_path = os.path.join(rel_path, new_name if new_name else current_name).replace("\\", "/")
-                update_root_tags(root_tags_file, full_item_path,
-                                 existing_tags.get(new_name if new_name else current_name))
+                final_name = new_name if new_name and new_name in existing_tags else current_name
+                deletes = [to_rel_path(folder_rel, current_name)] if final_name != current_name else []
+                apply_metadata_changes({to_rel_path(folder_rel, final_name): existing_tags[final_name]}, deletes)
             except Exception as e:
-                logger.error(f"Failed to update {tags_file} or root: {e}")
+                logger.error(f"Failed to update metadata for {file_path}: {e}")
                 return jsonify({"error": str(e)}), 500
 
         return jsonify(
@@ -405,7 +4082,7 @@ def update_file(file_path):
         return jsonify({"error": str(e)}), 500
 
 
-# Delete file and update .tags.txt
+# Delete file and its metadata entry
 @app.route('/api/delete-file/<path:file_path>', methods=['DELETE'])
 def delete_file(file_path):
     try:
@@ -414,15 +4091,13 @@ def delete_file(file_path):
 
         full_path = os.path.join(ROOT_FOLDER, folder_path)
         file_full_path = os.path.join(full_path, current_name)
-        tags_file = os.path.join(full_path, '.tags.txt')
-        root_tags_file = os.path.join(ROOT_FOLDER, '.tags.txt')
 
         if not os.path.exists(file_full_path) or not os.path.isfile(file_full_path):
             return jsonify({"error": "File not found"}), 404
 
         try:
             os.remove(file_full_path)
-            logger.info(f"Successfully deleted file: {file_full_path}")
+            logger.debug(f"Successfully deleted file: {file_full_path}")
         except PermissionError as e:
             logger.error(f"Permission warning for deleting {file_full_path}: {e}")
             if not os.path.exists(file_full_path):
@@ -433,21 +4108,14 @@ def delete_file(file_path):
             logger.error(f"Error deleting file {file_full_path}: {e}")
             return jsonify({"error": str(e)}), 500
 
-        if os.path.exists(tags_file):
-            try:
-                existing_tags = read_tags_file(tags_file)
-                if current_name in existing_tags:
-                    del existing_tags[current_name]
-                    write_tags_file(tags_file, existing_tags)
-                rel_path = os.path.relpath(full_path, ROOT_FOLDER).replace("\\", "/")
-                full_item_path = os.path.join(rel_path, current_name).replace("\\", "/")
-                update_root_tags(root_tags_file, full_item_path, None, action="delete")
-            except PermissionError as e:
-                logger.error(f"Permission denied updating {tags_file}: {e}")
-                return jsonify({"error": f"Permission denied: {str(e)}. Grant write permissions to {tags_file}."}), 500
-            except Exception as e:
-                logger.error(f"Error updating tags for {tags_file}: {e}")
-                return jsonify({"error": str(e)}), 500
+        try:
+            apply_metadata_changes(deletes=[to_rel_path(folder_path, current_name)])
+        except PermissionError as e:
+            logger.error(f"Permission denied updating metadata for {file_path}: {e}")
+            return jsonify({"error": f"Permission denied: {str(e)}. Grant write permissions to {ROOT_FOLDER}."}), 500
+        except Exception as e:
+            logger.error(f"Error updating metadata for {file_path}: {e}")
+            return jsonify({"error": str(e)}), 500
 
         return jsonify({"status": "success"})
     except Exception as e:
@@ -455,53 +4123,244 @@ def delete_file(file_path):
         return jsonify({"error": str(e)}), 500
 
 
+# Apply a list of retag, add/remove tag, rename, move and delete operations with one metadata write
+@app.route('/api/bulk', methods=['POST'])
+def bulk_update():
+    try:
+        data = request.get_json(silent=True) or {}
+        operations = data.get('operations') if isinstance(data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return jsonify({"error": "Provide a non-empty list of operations."}), 400
+        if len(operations) > BULK_MAX_OPERATIONS:
+            return jsonify({"error": f"At most {BULK_MAX_OPERATIONS} operations per request."}), 400
+        results = apply_bulk_operations(operations)
+        failed = sum(1 for result in results if result["status"] != "success")
+        return jsonify({"status": "success" if not failed else "partial", "succeeded": len(results) - failed,
+                        "failed": failed, "results": results})
+    except Exception as e:
+        logger.error(f"Error applying bulk operations: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# Stream the whole catalog as JSON Lines (default) or Parquet (?format=parquet)
+@app.route('/api/export')
+def api_export():
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in CATALOG_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(CATALOG_FORMATS)}"}), 400
+    if fmt == "parquet" and pq is None:
+        return jsonify({"error": "Parquet export requires pyarrow"}), 503
+    return app.response_class(export_catalog(get_metadata_store(), fmt), mimetype=CATALOG_FORMATS[fmt],
+                              headers={"Content-Disposition": f"attachment; filename=visionvault-catalog.{fmt}"})
+
+
+# Restore metadata from an exported catalog, sent as the request body or as a "file" upload
+@app.route('/api/import', methods=['POST'])
+def api_import():
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in CATALOG_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(CATALOG_FORMATS)}"}), 400
+    if fmt == "parquet" and pq is None:
+        return jsonify({"error": "Parquet import requires pyarrow"}), 503
+    try:
+        upload = request.files.get('file')
+        return jsonify(import_catalog_file(upload.stream if upload is not None else request.stream, fmt))
+    except ValueError as e:  # Also raised by pyarrow for files that aren't Parquet
+        return jsonify({"error": f"Invalid catalog: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error importing catalog: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# Prometheus metrics
+@app.route('/metrics')
+def metrics_endpoint():
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+# Watcher status and counters
+@app.route('/api/watcher/status')
+def watcher_status():
+    if watcher is None:
+        return jsonify({"running": False})
+    return jsonify(watcher.status())
+
+
+# AI tagging queue depth, throughput and counters
+@app.route('/api/tagging/status')
+def tagging_status():
+    if tagging_worker is None:
+        return jsonify({"running": False})
+    return jsonify(tagging_worker.status())
+
+
+# Start (or wake) the AI tagging workers, optionally retrying failed jobs
+@app.route('/api/tagging/run', methods=['POST'])
+def run_tagging():
+    try:
+        worker = start_tagging_worker()
+        retried = worker.queue.retry_failed() if request.args.get('retry_failed') == '1' else 0
+        queued = worker.discover(requeue=True)
+        return jsonify({"status": "success", "queued": queued, "retried": retried,
+                        "queue_depth": worker.queue.counts().get("pending", 0)})
+    except Exception as e:
+        logger.error(f"Error starting AI tagging: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# Exact (content hash) and near (perceptual hash) duplicate groups
+@app.route('/api/duplicates')
+def api_duplicates():
+    try:
+        threshold = min(max(int(request.args.get('threshold', NEAR_DUPLICATE_THRESHOLD)), 0), 7)
+        near = request.args.get('near', '1') == '1'
+        return jsonify(duplicate_cache.get(threshold, near))
+    except ValueError:
+        return jsonify({"error": "threshold must be an integer."}), 400
+    except Exception as e:
+        logger.error(f"Error finding duplicates: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# Images that look like (or are described like) a given image
+@app.route('/api/similar/<path:file_path>')
+def api_similar(file_path):
+    try:
+        if embedding_worker is None:
+            return jsonify({"error": "Semantic search is disabled; set VISIONVAULT_EMBEDDINGS=1."}), 503
+        try:
+            limit = min(max(int(request.args.get('limit', SIMILAR_DEFAULT_LIMIT)), 1), SEARCH_MAX_LIMIT)
+        except ValueError:
+            return jsonify({"error": "limit must be an integer."}), 400
+        rel_path = to_rel_path(file_path)
+        vector = embedding_worker.index.vector(rel_path)
+        if vector is None:
+            return jsonify({"error": "This file has no embedding (yet)."}), 404
+        results = embedding_results(embedding_worker.index.nearest(vector, limit, exclude=rel_path))
+        return jsonify({"items": results, "total": len(results), "limit": limit, "offset": 0,
+                        "breadcrumbs": [{"name": f"Similar to '{os.path.basename(rel_path)}'", "path": ""}]})
+    except Exception as e:
+        logger.error(f"Error finding images similar to {file_path}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# Embedding index size, queue depth and counters
+@app.route('/api/embeddings/status')
+def embeddings_status():
+    if embedding_worker is None:
+        return jsonify({"running": False})
+    return jsonify(embedding_worker.status())
+
+
 # Search endpoint
 @app.route('/api/search')
 def search_files():
     try:
-        query = request.args.get('q', '').lower()
+        query = request.args.get('q', '').strip()
         if not query:
             return jsonify({"error": "Please provide a search query."}), 400
+        try:
+            limit = min(max(int(request.args.get('limit', SEARCH_DEFAULT_LIMIT)), 1), SEARCH_MAX_LIMIT)
+            offset = max(int(request.args.get('offset', 0)), 0)
+        except ValueError:
+            return jsonify({"error": "limit and offset must be integers."}), 400
 
-        root_tags_file = os.path.join(ROOT_FOLDER, '.tags.txt')
-        results = []
-        if os.path.exists(root_tags_file):
-            toggle_hidden_file(root_tags_file, hide=False)  # Unhide before reading
-            try:
-                with open(root_tags_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        if ':' in line:
-                            parts = line.strip().split(':', 3)
-                            if len(parts) == 4:
-                                full_path, file_format, tags, desc = parts
-                                if (query in full_path.lower() or
-                                        query in tags.lower() or
-                                        query in desc.lower()):
-                                    results.append({
-                                        "name": os.path.basename(full_path),
-                                        "path": full_path,
-                                        "type": file_format,
-                                        "tags": tags,
-                                        "description": desc
-                                    })
-                logger.info(f"Successfully read and closed {root_tags_file}")
-            except PermissionError as e:
-                logger.error(f"Permission denied reading {root_tags_file}: {e}")
-                return jsonify(
-                    {"error": f"Permission denied: {str(e)}. Grant read permissions to {root_tags_file}."}), 500
-            except Exception as e:
-                logger.error(f"Error reading {root_tags_file}: {e}")
-                return jsonify({"error": str(e)}), 500
-            finally:
-                toggle_hidden_file(root_tags_file, hide=True)  # Re-hide after reading
+        if request.args.get('mode', 'keyword') == 'semantic':
+            if embedding_worker is None:
+                return jsonify({"error": "Semantic search is disabled; set VISIONVAULT_EMBEDDINGS=1."}), 503
+            # Every image is scored, but only the SEMANTIC_MAX_RESULTS nearest are ranked results
+            ranked = min(SEMANTIC_MAX_RESULTS, len(embedding_worker.index))
+            wanted = min(offset + limit, ranked)
+            matches = embedding_worker.index.nearest(embed_query(query), wanted) if offset < wanted else []
+            total = ranked if len(matches) >= wanted else len(matches)
+            return jsonify({"items": embedding_results(matches[offset:]), "total": total,
+                            "limit": limit, "offset": offset, "facets": {"tags": [], "formats": []},
+                            "breadcrumbs": [{"name": f"Semantic Results for '{query}'", "path": ""}]})
+
+        try:
+            total, matches, facets = get_search_index().search(query, limit=limit, offset=offset)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        results = [{
+            "name": os.path.basename(full_path),
+            "path": full_path,
+            "type": entry["format"],
+            "tags": entry["tags"],
+            "description": entry["description"]
+        } for full_path, entry in matches]
 
-        return jsonify({"items": results, "breadcrumbs": [{"name": f"Search Results for '{query}'", "path": ""}]})
+        return jsonify({"items": results, "total": total, "limit": limit, "offset": offset, "facets": facets,
+                        "breadcrumbs": [{"name": f"Search Results for '{query}'", "path": ""}]})
     except Exception as e:
         logger.error(f"Error searching files: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+def claim_library():
+    """Take the instance lock for a CLI command that writes metadata, which a running server wouldn't see."""
+    try:
+        acquire_instance_lock()
+    except RuntimeError as e:
+        raise click.ClickException(f"{e}. Stop the server first.")
+
+
+# Migrate existing .tags.txt files into the configured metadata store
+@app.cli.command('import-tags')
+def import_tags_command():
+    claim_library()
+    count = import_tags_files(get_metadata_store(), ROOT_FOLDER)
+    print(f"Imported {count} entries into the {METADATA_BACKEND} metadata store")
+
+
+# Write the metadata store back out in the .tags.txt format
+@app.cli.command('export-tags')
+def export_tags_command():
+    count = export_tags_files(get_metadata_store(), ROOT_FOLDER)
+    print(f"Exported {count} entries to .tags.txt files")
+
+
+# Stream the catalog to a JSON Lines or Parquet file ("-" for stdout)
+@app.cli.command('export-catalog')
+@click.argument('output')
+@click.option('--format', 'fmt', type=click.Choice(list(CATALOG_FORMATS)), help="Default: from the file extension")
+def export_catalog_command(output, fmt):
+    fmt = fmt or catalog_format(output)
+    if fmt == "parquet" and pq is None:
+        raise click.ClickException("Parquet export requires pyarrow")
+    store = get_metadata_store()
+    with click.open_file(output, 'wb') as f:
+        for chunk in export_catalog(store, fmt):
+            f.write(chunk)
+    click.echo(f"Exported {store.count()} entries to {output}", err=output == "-")
+
+
+# Restore metadata from a catalog written by export-catalog or /api/export ("-" for stdin)
+@app.cli.command('import-catalog')
+@click.argument('catalog')
+@click.option('--format', 'fmt', type=click.Choice(list(CATALOG_FORMATS)), help="Default: from the file extension")
+def import_catalog_command(catalog, fmt):
+    fmt = fmt or catalog_format(catalog)
+    if fmt == "parquet" and pq is None:
+        raise click.ClickException("Parquet import requires pyarrow")
+    claim_library()
+    with click.open_file(catalog, 'rb') as f:
+        stats = import_catalog_file(f, fmt)
+    print(f"Imported {stats['imported']} entries ({stats['hashes']} with content hashes); skipped "
+          f"{stats['untagged']} untagged records for existing entries, {stats['missing']} missing files and "
+          f"{stats['invalid']} invalid records")
+
+
 if __name__ == '__main__':
-    # Run on startup: initialize tags for all non-hidden files, setting new files to "untagged" without AI processing
-    initialize_tags()
-    app.run(host='127.0.0.1', port=5000, debug=True)
\ No newline at end of file
+    # With the debug reloader, the parent process only restarts the serving child process (WERKZEUG_RUN_MAIN)
+    # when the code changes; the child claims the library for its lifetime and does all the startup work
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        acquire_instance_lock()  # One process per library
+        # Initialize tags for all non-hidden files, setting new files to "untagged" without AI processing
+        initialize_tags()
+        if WATCHER_ENABLED:
+            start_watcher()
+        if TAGGING_ENABLED:
+            start_tagging_worker()
+        if EMBEDDINGS_ENABLED:
+            start_embedding_worker()
+    app.run(host='127.0.0.1', port=5000, debug=True)
@@ -0,0 +1,61 @@
+"""ASGI entry point for serving VisionVault in production.
+
+Launch as a single process (no --workers): each process keeps its own search index and caches, so importing this
+module claims the library with acquire_instance_lock() and a second process on the same library fails to start.
+
+    pip install a2wsgi uvicorn
+    VISIONVAULT_ROOT=/srv/media uvicorn asgi:application --host 127.0.0.1 --port 5000 \\
+        --no-access-log --timeout-keep-alive 30 --limit-concurrency 1000
+
+The Flask app stays synchronous. a2wsgi runs each request on a bounded thread pool
+(VISIONVAULT_ASGI_THREADS, default 32), which covers the filesystem work behind /files, /api/files,
+/api/search and /api/folder-tree, so slow listings and large sends never block the event loop that accepts
+connections. Response bodies are streamed chunk by chunk through a small send queue, so multi-MB originals
+and video ranges are not buffered in memory. Requests beyond the pool size wait for a free thread instead of
+piling up more threads.
+
+Behind nginx, proxy to uvicorn and let nginx send the originals itself (see MEDIA_ACCEL_REDIRECT_PREFIX):
+
+    location / { proxy_pass http://127.0.0.1:5000; proxy_buffering off; }
+    location /protected/ { internal; alias /srv/media/; }
+
+with VISIONVAULT_ACCEL_REDIRECT=/protected/ in the app's environment.
+
+benchmarks/load_test.py compares requests/sec and latency percentiles of this entry point and the
+development server.
+"""
+import os
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.wsgi import FileWrapper
+
+from app import (app, acquire_instance_lock, initialize_tags, start_watcher, start_tagging_worker,
+                 start_embedding_worker, WATCHER_ENABLED, TAGGING_ENABLED, EMBEDDINGS_ENABLED)
+
+ASGI_THREADS = int(os.environ.get('VISIONVAULT_ASGI_THREADS', '32'))
+ASGI_SEND_QUEUE_SIZE = 16  # Body chunks buffered per response before the worker thread waits for the client
+ASGI_FILE_CHUNK_SIZE = 256 * 1024  # Werkzeug sends files in 8 KiB chunks, each costing an event loop round trip
+
+# Same startup as the development server: claim the library, bring metadata up to date, then start the optional
+# background services
+acquire_instance_lock()
+initialize_tags()
+if WATCHER_ENABLED:
+    start_watcher()
+if TAGGING_ENABLED:
+    start_tagging_worker()
+if EMBEDDINGS_ENABLED:
+    start_embedding_worker()
+
+
+def file_wrapper(file, buffer_size=8192):
+    return FileWrapper(file, max(buffer_size, ASGI_FILE_CHUNK_SIZE))
+
+
+def streaming_app(environ, start_response):
+    """The Flask app, with send_file() streaming in ASGI_FILE_CHUNK_SIZE chunks."""
+    environ['wsgi.file_wrapper'] = file_wrapper
+    return app(environ, start_response)
+
+
+application = WSGIMiddleware(streaming_app, workers=ASGI_THREADS, send_queue_size=ASGI_SEND_QUEUE_SIZE)
@@ -0,0 +1,156 @@
+"""Load-test running VisionVault servers and compare requests/sec and latency percentiles.
+
+Usage: python benchmarks/load_test.py --target dev=http://127.0.0.1:5000 --target asgi=http://127.0.0.1:8000
+           [--folder FOLDER] [--file FILE] [--query QUERY] [--concurrency 32] [--duration 20] [--json out.json]
+
+Start the servers to compare first. A library is served by one process at a time, so give each server its own
+copy of the library, e.g.:
+
+    VISIONVAULT_ROOT=/srv/media python app.py                                          # development server, :5000
+    VISIONVAULT_ROOT=/srv/media-copy uvicorn asgi:application --port 8000 --no-access-log  # ASGI entry point
+
+Each target is driven by --concurrency client threads over keep-alive connections for --duration seconds,
+cycling through the folder tree, a folder listing, a search and a file download. The folder, file and search
+term default to the first ones found through the API.
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+
+def fetch_json(base_url, path):
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    try:
+        conn.request("GET", path)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+def discover(base_url, args):
+    """Fill in the folder, file and search term to request from the library behind base_url."""
+    folder, file_path, query = args.folder, args.file, args.query
+    if folder is None:
+        tree = fetch_json(base_url, "/api/folder-tree?depth=1")
+        folder = next((node["path"] for node in tree if node["path"]), "")
+    if file_path is None or query is None:
+        items = fetch_json(base_url, f"/api/files/{quote(folder)}?limit=50").get("items", [])
+        files = [item for item in items if item["type"] != "folder"]
+        if file_path is None and files:
+            file_path = files[0]["path"]
+        if query is None:
+            tags = [tag.strip() for item in files for tag in item["tags"].split(",")
+                    if tag.strip() and tag.strip() not in ("untagged", "Pending tags")]
+            query = tags[0] if tags else (files[0]["name"].rsplit(".", 1)[0] if files else "a")
+    paths = {
+        "folder-tree": "/api/folder-tree?depth=1",
+        "files": f"/api/files/{quote(folder)}?limit=200",
+        "search": f"/api/search?q={quote(query)}&limit=200",
+    }
+    if file_path:
+        paths["download"] = f"/files/{quote(file_path)}"
+    return paths
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_target(base_url, paths, concurrency, duration):
+    """Hammer base_url with the given {endpoint: path} mix and return per-endpoint latencies and errors."""
+    parts = urlsplit(base_url)
+    endpoints = list(paths.items())
+    latencies = {name: [] for name in paths}
+    errors = {name: 0 for name in paths}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        i = offset
+        local = {name: [] for name in paths}
+        local_errors = {name: 0 for name in paths}
+        while time.perf_counter() < deadline:
+            name, path = endpoints[i % len(endpoints)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    local_errors[name] += 1
+                    continue
+                local[name].append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                local_errors[name] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        conn.close()
+        with lock:
+            for name in paths:
+                latencies[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    def summary(values, error_count):
+        values = sorted(values)
+        return {"requests": len(values), "errors": error_count, "rps": round(len(values) / elapsed, 1),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+                "max_ms": round((values[-1] if values else 0) * 1000, 2)}
+
+    result = summary([value for values in latencies.values() for value in values], sum(errors.values()))
+    result["endpoints"] = {name: summary(latencies[name], errors[name]) for name in paths}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', action='append', required=True, metavar="NAME=URL",
+                        help="Server to test, e.g. dev=http://127.0.0.1:5000 (repeat to compare)")
+    parser.add_argument('--folder', help="Folder to list (default: the first top-level folder)")
+    parser.add_argument('--file', help="File to download (default: the first file in the folder)")
+    parser.add_argument('--query', help="Search term (default: a tag from the folder)")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20, help="Seconds per target")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for target in args.target:
+        name, _, base_url = target.partition("=")
+        if not base_url:
+            parser.error(f"--target must look like NAME=URL, got {target!r}")
+        paths = discover(base_url, args)
+        print(f"{name}: {args.concurrency} clients for {args.duration:g}s against {base_url}")
+        results[name] = {"url": base_url, "paths": paths,
+                         **run_target(base_url, paths, args.concurrency, args.duration)}
+        for endpoint, stats in results[name]["endpoints"].items():
+            print(f"  {endpoint:12} {stats['rps']:8.1f} req/s  p50 {stats['p50_ms']:8.2f} ms  "
+                  f"p99 {stats['p99_ms']:8.2f} ms  errors {stats['errors']}")
+
+    print(f"\n{'target':12} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+    for name, result in results.items():
+        print(f"{name:12} {result['rps']:9.1f} {result['p50_ms']:9.2f} {result['p99_ms']:9.2f} "
+              f"{result['max_ms']:9.2f} {result['errors']:7}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"concurrency": args.concurrency, "duration": args.duration, "targets": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
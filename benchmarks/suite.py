@@ -0,0 +1,263 @@
+"""Time VisionVault's scans, folder tree, listings, search and updates on a synthetic library.
+
+Usage: python benchmarks/suite.py [--library DIR] [--files 10000] [--folders 100] [--depth 3] [--backend sqlite]
+           [--repeat 20] [--json out.json] [--compare baseline.json]
+
+Without --library, a library is generated in a temporary folder (see synthetic_library.py) and removed afterwards.
+With --library, an empty or missing folder is filled first and then reused by later runs. The updates only
+rewrite descriptions, so the library's files and tags stay the same from run to run.
+
+Everything goes through the Flask test client in this process, so the timings leave out HTTP and WSGI server
+overhead. The vision API is replaced by a stub and the watcher, tagging and embedding workers are not
+started, so no network is needed. Content hashing is off unless --hashing is given, because its background
+pass would overlap the timings.
+
+- "cold": VisionVault's own state (database, scan manifest, search index) is removed and the in-memory state
+  dropped, as on a first start.
+- "restart": the in-memory state is dropped but the persisted state kept, as on a restart.
+- "warm": the same request repeated with caches filled.
+
+Results go to stdout and, with --json, to a file. --compare prints the median change against an earlier file,
+for example one from the previous commit.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault('LITELLM_LOCAL_MODEL_COST_MAP', 'True')  # No network access when importing litellm
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+from synthetic_library import generate_library, SUBJECTS, ADJECTIVES  # noqa: E402
+
+BULK_SIZES = (100, 1000)
+# VisionVault's persisted state, removed for cold runs (with the SQLite -wal/-shm companions)
+STATE_FILES = (app.METADATA_DB_FILENAME, app.SCAN_MANIFEST_FILENAME, app.SEARCH_INDEX_FILENAME,
+               app.CONTENT_HASHES_FILENAME)
+
+
+def stub_completion(**kwargs):
+    """Stand-in for litellm.completion: a fixed vision model answer, without network access."""
+    message = SimpleNamespace(content="benchmark, stub, synthetic. A synthetic description of the image.")
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=SimpleNamespace(total_tokens=100))
+
+
+def restart_app(cold=False):
+    """Drop the app's in-memory state as a restart would; when cold, also remove its persisted state."""
+    if app.metadata_store is not None:
+        app.metadata_store.close()
+        app.metadata_store = None
+    app.search_index = app.SearchIndex()
+    app.listing_cache = app.ListingCache()
+    app.folder_tree_cache = app.FolderTreeCache()
+    if cold:
+        for filename in STATE_FILES:
+            for path in glob.glob(glob.escape(app.metadata_path(app.ROOT_FOLDER, filename)) + "*"):
+                os.remove(path)
+
+
+def summary(times):
+    times = sorted(times)
+    return {"iterations": len(times), "min_ms": round(times[0] * 1000, 3),
+            "median_ms": round(times[len(times) // 2] * 1000, 3),
+            "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 3),
+            "max_ms": round(times[-1] * 1000, 3)}
+
+
+def measure(fn, repeat=1, setup=None):
+    """Time fn() repeat times, calling setup() untimed before each run."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return summary(times)
+
+
+def check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.path} returned {response.status_code}: {response.get_data()[:200]}")
+    return response
+
+
+def run_suite(repeat, scan_repeat):
+    client = app.app.test_client()
+    results = {}
+
+    def record(name, stats):
+        results[name] = stats
+        print(f"  {name:32} median {stats['median_ms']:10.2f} ms  p95 {stats['p95_ms']:10.2f} ms  "
+              f"({stats['iterations']}x)")
+
+    # Startup scan
+    record("startup_scan_cold", measure(app.initialize_tags, scan_repeat, setup=lambda: restart_app(cold=True)))
+    record("startup_scan_restart", measure(app.initialize_tags, scan_repeat, setup=restart_app))
+    store = app.get_metadata_store()
+    all_entries = store.get_all()
+    by_folder = {}
+    for rel_path in all_entries:
+        by_folder.setdefault(os.path.dirname(rel_path), []).append(rel_path)
+    # /api/files/<path> needs a folder path, so the root listing is left out
+    largest = max((folder for folder in by_folder if folder), key=lambda folder: len(by_folder[folder]), default=None)
+    if largest is None:
+        raise RuntimeError("The library has no files outside its root folder")
+    # Caches skip folders modified within SCAN_MTIME_GRACE, which the scans and generator have just written
+    time.sleep(app.SCAN_MTIME_GRACE)
+
+    # Folder tree: the sidebar's first level, a lazily expanded level and the full tree of the index page
+    def clear_tree():
+        app.folder_tree_cache = app.FolderTreeCache()
+
+    top_level = next((folder for folder in sorted(by_folder) if folder and "/" not in folder), "")
+    record("tree_top_level_cold", measure(lambda: check(client.get("/api/folder-tree?depth=1")), repeat, clear_tree))
+    record("tree_top_level_warm", measure(lambda: check(client.get("/api/folder-tree?depth=1")), repeat))
+    record("tree_expand_warm", measure(lambda: check(client.get(f"/api/folder-tree?path={top_level}&depth=1")),
+                                       repeat))
+    record("tree_full_warm", measure(lambda: app.get_folder_tree(), repeat))
+
+    # Folder listing of the largest folder
+    def clear_listings():
+        app.listing_cache = app.ListingCache()
+
+    first_page = f"/api/files/{largest}?limit={app.LISTING_DEFAULT_LIMIT}"
+    record("listing_first_page_cold", measure(lambda: check(client.get(first_page)), repeat, clear_listings))
+    record("listing_first_page_warm", measure(lambda: check(client.get(first_page)), repeat))
+    record("listing_by_mtime_warm", measure(lambda: check(client.get(f"{first_page}&sort=mtime&order=desc")), repeat))
+    cursor, last_page = None, first_page
+    while True:
+        data = check(client.get(last_page if cursor is None else f"{first_page}&cursor={cursor}")).get_json()
+        if not data["next_cursor"]:
+            break
+        cursor = data["next_cursor"]
+        last_page = f"{first_page}&cursor={cursor}"
+    record("listing_last_page_warm", measure(lambda: check(client.get(last_page)), repeat))
+
+    # Search: the first query after a restart loads the persisted index
+    queries = {
+        "word": SUBJECTS[0],
+        "two_words": f"{SUBJECTS[1]} {ADJECTIVES[0]}",
+        "prefix": SUBJECTS[2][:3],
+        "phrase": f'"photo of a {SUBJECTS[3]}"',
+        "filters": f"tag:{SUBJECTS[4]} in:{top_level} after:2022-01-01 -tag:{ADJECTIVES[1]}",
+    }
+
+    def clear_search():
+        app.search_index = app.SearchIndex()
+
+    record("search_first_query_restart",
+           measure(lambda: check(client.get(f"/api/search?q={queries['word']}")), scan_repeat, clear_search))
+    for name, query in queries.items():
+        record(f"search_{name}_warm",
+               measure(lambda query=query: check(client.get("/api/search", query_string={"q": query})), repeat))
+
+    # Updates: single-file edits, bulk retags across folders and the root .tags.txt rewrite
+    paths = sorted(all_entries)
+    targets = iter(paths * (repeat // len(paths) + 2))
+
+    # Each update gets a fresh description, so no iteration (or rerun on a reused library) is a no-op write
+    def update_one():
+        rel_path = next(targets)
+        check(client.post(f"/api/update-file/{rel_path}", json={
+            "tags": all_entries[rel_path]["tags"], "description": f"Updated by the benchmark at {time.time()}"}))
+
+    def bulk_retag(size):
+        description = f"Bulk updated by the benchmark at {time.time()}"
+        operations = [{"op": "retag", "path": rel_path, "tags": all_entries[rel_path]["tags"],
+                       "description": description} for rel_path in paths[:size]]
+        check(client.post("/api/bulk", json={"operations": operations}))
+
+    record("update_file_single", measure(update_one, repeat))
+    for size in BULK_SIZES:
+        record(f"bulk_retag_{size}", measure(lambda size=size: bulk_retag(size), max(1, scan_repeat)))
+    root_tags_file = app.metadata_path(app.ROOT_FOLDER, '.tags.txt')
+    record("update_root_tags_single", measure(
+        lambda: app.update_root_tags(root_tags_file, {paths[0]: all_entries[paths[0]]}), max(1, repeat // 4)))
+    record("metadata_flush", measure(lambda: app.get_metadata_store().close(), 1))
+
+    # Tagging through the stubbed vision API: image preprocessing and response parsing
+    images = [rel_path for rel_path in paths if all_entries[rel_path]["format"] == "image"][:repeat]
+    image_iter = iter(images * 2)
+    record("process_image_stubbed", measure(
+        lambda: app.process_image(os.path.join(app.ROOT_FOLDER, next(image_iter))), len(images)))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_file):
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\n{'benchmark':32} {'baseline ms':>12} {'current ms':>12} {'change':>8}   (baseline: "
+          f"{baseline['meta'].get('commit')})")
+    for name, stats in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:32} {'-':>12} {stats['median_ms']:12.2f}")
+            continue
+        change = (stats['median_ms'] - before['median_ms']) / before['median_ms'] * 100 if before['median_ms'] else 0
+        print(f"{name:32} {before['median_ms']:12.2f} {stats['median_ms']:12.2f} {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--library', help="Library folder to use, generated first if empty (default: temporary)")
+    parser.add_argument('--files', type=int, default=10000, help="Files to generate (1k-500k is realistic)")
+    parser.add_argument('--folders', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--backend', choices=sorted(app.METADATA_BACKENDS), default=app.METADATA_BACKEND)
+    parser.add_argument('--repeat', type=int, default=20, help="Iterations of each warm measurement")
+    parser.add_argument('--scan-repeat', type=int, default=3, help="Iterations of startup scans and bulk updates")
+    parser.add_argument('--hashing', action='store_true', help="Keep background content hashing on")
+    parser.add_argument('--json', help="Also write the results to this file")
+    parser.add_argument('--compare', help="Results file of an earlier run to compare medians against")
+    args = parser.parse_args()
+
+    library = os.path.abspath(args.library) if args.library else tempfile.mkdtemp(prefix="visionvault-bench-")
+    meta = {"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+            "backend": args.backend, "files": args.files, "folders": args.folders, "depth": args.depth,
+            "seed": args.seed, "repeat": args.repeat, "hashing": args.hashing,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    try:
+        if not os.path.isdir(library) or not os.listdir(library):
+            os.makedirs(library, exist_ok=True)
+            print(f"Generating {args.files} files in {args.folders} folders in {library}")
+            generate_library(library, files=args.files, folders=args.folders, depth=args.depth, seed=args.seed)
+
+        app.ROOT_FOLDER = library
+        app.METADATA_BACKEND = args.backend
+        app.CONTENT_HASHING = args.hashing
+        app.THUMBNAIL_PREGENERATE = False
+        app.litellm.completion = stub_completion
+        app.logger.setLevel("WARNING")
+        print(f"Benchmarking {args.backend} backend on {library}")
+        results = run_suite(args.repeat, args.scan_repeat)
+    finally:
+        restart_app()
+        if not args.library:
+            shutil.rmtree(library, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
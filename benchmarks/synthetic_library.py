@@ -0,0 +1,150 @@
+"""Generate a synthetic VisionVault library for benchmarks.
+
+Usage: python benchmarks/synthetic_library.py <output folder> [--files 10000] [--folders 100] [--depth 3]
+           [--image-size 32] [--untagged 0.1] [--seed 1]
+
+Files are spread unevenly over --folders folders nested up to --depth levels deep, so a few folders are large
+and most are small. Most files are small real JPEG and PNG images (random colour blocks of --image-size pixels,
+or a 1x1 PNG without Pillow, each with a unique trailer so no two files hash alike); the rest stand in
+for videos and documents. Each file gets 3-5 tags and a one-line description drawn from a fixed vocabulary,
+or the "untagged" placeholder for an --untagged fraction of them. The tags are written to the per-folder and
+root .tags.txt files as the app writes them, and mtimes are spread over the past five years. The same seed
+always produces the same library.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('LITELLM_LOCAL_MODEL_COST_MAP', 'True')  # No network access when importing litellm
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+SUBJECTS = ["cat", "dog", "horse", "bird", "rocket", "car", "bicycle", "boat", "train", "airplane", "mountain",
+            "beach", "forest", "river", "lake", "city", "bridge", "castle", "flower", "tree", "sunset", "sunrise",
+            "portrait", "crowd", "concert", "wedding", "birthday", "kitchen", "garden", "street", "desert", "snow",
+            "waterfall", "lighthouse", "harbor", "market", "museum", "stadium", "library", "skyline"]
+ADJECTIVES = ["red", "blue", "green", "golden", "dark", "bright", "foggy", "rainy", "sunny", "snowy", "old",
+              "modern", "busy", "quiet", "colorful", "blurry", "sharp", "wide", "close-up", "aerial"]
+PLACES = ["in the park", "by the sea", "downtown", "at home", "on the road", "in the mountains", "at night",
+          "in the morning", "near the station", "on the balcony", "at the festival", "in the countryside"]
+FOLDER_WORDS = ["trips", "family", "work", "archive", "events", "screenshots", "camera", "phone", "scans",
+                "projects", "holidays", "friends", "misc", "exports", "raw", "edited"]
+OTHER_FORMATS = (".mp4", ".mov", ".pdf", ".txt")
+OTHER_FRACTION = 0.05
+MTIME_SPAN = 5 * 365 * 24 * 3600
+IMAGE_VARIANTS = 16
+
+# A valid 1x1 black PNG, used when Pillow is not installed
+FALLBACK_PNG = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010800000000"
+                             "3a7e9b550000000a49444154789c636000000002000148afa4710000000049454e44ae426082")
+
+
+def make_images(rng, size):
+    """Return {extension: [image bytes, ...]} with a few variants per format."""
+    if app.Image is None:
+        return {".png": [FALLBACK_PNG]}
+    images = {".jpg": [], ".png": []}
+    for extension, fmt in ((".jpg", "JPEG"), (".png", "PNG")):
+        for _ in range(IMAGE_VARIANTS):
+            img = app.Image.new("RGB", (size, size * 3 // 4), tuple(rng.randrange(256) for _ in range(3)))
+            for _ in range(4):
+                x, y = rng.randrange(size), rng.randrange(size * 3 // 4)
+                img.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, x + size // 3, y + size // 4))
+            buffer = io.BytesIO()
+            img.save(buffer, fmt)
+            images[extension].append(buffer.getvalue())
+    return images
+
+
+def make_folders(rng, count, depth):
+    """Return count unique forward-slash folder paths nested at most depth levels deep."""
+    folders = []
+    candidates = [""]  # Folders that may still get subfolders
+    while len(folders) < count:
+        parent = rng.choice(candidates)
+        name = f"{rng.choice(FOLDER_WORDS)}-{len(folders)}"
+        folder = f"{parent}/{name}" if parent else name
+        folders.append(folder)
+        if folder.count("/") + 1 < depth:
+            candidates.append(folder)
+    return folders
+
+
+def make_entry(rng, untagged):
+    if rng.random() < untagged:
+        return "untagged", "No description available"
+    subject = rng.choice(SUBJECTS)
+    adjective = rng.choice(ADJECTIVES)
+    place = rng.choice(PLACES)
+    tags = list(dict.fromkeys([subject, adjective, *rng.sample(SUBJECTS, rng.randint(1, 3))]))
+    article = "An" if adjective[0] in "aeiou" else "A"
+    background = rng.choice(SUBJECTS)
+    description = f"{article} {adjective} photo of a {subject} {place}, with a {background} in the background."
+    return ", ".join(tags), description
+
+
+def generate_library(root, files=10000, folders=100, depth=3, image_size=32, untagged=0.1, seed=1):
+    """Write a synthetic library into root and return counts of what was written."""
+    rng = random.Random(seed)
+    start = time.time()
+    images = make_images(rng, image_size)
+    folder_paths = [""] + make_folders(rng, folders, depth)
+    for folder in folder_paths:
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+    # Zipf-like sizes: the k-th folder gets about 1/k of the files of the first one
+    weights = [1 / (rank + 1) for rank in range(len(folder_paths))]
+    rng.shuffle(weights)
+
+    by_folder = {}
+    now = time.time()
+    for i in range(files):
+        folder = rng.choices(folder_paths, weights)[0]
+        if rng.random() < OTHER_FRACTION:
+            extension = rng.choice(OTHER_FORMATS)
+            content = rng.randbytes(rng.randrange(256, 4096))
+        else:
+            extension = rng.choice(list(images))
+            content = rng.choice(images[extension]) + i.to_bytes(8, 'little')  # Decoders ignore trailing bytes
+        name = f"{rng.choice(SUBJECTS)}_{i:07d}{extension}"
+        full_path = os.path.join(root, folder, name)
+        with open(full_path, 'wb') as f:
+            f.write(content)
+        mtime = now - rng.random() * MTIME_SPAN
+        os.utime(full_path, (mtime, mtime))
+        tags, description = make_entry(rng, untagged)
+        by_folder.setdefault(folder, {})[name] = {"format": app.get_file_type(name), "tags": tags,
+                                                  "description": description}
+
+    root_entries = {}
+    for folder, entries in by_folder.items():
+        if folder:
+            app.write_tags_file(app.metadata_path(os.path.join(root, folder), '.tags.txt'), entries)
+        root_entries.update({app.to_rel_path(folder, name): entry for name, entry in entries.items()})
+    app.write_tags_file(app.metadata_path(root, '.tags.txt'), root_entries)
+    return {"files": files, "folders": len(folder_paths) - 1, "depth": depth, "seed": seed,
+            "seconds": round(time.time() - start, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output', help="Folder to create the library in")
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--folders', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=3, help="Maximum folder nesting")
+    parser.add_argument('--image-size', type=int, default=32, help="Image width in pixels")
+    parser.add_argument('--untagged', type=float, default=0.1, help="Fraction of files left untagged")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if os.path.isdir(args.output) and os.listdir(args.output):
+        parser.error(f"{args.output} is not empty")
+    stats = generate_library(os.path.abspath(args.output), files=args.files, folders=args.folders,
+                             depth=args.depth, image_size=args.image_size, untagged=args.untagged, seed=args.seed)
+    print(f"Wrote {stats['files']} files in {stats['folders']} folders to {args.output} in {stats['seconds']}s")
+
+
+if __name__ == '__main__':
+    main()
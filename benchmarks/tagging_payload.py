@@ -0,0 +1,76 @@
+"""Compare vision-model request payloads before and after image preprocessing.
+
+Usage: python benchmarks/tagging_payload.py <corpus folder> [--max-edge 1024] [--format jpeg|webp] [--json out.json]
+
+For every image in the corpus this reports the base64 payload size and wall time of sending the raw original
+(the old behaviour) against prepare_image_payload(). No API calls are made.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault('LITELLM_LOCAL_MODEL_COST_MAP', 'True')  # No network access when importing litellm
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def measure(fn):
+    start = time.perf_counter()
+    payload = fn()
+    return len(payload), time.perf_counter() - start
+
+
+def raw_payload(file_path):
+    with open(file_path, 'rb') as f:
+        return base64.b64encode(f.read())
+
+
+def prepared_payload(file_path):
+    return base64.b64encode(app.prepare_image_payload(file_path)[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('corpus', help="Folder of sample images (searched recursively)")
+    parser.add_argument('--max-edge', type=int, default=app.TAGGING_MAX_EDGE)
+    parser.add_argument('--format', choices=('jpeg', 'webp'), default=app.TAGGING_IMAGE_FORMAT)
+    parser.add_argument('--json', help="Also write per-image results to this file")
+    args = parser.parse_args()
+
+    app.ROOT_FOLDER = os.path.abspath(args.corpus)
+    app.TAGGING_MAX_EDGE = args.max_edge
+    app.TAGGING_IMAGE_FORMAT = args.format
+
+    results = []
+    for root, dirs, files in os.walk(app.ROOT_FOLDER):
+        for name in sorted(files):
+            if app.get_file_type(name) != "image" or app.is_metadata_file(name):
+                continue
+            file_path = os.path.join(root, name)
+            before_bytes, before_time = measure(lambda: raw_payload(file_path))
+            after_bytes, after_time = measure(lambda: prepared_payload(file_path))
+            results.append({"path": os.path.relpath(file_path, app.ROOT_FOLDER),
+                            "before_bytes": before_bytes, "before_seconds": round(before_time, 4),
+                            "after_bytes": after_bytes, "after_seconds": round(after_time, 4)})
+            print(f"{results[-1]['path']}: {before_bytes:,} -> {after_bytes:,} bytes, "
+                  f"{before_time * 1000:.1f} -> {after_time * 1000:.1f} ms")
+
+    if not results:
+        print("No images found.")
+        return
+    before_total = sum(r["before_bytes"] for r in results)
+    after_total = sum(r["after_bytes"] for r in results)
+    print(f"\n{len(results)} images, max edge {args.max_edge}px, {args.format}")
+    print(f"Payload: {before_total:,} -> {after_total:,} bytes ({after_total / before_total:.1%} of original)")
+    print(f"Mean time per image: {sum(r['before_seconds'] for r in results) / len(results) * 1000:.1f} -> "
+          f"{sum(r['after_seconds'] for r in results) / len(results) * 1000:.1f} ms")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"max_edge": args.max_edge, "format": args.format, "images": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,35 @@
-// Placeholder for search functionality
-function searchFiles() {
+// Grid cards load server-generated thumbnails instead of the full-resolution originals. Folder listings
+// include each file's version, which makes the URL change with the content so the browser can cache it for good.
+const THUMBNAIL_SIZE = 256;
+
+function thumbnailUrl(path, version) {
+    const url = `/thumbs/${THUMBNAIL_SIZE}/${encodeURIComponent(path)}`;
+    return version ? `${url}?v=${encodeURIComponent(version)}` : url;
+}
+
+// Search the indexed library; pass an offset to append the next page of results
+const SEARCH_PAGE_SIZE = 200;
+
+function searchFiles(offset = 0) {
     const query = document.getElementById('search-input').value.trim();
     if (!query) {
         alert('Please enter a search query.');
         return;
     }
-    fetch(`/api/search?q=${encodeURIComponent(query)}`)
+    const mode = document.getElementById('search-mode').value;
+    showSearchResults(`/api/search?q=${encodeURIComponent(query)}&mode=${mode}&limit=${SEARCH_PAGE_SIZE}`, offset);
+}
+
+// Images that look like (or are described like) the given one, ranked by embedding similarity
+function findSimilar(filePath) {
+    closeModal();
+    showSearchResults(`/api/similar/${encodeURIComponent(filePath)}?limit=${SEARCH_PAGE_SIZE}`, 0);
+}
+
+function showSearchResults(url, offset) {
+    fetch(`${url}&offset=${offset}`)
         .then(response => {
-            if (!response.ok) {
+            if (!response.ok && !response.headers.get('Content-Type')?.includes('json')) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             return response.json();
@@ -15,6 +37,11 @@ function searchFiles() {
         .then(data => {
             const fileGrid = document.getElementById('file-grid');
             const breadcrumbsDiv = document.getElementById('breadcrumbs');
+            document.getElementById('load-more-results')?.remove();
+            if (offset > 0 && !data.error) {
+                renderSearchResults(data, offset, url);
+                return;
+            }
             fileGrid.innerHTML = ''; // Clear current items
             breadcrumbsDiv.innerHTML = ''; // Clear breadcrumbs
 
@@ -35,29 +62,9 @@ function searchFiles() {
             crumb.className = 'breadcrumb current';
             breadcrumbList.appendChild(crumb);
             breadcrumbsDiv.appendChild(breadcrumbList);
+            renderSearchFacets(data.facets);
 
-            // Render search results
-            data.items.forEach(item => {
-                const fileCard = document.createElement('div');
-                fileCard.className = 'file-card';
-                if (item.type === 'image') {
-                    fileCard.innerHTML = `
-                        <img src="/files/${encodeURIComponent(item.path)}" alt="${item.name}" onerror="this.src='/static/placeholder.jpg'">
-                        <p>${item.name}</p>
-                        <span class="tags">${item.tags}</span>
-                    `;
-                } else {
-                    fileCard.innerHTML = `
-                        <div class="file-icon">${item.type.toUpperCase()}</div>
-                        <p>${item.name}</p>
-                        <span class="tags">${item.tags}</span>
-                    `;
-                }
-                fileCard.addEventListener('click', () => {
-                    showFileEditModal(item.path, item.name, item.tags, item.description || "No description available");
-                });
-                fileGrid.appendChild(fileCard);
-            });
+            renderSearchResults(data, offset, url);
         })
         .catch(error => {
             console.error('Error searching files:', error);
@@ -66,20 +73,237 @@ function searchFiles() {
         });
 }
 
-// Folder tree interaction
-document.querySelectorAll('.folder-tree li').forEach(item => {
-    item.addEventListener('click', (event) => {
-        // Prevent bubbling up to parent folders
-        event.stopPropagation();
-        const folderPath = item.getAttribute('data-path');
-        if (folderPath) {
-            fetchFiles(folderPath.trim().replace('\\', '/')); // Ensure forward slashes
+// Show the top tags and formats among the matches; clicking one narrows the query with a tag: or format: filter
+function renderSearchFacets(facets) {
+    if (!facets) {
+        return;
+    }
+    const facetBar = document.createElement('div');
+    facetBar.className = 'search-facets';
+    const addChips = (values, field) => values.forEach(facet => {
+        const chip = document.createElement('button');
+        chip.className = 'facet-chip';
+        chip.textContent = `${facet.value} (${facet.count})`;
+        chip.addEventListener('click', () => {
+            const input = document.getElementById('search-input');
+            const value = facet.value.includes(' ') ? `"${facet.value}"` : facet.value;
+            input.value = `${input.value.trim()} ${field}:${value}`;
+            searchFiles();
+        });
+        facetBar.appendChild(chip);
+    });
+    addChips(facets.formats, 'format');
+    addChips(facets.tags, 'tag');
+    document.getElementById('breadcrumbs').appendChild(facetBar);
+}
+
+// Append a page of search results, with a "Load more" button if more matches remain
+function renderSearchResults(data, offset, url) {
+    const fileGrid = document.getElementById('file-grid');
+    data.items.forEach(item => {
+        const fileCard = document.createElement('div');
+        fileCard.className = 'file-card';
+        if (item.type === 'image') {
+            fileCard.innerHTML = `
+                <img src="${thumbnailUrl(item.path)}" loading="lazy" alt="${item.name}" onerror="this.src='/static/placeholder.jpg'">
+                <p>${item.name}</p>
+                <span class="tags">${item.tags}</span>
+            `;
+        } else {
+            fileCard.innerHTML = `
+                <div class="file-icon">${item.type.toUpperCase()}</div>
+                <p>${item.name}</p>
+                <span class="tags">${item.tags}</span>
+            `;
         }
+        fileCard.addEventListener('click', () => {
+            showFileEditModal(item.path, item.name, item.tags, item.description || "No description available");
+        });
+        makeSelectable(fileCard, item.path);
+        fileGrid.appendChild(fileCard);
     });
+    const nextOffset = offset + data.items.length;
+    if (data.total > nextOffset) {
+        const loadMore = document.createElement('button');
+        loadMore.id = 'load-more-results';
+        loadMore.className = 'load-more-btn';
+        loadMore.textContent = `Load more (${data.total - nextOffset} remaining)`;
+        loadMore.addEventListener('click', () => showSearchResults(url, nextOffset));
+        fileGrid.appendChild(loadMore);
+    }
+}
+
+// Folder tree interaction: clicking a folder opens it, clicking its arrow expands or collapses it
+document.getElementById('folder-tree').addEventListener('click', (event) => {
+    const item = event.target.closest('li');
+    if (!item) {
+        return;
+    }
+    if (event.target.classList.contains('folder-toggle')) {
+        toggleFolder(item);
+        return;
+    }
+    const folderPath = item.getAttribute('data-path');
+    if (folderPath) {
+        fetchFiles(folderPath.trim().replace('\\', '/')); // Ensure forward slashes
+    }
 });
 
+// Create a tree item for a folder returned by /api/folder-tree
+function createFolderItem(folder, level) {
+    const item = document.createElement('li');
+    item.setAttribute('data-path', folder.path);
+    item.setAttribute('data-level', level);
+    item.style.marginLeft = `${level * 20}px`;
+    const toggle = document.createElement('span');
+    toggle.className = 'folder-toggle';
+    toggle.textContent = folder.has_children ? '\u25B8' : '';
+    item.appendChild(toggle);
+    item.appendChild(document.createTextNode(folder.name));
+    return item;
+}
+
+// Expand a folder by fetching its direct subfolders, or collapse it by removing every item nested below it
+function toggleFolder(item) {
+    const level = parseInt(item.getAttribute('data-level'), 10);
+    if (item.classList.contains('expanded')) {
+        item.classList.remove('expanded');
+        let next = item.nextElementSibling;
+        while (next && parseInt(next.getAttribute('data-level'), 10) > level) {
+            const following = next.nextElementSibling;
+            next.remove();
+            next = following;
+        }
+        return;
+    }
+    if (item.dataset.loading) {
+        return;
+    }
+    item.dataset.loading = 'true';
+    fetch(`/api/folder-tree?path=${encodeURIComponent(item.getAttribute('data-path'))}&depth=1`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(folders => {
+            let previous = item;
+            folders.filter(folder => folder.path).forEach(folder => {
+                const child = createFolderItem(folder, level + 1);
+                previous.after(child);
+                previous = child;
+            });
+            item.classList.add('expanded');
+        })
+        .catch(error => console.error('Error expanding folder:', error))
+        .finally(() => {
+            delete item.dataset.loading;
+        });
+}
+
+// Folder listings are fetched a page at a time and appended as the grid is scrolled
+const FILES_PAGE_SIZE = 200;
+let folderListing = { path: null, cursor: null, loading: false, observer: null };
+
+// Multi-select: tick files (or Ctrl/Cmd-click them) to retag, move or delete them together through /api/bulk
+const selectedPaths = new Set();
+
+function makeSelectable(fileCard, path) {
+    const checkbox = document.createElement('input');
+    checkbox.type = 'checkbox';
+    checkbox.className = 'select-box';
+    checkbox.checked = selectedPaths.has(path);
+    fileCard.classList.toggle('selected', checkbox.checked);
+    const setSelected = (selected) => {
+        checkbox.checked = selected;
+        fileCard.classList.toggle('selected', selected);
+        if (selected) {
+            selectedPaths.add(path);
+        } else {
+            selectedPaths.delete(path);
+        }
+        updateBulkToolbar();
+    };
+    checkbox.addEventListener('click', (event) => {
+        event.stopPropagation();
+        setSelected(checkbox.checked);
+    });
+    // Capture phase, so a modifier click selects instead of opening the edit dialog
+    fileCard.addEventListener('click', (event) => {
+        if (event.ctrlKey || event.metaKey) {
+            event.stopImmediatePropagation();
+            setSelected(!checkbox.checked);
+        }
+    }, true);
+    fileCard.prepend(checkbox);
+}
+
+function updateBulkToolbar() {
+    document.getElementById('bulk-toolbar').classList.toggle('visible', selectedPaths.size > 0);
+    document.getElementById('bulk-count').textContent = `${selectedPaths.size} selected`;
+}
+
+function clearSelection() {
+    selectedPaths.clear();
+    document.querySelectorAll('.file-card.selected').forEach(card => {
+        card.classList.remove('selected');
+        card.querySelector('.select-box').checked = false;
+    });
+    updateBulkToolbar();
+}
+
+async function runBulk(operations) {
+    try {
+        const response = await fetch('/api/bulk', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ operations })
+        });
+        const data = await response.json();
+        if (data.error) {
+            alert(`Error: ${data.error}`);
+            return;
+        }
+        if (data.failed > 0) {
+            const errors = data.results.filter(result => result.status !== 'success')
+                .map(result => `${result.path}: ${result.error}`);
+            alert(`${data.succeeded} succeeded, ${data.failed} failed:\n${errors.slice(0, 10).join('\n')}`);
+        }
+        clearSelection();
+        if (folderListing.path !== null) {
+            fetchFiles(folderListing.path);
+        }
+    } catch (error) {
+        console.error('Error applying bulk operations:', error);
+        alert('Error applying bulk operations. Check console for details.');
+    }
+}
+
+function bulkTags(op) {
+    const tags = prompt(op === 'add_tags' ? 'Tags to add (comma-separated):' : 'Tags to remove (comma-separated):');
+    if (tags && tags.trim()) {
+        runBulk([...selectedPaths].map(path => ({ op, path, tags })));
+    }
+}
+
+function bulkMove() {
+    const folder = prompt('Move to folder (path relative to the library root):', folderListing.path || '');
+    if (folder !== null) {
+        runBulk([...selectedPaths].map(path => ({ op: 'move', path, folder: folder.trim() })));
+    }
+}
+
+function bulkDelete() {
+    if (confirm(`Delete ${selectedPaths.size} files? This action cannot be undone.`)) {
+        runBulk([...selectedPaths].map(path => ({ op: 'delete', path })));
+    }
+}
+
 // Fetch and display files, folders, and breadcrumbs in the selected folder
 function fetchFiles(folderPath) {
+    folderListing.observer?.disconnect();
+    folderListing = { path: null, cursor: null, loading: false, observer: null };
     if (!folderPath) {
         const fileGrid = document.getElementById('file-grid');
         fileGrid.innerHTML = '<p>No folder selected. Click a folder to view its contents.</p>';
@@ -87,8 +311,22 @@ function fetchFiles(folderPath) {
         return;
     }
     // Normalize path to use forward slashes
-    folderPath = folderPath.replace('\\', '/');
-    fetch(`/api/files/${encodeURIComponent(folderPath)}`)
+    folderListing.path = folderPath.replace('\\', '/');
+    fetchFilesPage(folderListing);
+}
+
+// Fetch the next page of the current folder listing; the first page also renders the breadcrumbs
+function fetchFilesPage(listing) {
+    if (listing.loading) {
+        return;
+    }
+    listing.loading = true;
+    const firstPage = listing.cursor === null;
+    const params = new URLSearchParams({ limit: FILES_PAGE_SIZE });
+    if (!firstPage) {
+        params.set('cursor', listing.cursor);
+    }
+    fetch(`/api/files/${encodeURIComponent(listing.path)}?${params}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
@@ -96,14 +334,20 @@ function fetchFiles(folderPath) {
             return response.json();
         })
         .then(data => {
+            if (listing !== folderListing) {
+                return; // Another folder was opened while this page was loading
+            }
             const { items, breadcrumbs } = data;
             const fileGrid = document.getElementById('file-grid');
             const breadcrumbsDiv = document.getElementById('breadcrumbs');
-            fileGrid.innerHTML = ''; // Clear current items
-            breadcrumbsDiv.innerHTML = ''; // Clear breadcrumbs
+            document.getElementById('files-sentinel')?.remove();
+            if (firstPage) {
+                fileGrid.innerHTML = ''; // Clear current items
+                breadcrumbsDiv.innerHTML = ''; // Clear breadcrumbs
+            }
 
             // Render breadcrumbs if available
-            if (breadcrumbs) {
+            if (firstPage && breadcrumbs) {
                 const breadcrumbList = document.createElement('nav');
                 breadcrumbList.className = 'breadcrumb-nav';
                 const parts = breadcrumbs.map((crumb, index) => {
@@ -129,7 +373,7 @@ function fetchFiles(folderPath) {
                 fileGrid.innerHTML = `<p>Error: ${data.error}</p>`;
                 return;
             }
-            if (items.length === 0 || (items.length === 1 && items[0].type === "error")) {
+            if (firstPage && items.length === 0) {
                 fileGrid.innerHTML = '<p>No items found in this folder.</p>';
                 return;
             }
@@ -145,21 +389,45 @@ function fetchFiles(folderPath) {
                     fileCard.addEventListener('click', () => fetchFiles(item.path.trim().replace('\\', '/')));
                 } else {
                     fileCard.innerHTML = `
-                        ${item.type === 'image' ? `<img src="/files/${encodeURIComponent(item.path)}" alt="${item.name}" onerror="this.src='/static/placeholder.jpg'">` : `<div class="file-icon">${item.type.toUpperCase()}</div>`}
+                        ${item.type === 'image' ? `<img src="${thumbnailUrl(item.path, item.version)}" loading="lazy" alt="${item.name}" onerror="this.src='/static/placeholder.jpg'">` : `<div class="file-icon">${item.type.toUpperCase()}</div>`}
                         <p>${item.name}</p>
                         <span class="tags">${item.tags}</span>
                     `;
                     fileCard.addEventListener('click', () => {
                         showFileEditModal(item.path, item.name, item.tags, item.description || "No description available");
                     });
+                    makeSelectable(fileCard, item.path);
                 }
                 fileGrid.appendChild(fileCard);
             });
+
+            // Load the next page once the end of the grid scrolls into view
+            listing.cursor = data.next_cursor;
+            listing.loading = false;
+            if (listing.cursor) {
+                const sentinel = document.createElement('div');
+                sentinel.id = 'files-sentinel';
+                sentinel.className = 'files-sentinel';
+                fileGrid.appendChild(sentinel);
+                listing.observer = listing.observer || new IntersectionObserver(entries => {
+                    if (entries.some(entry => entry.isIntersecting)) {
+                        fetchFilesPage(listing);
+                    }
+                }, { rootMargin: '600px' });
+                listing.observer.observe(sentinel);
+            } else {
+                listing.observer?.disconnect();
+            }
         })
         .catch(error => {
             console.error('Error fetching items:', error);
-            document.getElementById('file-grid').innerHTML = '<p>Error loading items.</p>';
-            document.getElementById('breadcrumbs').innerHTML = ''; // Clear breadcrumbs on error
+            if (firstPage && listing === folderListing) {
+                document.getElementById('file-grid').innerHTML = '<p>Error loading items.</p>';
+                document.getElementById('breadcrumbs').innerHTML = ''; // Clear breadcrumbs on error
+            }
+        })
+        .finally(() => {
+            listing.loading = false;
         });
 }
 
@@ -241,6 +509,8 @@ function showFileEditModal(filePath, currentName, currentTags, currentDescriptio
         }
     };
 
+    document.getElementById('similar-button').onclick = () => findSimilar(filePath);
+
     // Add delete button functionality with confirmation
     document.getElementById('delete-button').onclick = () => {
         if (confirm('Are you sure you want to delete this file? This action cannot be undone.')) {
@@ -254,6 +524,7 @@ function closeModal() {
     document.getElementById('file-edit-modal').style.display = 'none';
     document.getElementById('file-edit-form').onsubmit = null; // Reset form submission
     document.getElementById('delete-button').onclick = null; // Reset delete button handler
+    document.getElementById('similar-button').onclick = null;
 }
 
 // Delete file via API
@@ -275,4 +546,21 @@ async function deleteFile(filePath) {
         console.error('Error deleting file:', error);
         alert('Error deleting file. Check console for details.');
     }
-}
\ No newline at end of file
+}
+
+// Queue every untagged image for AI tagging and report progress from the tagging status endpoint
+document.getElementById('update-all-tags-btn').addEventListener('click', async () => {
+    try {
+        const response = await fetch('/api/tagging/run', { method: 'POST' });
+        const data = await response.json();
+        if (data.error) {
+            alert(`Error starting AI tagging: ${data.error}`);
+            return;
+        }
+        const status = await (await fetch('/api/tagging/status')).json();
+        alert(`AI tagging running: ${status.queue_depth} images queued, ${status.tagged} tagged so far.`);
+    } catch (error) {
+        console.error('Error starting AI tagging:', error);
+        alert('Error starting AI tagging. Check console for details.');
+    }
+});
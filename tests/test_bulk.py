@@ -0,0 +1,154 @@
+"""Batched retag, rename, move and delete operations through /api/bulk."""
+import os
+import sys
+
+os.environ.setdefault('LITELLM_LOCAL_MODEL_COST_MAP', 'True')  # No network access when importing litellm
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+CAT = {"format": "image", "tags": "cat, sofa", "description": "A cat on a sofa"}
+DOG = {"format": "image", "tags": "dog", "description": "A dog in a park"}
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    for rel_path in ("pets/cat.jpg", "pets/dog.jpg", "trips/beach.jpg"):
+        path = tmp_path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(rel_path.encode())
+    (tmp_path / "pets" / ".private").mkdir()
+    monkeypatch.setattr(app, "ROOT_FOLDER", str(tmp_path))
+    monkeypatch.setattr(app, "CONTENT_HASHING", False)
+    monkeypatch.setattr(app, "metadata_store", None)
+    monkeypatch.setattr(app, "search_index", app.SearchIndex())
+    store = app.get_metadata_store()
+    store.apply({"pets/cat.jpg": dict(CAT), "pets/dog.jpg": dict(DOG),
+                 "trips/beach.jpg": {"format": "image", "tags": "untagged", "description": "No description available"}})
+    store.set_hashes({"pets/cat.jpg": {"size": 12, "mtime": 1, "hash": "sha256:cat", "phash": None}})
+    yield tmp_path
+    app.metadata_store.close()
+    app.metadata_store = None
+
+
+def bulk(*operations):
+    response = app.app.test_client().post("/api/bulk", json={"operations": list(operations)})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def errors(result):
+    return [item["error"] for item in result["results"] if item["status"] == "error"]
+
+
+def test_tag_operations(library):
+    result = bulk({"op": "add_tags", "path": "pets/dog.jpg", "tags": ["park", "dog"]},
+                  {"op": "remove_tags", "path": "pets/cat.jpg", "tags": "sofa"},
+                  {"op": "retag", "path": "trips/beach.jpg", "tags": "sea, sand", "description": "  Waves  "})
+    assert (result["status"], result["succeeded"]) == ("success", 3)
+    store = app.get_metadata_store()
+    assert store.get("pets/dog.jpg")["tags"] == "dog, park"
+    assert store.get("pets/cat.jpg")["tags"] == "cat"
+    assert store.get("trips/beach.jpg") == {"format": "image", "tags": "sea, sand", "description": "Waves"}
+
+
+def test_changes_are_written_in_one_batch(library, monkeypatch):
+    calls = []
+    apply_metadata_changes = app.apply_metadata_changes
+    monkeypatch.setattr(app, "apply_metadata_changes",
+                        lambda *args, **kwargs: calls.append(args) or apply_metadata_changes(*args, **kwargs))
+    bulk({"op": "add_tags", "path": "pets/dog.jpg", "tags": "park"},
+         {"op": "rename", "path": "pets/cat.jpg", "name": "kitty.jpg"},
+         {"op": "delete", "path": "trips/beach.jpg"})
+    assert len(calls) == 1
+
+
+def test_rename_carries_metadata_and_hash(library):
+    result = bulk({"op": "rename", "path": "pets/cat.jpg", "name": "kitty.png"})
+    assert result["results"][0]["new_path"] == "pets/kitty.png"
+    assert not (library / "pets" / "cat.jpg").exists()
+    store = app.get_metadata_store()
+    assert store.get("pets/cat.jpg") is None
+    assert store.get("pets/kitty.png") == CAT  # Same metadata, format still image
+    assert store.get_hashes(["pets/kitty.png"])["pets/kitty.png"]["hash"] == "sha256:cat"
+    assert [path for path, _ in app.get_search_index().search("kitty")[1]] == ["pets/kitty.png"]
+
+
+def test_rename_then_move_in_one_request(library):
+    result = bulk({"op": "rename", "path": "pets/cat.jpg", "name": "kitty.jpg"},
+                  {"op": "move", "path": "pets/kitty.jpg", "folder": "trips"})
+    assert result["status"] == "success"
+    assert (library / "trips" / "kitty.jpg").read_bytes() == b"pets/cat.jpg"
+    store = app.get_metadata_store()
+    assert store.get("trips/kitty.jpg") == CAT
+    assert store.get("pets/kitty.jpg") is None
+    assert store.get_hashes(["trips/kitty.jpg"])["trips/kitty.jpg"]["hash"] == "sha256:cat"
+
+
+def test_name_collisions_leave_both_files_alone(library):
+    result = bulk({"op": "rename", "path": "pets/cat.jpg", "name": "dog.jpg"},
+                  {"op": "move", "path": "pets/dog.jpg", "folder": "pets"},  # Already there: nothing to do
+                  {"op": "rename", "path": "trips/beach.jpg", "name": "shore.jpg"},
+                  {"op": "move", "path": "pets/dog.jpg", "folder": "trips"},
+                  {"op": "rename", "path": "trips/dog.jpg", "name": "shore.jpg"})  # Taken earlier in the batch
+    assert [item["status"] for item in result["results"]] == ["error", "success", "success", "success", "error"]
+    assert all("already exists" in error for error in errors(result))
+    assert (library / "pets" / "cat.jpg").read_bytes() == b"pets/cat.jpg"
+    assert (library / "trips" / "shore.jpg").read_bytes() == b"trips/beach.jpg"
+    assert (library / "trips" / "dog.jpg").read_bytes() == b"pets/dog.jpg"
+    store = app.get_metadata_store()
+    assert store.get("pets/cat.jpg") == CAT
+    assert store.get("trips/dog.jpg") == DOG
+    assert store.get("trips/shore.jpg")["tags"] == "untagged"
+
+
+@pytest.mark.parametrize("name", [".hidden.jpg", ".tags.txt", ".search_index.json", "..", ".", "", "  ",
+                                  "a/b.jpg", "a\\b.jpg", 5])
+def test_rename_rejects_hidden_and_invalid_names(library, name):
+    result = bulk({"op": "rename", "path": "pets/cat.jpg", "name": name})
+    assert result["status"] == "partial"
+    assert (library / "pets" / "cat.jpg").exists()
+    assert app.get_metadata_store().get("pets/cat.jpg") == CAT
+
+
+@pytest.mark.parametrize("folder", ["pets/.private", ".visionvault", "../outside", "missing", 7])
+def test_move_rejects_hidden_and_missing_folders(library, folder):
+    result = bulk({"op": "move", "path": "pets/cat.jpg", "folder": folder})
+    assert result["status"] == "partial"
+    assert (library / "pets" / "cat.jpg").exists()
+    assert os.listdir(library / "pets" / ".private") == []
+
+
+def test_delete_removes_file_and_entry(library):
+    result = bulk({"op": "delete", "path": "pets/dog.jpg"},
+                  {"op": "add_tags", "path": "pets/dog.jpg", "tags": "ghost"})
+    assert [item["status"] for item in result["results"]] == ["success", "error"]
+    assert not (library / "pets" / "dog.jpg").exists()
+    assert app.get_metadata_store().get("pets/dog.jpg") is None
+    assert app.get_search_index().search("park")[0] == 0
+
+
+@pytest.mark.parametrize("operation", [
+    {"op": "explode", "path": "pets/cat.jpg"},
+    {"op": "delete"},
+    {"op": "delete", "path": "../pets/cat.jpg"},
+    {"op": "delete", "path": ".tags.txt"},
+    {"op": "add_tags", "path": "pets/cat.jpg", "tags": 3},
+    "delete pets/cat.jpg",
+])
+def test_invalid_operations_fail_alone(library, operation):
+    result = bulk(operation, {"op": "add_tags", "path": "pets/cat.jpg", "tags": "fluffy"})
+    assert [item["status"] for item in result["results"]] == ["error", "success"]
+    assert app.get_metadata_store().get("pets/cat.jpg")["tags"] == "cat, sofa, fluffy"
+
+
+def test_request_validation(library, monkeypatch):
+    client = app.app.test_client()
+    assert client.post("/api/bulk", json={"operations": []}).status_code == 400
+    assert client.post("/api/bulk", data="not json").status_code == 400
+    monkeypatch.setattr(app, "BULK_MAX_OPERATIONS", 2)
+    operations = [{"op": "delete", "path": "pets/cat.jpg"}] * 3
+    assert client.post("/api/bulk", json={"operations": operations}).status_code == 400
+    assert (library / "pets" / "cat.jpg").exists()
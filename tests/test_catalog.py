@@ -0,0 +1,140 @@
+"""Catalog export and import (/api/export, /api/import) in JSON Lines and Parquet."""
+import io
+import json
+import os
+import sys
+
+os.environ.setdefault('LITELLM_LOCAL_MODEL_COST_MAP', 'True')  # No network access when importing litellm
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+TAGGED = {"format": "image", "tags": "cat, sofa", "description": "A cat on a sofa"}
+UNTAGGED = {"format": "image", "tags": "untagged", "description": "No description available"}
+FORMATS = ["jsonl", pytest.param("parquet", marks=pytest.mark.skipif(app.pq is None, reason="needs pyarrow"))]
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    for rel_path in ("pets/cat.jpg", "pets/new.jpg", "notes.txt"):
+        path = tmp_path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(rel_path.encode())
+        # An mtime with sub-microsecond digits, which Parquet timestamps don't keep
+        os.utime(path, ns=(1_700_000_000_123_456_789, 1_700_000_000_123_456_789))
+    monkeypatch.setattr(app, "ROOT_FOLDER", str(tmp_path))
+    monkeypatch.setattr(app, "CONTENT_HASHING", False)
+    monkeypatch.setattr(app, "metadata_store", None)
+    monkeypatch.setattr(app, "search_index", app.SearchIndex())
+    store = app.get_metadata_store()
+    store.apply({"pets/cat.jpg": dict(TAGGED), "pets/new.jpg": dict(UNTAGGED),
+                 "notes.txt": {"format": "txt", "tags": "todo", "description": "Shopping list"}})
+    cat = os.stat(tmp_path / "pets/cat.jpg")
+    store.set_hashes({"pets/cat.jpg": {"size": cat.st_size, "mtime": cat.st_mtime_ns, "hash": "sha256:cafe",
+                                       "phash": "00ff00ff00ff00ff"}})
+    yield app.app.test_client()
+    app.metadata_store.close()
+    app.metadata_store = None
+
+
+def export(client, fmt):
+    response = client.get(f"/api/export?format={fmt}")
+    assert response.status_code == 200
+    assert response.mimetype == app.CATALOG_FORMATS[fmt]
+    return response.get_data()
+
+
+def records(data, fmt):
+    if fmt == "parquet":
+        return app.pq.read_table(io.BytesIO(data)).to_pylist()  # Must work without pandas
+    return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_export_records(library, fmt):
+    exported = {record["path"]: record for record in records(export(library, fmt), fmt)}
+    assert list(exported) == ["notes.txt", "pets/cat.jpg", "pets/new.jpg"]
+    cat = exported["pets/cat.jpg"]
+    assert cat["tags"] == ["cat", "sofa"]
+    assert cat["description"] == "A cat on a sofa"
+    assert (cat["hash"], cat["phash"]) == ("sha256:cafe", "00ff00ff00ff00ff")
+    assert cat["size"] == len(b"pets/cat.jpg")
+    # Placeholders are not exported as if they were metadata
+    assert (exported["pets/new.jpg"]["tags"], exported["pets/new.jpg"]["description"]) == ([], "")
+    assert exported["pets/new.jpg"]["hash"] is None
+
+
+def test_parquet_mtime_is_a_utc_timestamp(library):
+    if app.pq is None:
+        pytest.skip("needs pyarrow")
+    table = app.pq.read_table(io.BytesIO(export(library, "parquet")))
+    assert str(table.schema.field("mtime").type) == "timestamp[us, tz=UTC]"
+    mtime = table.to_pylist()[0]["mtime"]
+    assert mtime.utcoffset().total_seconds() == 0
+    assert int(mtime.timestamp() * 1_000_000) == 1_700_000_000_123_456
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_round_trip_restores_entries_and_hashes(library, fmt):
+    data = export(library, fmt)
+    store = app.get_metadata_store()
+    before = store.get_all()
+    store.apply(deletes=list(before))  # Hash records go with the entries
+    assert store.get_all() == {}
+
+    response = library.post(f"/api/import?format={fmt}", data=data)
+    assert response.status_code == 200
+    assert response.get_json() == {"imported": 3, "untagged": 0, "missing": 0, "invalid": 0, "hashes": 1}
+    assert store.get_all() == before
+    assert store.get_hashes(["pets/cat.jpg"])["pets/cat.jpg"]["hash"] == "sha256:cafe"
+    assert [path for path, _ in app.get_search_index().search("sofa")[1]] == ["pets/cat.jpg"]
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_untagged_records_keep_existing_metadata(library, fmt):
+    data = export(library, fmt)
+    store = app.get_metadata_store()
+    store.apply({"pets/new.jpg": {"format": "image", "tags": "dog", "description": "Tagged elsewhere"}})
+    stats = library.post(f"/api/import?format={fmt}", data=data).get_json()
+    assert stats["untagged"] == 1
+    assert store.get("pets/new.jpg")["tags"] == "dog"
+
+
+def test_changed_file_gets_no_stale_hash(library):
+    data = export(library, "jsonl")
+    path = os.path.join(app.ROOT_FOLDER, "pets/cat.jpg")
+    os.utime(path, ns=(1_800_000_000_000_000_000, 1_800_000_000_000_000_000))
+    app.get_metadata_store().apply(deletes=["pets/cat.jpg"])
+    stats = library.post("/api/import", data=data).get_json()
+    assert stats["hashes"] == 0
+    assert app.get_metadata_store().get("pets/cat.jpg") == TAGGED
+
+
+def test_invalid_lines_are_counted_and_skipped(library):
+    lines = [
+        json.dumps({"path": "pets/cat.jpg", "tags": ["lion"], "description": "Roar"}),
+        "{not json",
+        json.dumps([1, 2, 3]),
+        json.dumps({"path": ""}),
+        json.dumps({"path": "pets/cat.jpg", "tags": 5}),
+        json.dumps({"path": "pets/cat.jpg", "description": ["not", "text"]}),
+        json.dumps({"path": "../outside.jpg", "tags": ["x"]}),
+        json.dumps({"path": ".tags.txt", "tags": ["x"]}),
+        json.dumps({"path": "pets/gone.jpg", "tags": ["x"]}),
+        "",
+    ]
+    response = library.post("/api/import", data="\n".join(lines).encode())
+    assert response.status_code == 200
+    assert response.get_json() == {"imported": 1, "untagged": 0, "missing": 1, "invalid": 7, "hashes": 0}
+    assert app.get_metadata_store().get("pets/cat.jpg") == {"format": "image", "tags": "lion",
+                                                             "description": "Roar"}
+
+
+def test_import_rejects_bad_requests(library):
+    assert library.post("/api/import?format=csv", data=b"").status_code == 400
+    if app.pq is not None:
+        response = library.post("/api/import?format=parquet", data=b"not a parquet file")
+        assert response.status_code == 400
+        assert "Invalid catalog" in response.get_json()["error"]
@@ -0,0 +1,86 @@
+"""Byte-range and conditional GET behaviour of /files, served through send_media()."""
+import os
+import sys
+
+os.environ.setdefault('LITELLM_LOCAL_MODEL_COST_MAP', 'True')  # No network access when importing litellm
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+CONTENT = bytes(range(256)) * 4  # 1024 bytes, every offset distinguishable
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    (tmp_path / "clip.bin").write_bytes(CONTENT)
+    monkeypatch.setattr(app, "ROOT_FOLDER", str(tmp_path))
+    monkeypatch.setattr(app, "CONTENT_HASHING", False)
+    monkeypatch.setattr(app, "MEDIA_ACCEL_REDIRECT_PREFIX", "")
+    monkeypatch.setattr(app, "metadata_store", None)
+    yield app.app.test_client()
+    if app.metadata_store is not None:
+        app.metadata_store.close()
+        app.metadata_store = None
+
+
+def get_range(client, value, **headers):
+    return client.get("/files/clip.bin", headers={"Range": value, **headers})
+
+
+@pytest.mark.parametrize("value, start, end", [
+    ("bytes=0-99", 0, 99),  # Prefix
+    ("bytes=100-299", 100, 299),  # Middle
+    ("bytes=-100", 924, 1023),  # Suffix
+    ("bytes=1000-", 1000, 1023),  # Open-ended
+    ("bytes=1000-5000", 1000, 1023),  # End clamped to the file size
+])
+def test_satisfiable_ranges(client, value, start, end):
+    response = get_range(client, value)
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes {start}-{end}/{len(CONTENT)}"
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.get_data() == CONTENT[start:end + 1]
+    assert int(response.headers["Content-Length"]) == end - start + 1
+
+
+def test_unsatisfiable_range(client):
+    response = get_range(client, "bytes=2000-2100")
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_if_range_with_current_etag_sends_range(client):
+    etag = client.get("/files/clip.bin").headers["ETag"]
+    response = get_range(client, "bytes=10-19", **{"If-Range": etag})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(CONTENT)}"
+    assert response.get_data() == CONTENT[10:20]
+
+
+def test_if_range_with_stale_etag_sends_whole_file(client):
+    response = get_range(client, "bytes=10-19", **{"If-Range": '"stale-version"'})
+    assert response.status_code == 200
+    assert "Content-Range" not in response.headers
+    assert response.get_data() == CONTENT
+
+
+def test_if_none_match_returns_not_modified(client):
+    first = client.get("/files/clip.bin")
+    assert first.status_code == 200
+    assert first.get_data() == CONTENT
+    response = client.get("/files/clip.bin", headers={"If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+    assert response.headers["ETag"] == first.headers["ETag"]
+
+
+def test_etag_changes_with_the_file(client, tmp_path):
+    etag = client.get("/files/clip.bin").headers["ETag"]
+    path = tmp_path / "clip.bin"
+    path.write_bytes(CONTENT[::-1])
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1_000_000_000))
+    response = get_range(client, "bytes=0-3", **{"If-Range": etag})
+    assert response.status_code == 200
+    assert response.get_data() == CONTENT[::-1]
@@ -0,0 +1,98 @@
+"""The persisted search index: loading, staleness against the metadata store, and rebuilding."""
+import os
+import sys
+
+os.environ.setdefault('LITELLM_LOCAL_MODEL_COST_MAP', 'True')  # No network access when importing litellm
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def entry(tags, description="", file_format="image"):
+    return {"format": file_format, "tags": tags, "description": description}
+
+
+ENTRIES = {
+    "trips/beach.jpg": entry("sea, sand", "Waves on a beach"),
+    "trips/sunset.jpg": entry("sunset, sea", "The sun going down"),
+    "pets/cat.png": entry("cat", "A cat asleep"),
+}
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    for rel_path in ENTRIES:
+        path = tmp_path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"not really an image")
+    monkeypatch.setattr(app, "ROOT_FOLDER", str(tmp_path))
+    monkeypatch.setattr(app, "CONTENT_HASHING", False)
+    monkeypatch.setattr(app, "metadata_store", None)
+    monkeypatch.setattr(app, "search_index", app.SearchIndex())
+    store = app.get_metadata_store()
+    store.apply(dict(ENTRIES))
+    yield store
+    app.metadata_store.close()
+    app.metadata_store = None
+
+
+def index_file():
+    return app.metadata_path(app.ROOT_FOLDER, app.SEARCH_INDEX_FILENAME)
+
+
+def restart(monkeypatch):
+    """Drop the in-memory index, as a new process would start without one."""
+    monkeypatch.setattr(app, "search_index", app.SearchIndex())
+    return app.get_search_index()
+
+
+def hits(index, query):
+    return sorted(path for path, _ in index.search(query)[1])
+
+
+def test_builds_from_the_store_without_a_saved_index(library):
+    assert not os.path.exists(index_file())
+    assert hits(app.get_search_index(), "sea") == ["trips/beach.jpg", "trips/sunset.jpg"]
+
+
+def test_saved_index_round_trips(library, monkeypatch):
+    app.get_search_index().save(index_file())
+    index = restart(monkeypatch)
+    assert not index.dirty  # Loaded as saved, nothing to reconcile
+    assert hits(index, "cat") == ["pets/cat.png"]
+
+
+def test_edit_missing_from_the_saved_index_is_picked_up(library, monkeypatch):
+    app.get_search_index().save(index_file())
+    # Same entry count, changed tags: the store moved on after the last save (a crash, import-tags)
+    library.apply({"pets/cat.png": entry("zebra", "Stripes")})
+    index = restart(monkeypatch)
+    assert hits(index, "zebra") == ["pets/cat.png"]
+    assert hits(index, "asleep") == []
+    assert index.dirty
+
+
+def test_added_and_deleted_entries_are_reconciled(library, monkeypatch):
+    app.get_search_index().save(index_file())
+    library.apply({"pets/dog.png": entry("dog")}, ["trips/beach.jpg"])
+    index = restart(monkeypatch)
+    assert hits(index, "dog") == ["pets/dog.png"]
+    assert hits(index, "sea") == ["trips/sunset.jpg"]
+    assert "trips/beach.jpg" not in index.tag_index.get("sand", ())
+
+
+def test_unreadable_index_is_rebuilt(library, monkeypatch):
+    app.get_search_index().save(index_file())
+    with open(index_file(), "w", encoding="utf-8") as f:
+        f.write("{not json")
+    assert hits(restart(monkeypatch), "sea") == ["trips/beach.jpg", "trips/sunset.jpg"]
+
+
+def test_apply_metadata_changes_updates_the_index(library):
+    index = app.get_search_index()
+    app.apply_metadata_changes({"trips/beach.jpg": entry("surf")}, ["pets/cat.png"])
+    assert hits(index, "surf") == ["trips/beach.jpg"]
+    assert hits(index, "asleep") == []
+    assert index.dirty
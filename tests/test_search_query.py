@@ -0,0 +1,138 @@
+"""The search query language (parse_search_query) and SearchIndex.search results and facets."""
+import os
+import sys
+from datetime import datetime
+
+os.environ.setdefault('LITELLM_LOCAL_MODEL_COST_MAP', 'True')  # No network access when importing litellm
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+# path -> (format, tags, description, mtime)
+LIBRARY = {
+    "trips/beach.jpg": ("image", "sea, sand", "Waves on a quiet beach", "2023-06-01"),
+    "trips/Sunset.jpg": ("image", "Sunset, sea", "The sun going down", "2023-08-15"),
+    "trips2/harbour.png": ("image", "sea, boat", "Boats in a harbour", "2022-03-10"),
+    "pets/cat.jpg": ("image", "cat, sofa", "A cat asleep on a sofa", "2024-02-01"),
+    "docs/sea-report.pdf": ("pdf", "report", "Notes about the sea", "2024-05-20"),
+}
+
+
+def timestamp(day):
+    return datetime.strptime(day, "%Y-%m-%d").timestamp()
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    for rel_path, (_, _, _, day) in LIBRARY.items():
+        path = tmp_path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+        os.utime(path, (timestamp(day), timestamp(day) + 3600))
+    monkeypatch.setattr(app, "ROOT_FOLDER", str(tmp_path))
+    index = app.SearchIndex()
+    index.rebuild({rel_path: {"format": file_format, "tags": tags, "description": description}
+                   for rel_path, (file_format, tags, description, _) in LIBRARY.items()})
+    return index
+
+
+def hits(index, query):
+    return [path for path, _ in index.search(query)[1]]
+
+
+def test_parse_fields_phrases_and_negation():
+    assert app.parse_search_query('tag:Cat -format:pdf in:\\trips\\ "quiet beach" -sun') == [
+        ("tag", "cat", False),
+        ("format", "pdf", True),
+        ("in", "trips", False),
+        ("phrase", "quiet beach", False),
+        ("text", "sun", True),
+    ]
+
+
+def test_parse_dates_and_unknown_fields():
+    assert app.parse_search_query("after:2023-06 before:2024") == [
+        ("after", datetime(2023, 6, 1).timestamp(), False),
+        ("before", datetime(2024, 1, 1).timestamp(), False),
+    ]
+    # Unknown fields are plain text; text without word characters is matched as a substring
+    assert app.parse_search_query("camera:canon -") == [("text", "camera:canon", False), ("phrase", "-", False)]
+    with pytest.raises(ValueError):
+        app.parse_search_query("after:yesterday")
+
+
+def test_words_match_paths_tags_and_descriptions(index):
+    assert sorted(hits(index, "sea")) == sorted(["trips/beach.jpg", "trips/Sunset.jpg", "trips2/harbour.png",
+                                                 "docs/sea-report.pdf"])
+    assert hits(index, "sea boat") == ["trips2/harbour.png"]  # Every word must match
+    assert hits(index, "asleep") == ["pets/cat.jpg"]
+    assert hits(index, "harb") == ["trips2/harbour.png"]  # Prefixes match too
+
+
+def test_ranking_prefers_tag_matches(index):
+    # "sea" is a tag of the images but only in the path and description of the report
+    assert hits(index, "sea")[-1] == "docs/sea-report.pdf"
+
+
+def test_field_filters(index):
+    assert hits(index, "tag:sunset") == ["trips/Sunset.jpg"]
+    assert hits(index, "format:pdf") == ["docs/sea-report.pdf"]
+    assert hits(index, "in:trips") == ["trips/Sunset.jpg", "trips/beach.jpg"]  # Not trips2
+    assert hits(index, "in:TRIPS/ tag:sand") == ["trips/beach.jpg"]
+    assert hits(index, "tag:sea -in:trips") == ["trips2/harbour.png"]
+
+
+def test_negated_words_exclude_what_they_would_match(index):
+    # "sun" is a prefix of the tag and file name "Sunset"
+    assert sorted(hits(index, "sea -sun")) == ["docs/sea-report.pdf", "trips/beach.jpg", "trips2/harbour.png"]
+    assert sorted(hits(index, "sea -boats")) == ["docs/sea-report.pdf", "trips/Sunset.jpg", "trips/beach.jpg"]
+
+
+def test_phrases(index):
+    assert hits(index, '"quiet beach"') == ["trips/beach.jpg"]
+    assert sorted(hits(index, 'sea -"going down"')) == ["docs/sea-report.pdf", "trips/beach.jpg",
+                                                       "trips2/harbour.png"]
+
+
+def test_date_filters_use_the_indexed_mtime(index, monkeypatch):
+    def no_stat(*args, **kwargs):
+        raise AssertionError("date filters must not stat files")
+
+    monkeypatch.setattr(app.os, "stat", no_stat)
+    assert sorted(hits(index, "after:2024")) == ["docs/sea-report.pdf", "pets/cat.jpg"]
+    assert hits(index, "tag:sea before:2023") == ["trips2/harbour.png"]
+    assert hits(index, "tag:sea after:2023-07 before:2023-09") == ["trips/Sunset.jpg"]
+    assert sorted(hits(index, "tag:sea -after:2023-07")) == ["trips/beach.jpg", "trips2/harbour.png"]
+
+
+def test_set_mtimes_moves_a_file_between_date_ranges(index):
+    index.set_mtimes({"pets/cat.jpg": timestamp("2020-01-01")})
+    assert hits(index, "before:2021") == ["pets/cat.jpg"]
+    assert index.dirty
+
+
+def test_facets_count_every_match(index):
+    total, page, facets = index.search("sea", limit=2)
+    assert total == 4
+    assert len(page) == 2
+    assert facets["formats"] == [{"value": "image", "count": 3}, {"value": "pdf", "count": 1}]
+    assert facets["tags"][0] == {"value": "sea", "count": 3}
+    assert {"value": "boat", "count": 1} in facets["tags"]
+
+
+def test_pages_continue_where_the_last_one_ended(index):
+    everything = hits(index, "sea")
+    total, page, _ = index.search("sea", limit=3, offset=2)
+    assert total == 4
+    assert [path for path, _ in page] == everything[2:]
+
+
+def test_api_rejects_invalid_dates(index, monkeypatch):
+    monkeypatch.setattr(app, "get_search_index", lambda: index)
+    client = app.app.test_client()
+    assert client.get("/api/search?q=after:someday").status_code == 400
+    response = client.get("/api/search?q=tag:cat")
+    assert response.status_code == 200
+    assert [item["path"] for item in response.get_json()["items"]] == ["pets/cat.jpg"]
@@ -0,0 +1,90 @@
+"""The incremental startup scan: folders that fail to list keep their entries."""
+import os
+import shutil
+import sys
+
+os.environ.setdefault('LITELLM_LOCAL_MODEL_COST_MAP', 'True')  # No network access when importing litellm
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+TAGGED = {"format": "image", "tags": "cat, sofa", "description": "A cat on a sofa"}
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    for rel_path in ("pets/cat.jpg", "pets/dog.jpg", "pets/old/bird.jpg", "home.jpg"):
+        path = tmp_path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"not really an image")
+    monkeypatch.setattr(app, "ROOT_FOLDER", str(tmp_path))
+    monkeypatch.setattr(app, "CONTENT_HASHING", False)
+    monkeypatch.setattr(app, "THUMBNAIL_PREGENERATE", False)
+    monkeypatch.setattr(app, "SCAN_MTIME_GRACE", 0)
+    monkeypatch.setattr(app, "metadata_store", None)
+    monkeypatch.setattr(app, "search_index", app.SearchIndex())
+    yield tmp_path
+    app.metadata_store.close()
+    app.metadata_store = None
+
+
+def fail_listing(monkeypatch, tmp_path, rel_dir):
+    list_folder = app.list_folder
+
+    def flaky_list_folder(full_dir):
+        if os.path.normpath(full_dir) == os.path.normpath(os.path.join(tmp_path, rel_dir)):
+            raise PermissionError(13, "Permission denied", full_dir)
+        return list_folder(full_dir)
+
+    monkeypatch.setattr(app, "list_folder", flaky_list_folder)
+
+
+def touch_dir(path):
+    """Bump a directory's mtime so the next scan re-lists it instead of trusting the manifest."""
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1_000_000_000))
+
+
+def test_first_scan_adds_every_file(library):
+    stats = app.initialize_tags()
+    assert stats["added"] == 4
+    assert set(app.get_metadata_store().get_all()) == {"pets/cat.jpg", "pets/dog.jpg", "pets/old/bird.jpg", "home.jpg"}
+
+
+def test_removed_folder_entries_are_deleted(library):
+    app.initialize_tags()
+    shutil.rmtree(library / "pets")
+    touch_dir(library)
+    app.initialize_tags()
+    assert set(app.get_metadata_store().get_all()) == {"home.jpg"}
+
+
+def test_unreadable_folder_keeps_its_entries(library, monkeypatch):
+    app.initialize_tags()
+    app.apply_metadata_changes({"pets/cat.jpg": TAGGED})
+    touch_dir(library / "pets")
+    list_folder = app.list_folder
+    fail_listing(monkeypatch, library, "pets")
+    stats = app.initialize_tags()
+    assert stats["removed"] == 0
+    store = app.get_metadata_store()
+    assert set(store.get_all()) == {"pets/cat.jpg", "pets/dog.jpg", "pets/old/bird.jpg", "home.jpg"}
+    assert store.get("pets/cat.jpg") == TAGGED
+    assert app.load_scan_manifest(store)["pets"]["mtime"] == 0
+
+    # Once it can be listed again it is re-listed, not trusted from the manifest
+    os.remove(library / "pets" / "dog.jpg")
+    monkeypatch.setattr(app, "list_folder", list_folder)
+    stats = app.initialize_tags()
+    assert stats["removed"] == 1
+    assert set(store.get_all()) == {"pets/cat.jpg", "pets/old/bird.jpg", "home.jpg"}
+
+
+def test_unreadable_folder_on_a_first_scan_keeps_its_entries(library, monkeypatch):
+    app.get_metadata_store().apply({"pets/cat.jpg": TAGGED})
+    fail_listing(monkeypatch, library, "pets")
+    app.initialize_tags()
+    store = app.get_metadata_store()
+    assert store.get("pets/cat.jpg") == TAGGED
+    assert "home.jpg" in store.get_all()
@@ -0,0 +1,239 @@
+"""The AI tagging worker against a stubbed vision model (litellm.completion)."""
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+os.environ.setdefault('LITELLM_LOCAL_MODEL_COST_MAP', 'True')  # No network access when importing litellm
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+UNTAGGED = {"format": "image", "tags": "untagged", "description": "No description available"}
+
+
+class StubModel:
+    """Stands in for litellm.completion: replies with the next queued answer and records every request."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def __call__(self, **kwargs):
+        with self.lock:
+            self.requests.append(kwargs)
+            reply = self.replies.pop(0) if len(self.replies) > 1 else self.replies[0]
+        if isinstance(reply, Exception):
+            raise reply
+        if callable(reply):
+            reply = reply()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))],
+                               usage=SimpleNamespace(total_tokens=100))
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "ROOT_FOLDER", str(tmp_path))
+    monkeypatch.setattr(app, "CONTENT_HASHING", True)
+    monkeypatch.setattr(app, "TAGGING_BACKOFF_BASE", 0)
+    monkeypatch.setattr(app, "metadata_store", None)
+    monkeypatch.setattr(app, "search_index", app.SearchIndex())
+    yield tmp_path
+    if app.metadata_store is not None:
+        app.metadata_store.close()
+        app.metadata_store = None
+
+
+def add_images(library, images):
+    """Create {rel_path: content} files with untagged entries and content hashes."""
+    hashes = {}
+    for rel_path, content in images.items():
+        path = library / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        hashes[rel_path] = {"size": len(content), "mtime": os.stat(path).st_mtime_ns,
+                            "hash": f"test:{content.hex()}", "phash": None}
+    store = app.get_metadata_store()
+    store.apply({rel_path: dict(UNTAGGED) for rel_path in images})
+    store.set_hashes(hashes)
+
+
+def make_worker(library, model, monkeypatch):
+    monkeypatch.setattr(app.litellm, "completion", model)
+    worker = app.TaggingWorker(str(library), workers=1, requests_per_minute=10000, tokens_per_minute=10 ** 8)
+    return worker
+
+
+def drain(worker):
+    """Process every queued job on this thread, then write the results back."""
+    while (job := worker.queue.claim()) is not None:
+        worker.process(*job)
+    worker.flush()
+
+
+def test_copies_in_one_batch_share_a_request(library, monkeypatch):
+    add_images(library, {"a.jpg": b"same", "b/a.jpg": b"same", "c.jpg": b"same", "d.jpg": b"other"})
+    model = StubModel("cat, sofa")
+    worker = make_worker(library, model, monkeypatch)
+    assert worker.discover() == 4
+    drain(worker)
+    worker.queue.close()
+    assert len(model.requests) == 2
+    assert worker.counters["cache_hits"] == 2
+    entries = app.get_metadata_store().get_all()
+    assert {entry["tags"] for entry in entries.values()} == {"cat, sofa"}
+
+
+def test_copy_waits_for_the_request_in_flight(library, monkeypatch):
+    add_images(library, {"a.jpg": b"same", "b.jpg": b"same"})
+    started, release = threading.Event(), threading.Event()
+
+    def slow_reply():
+        started.set()
+        release.wait(10)
+        return "dog, park"
+
+    model = StubModel(slow_reply)
+    worker = make_worker(library, model, monkeypatch)
+    worker.discover()
+    first = threading.Thread(target=worker.process, args=worker.queue.claim())
+    first.start()
+    assert started.wait(10)
+    worker.process(*worker.queue.claim())  # Returns at once: the same content is being tagged
+    release.set()
+    first.join()
+    worker.flush()
+    worker.queue.close()
+    assert len(model.requests) == 1
+    store = app.get_metadata_store()
+    assert store.get("a.jpg")["tags"] == store.get("b.jpg")["tags"] == "dog, park"
+
+
+def test_discover_queues_only_untagged_images(library, monkeypatch):
+    add_images(library, {"a.jpg": b"a", "b.jpg": b"b"})
+    store = app.get_metadata_store()
+    store.apply({"b.jpg": {"format": "image", "tags": "done, already", "description": "By hand"},
+                 "notes.txt": {"format": "txt", "tags": "untagged", "description": "No description available"}})
+    worker = make_worker(library, StubModel("cat"), monkeypatch)
+    assert worker.discover() == 1
+    assert worker.discover() == 0  # Already queued
+    assert worker.queue.counts() == {"pending": 1}
+    drain(worker)
+    assert worker.discover() == 0  # Tagged now
+    store.apply({"a.jpg": dict(UNTAGGED)})  # Reset by hand: only an explicit run queues it again
+    assert worker.discover() == 0
+    assert worker.discover(requeue=True) == 1
+    worker.queue.close()
+
+
+def test_unusable_replies_are_retried_then_fail(library, monkeypatch):
+    add_images(library, {"a.jpg": b"a"})
+    model = StubModel("")  # The model answers, but without tags
+    worker = make_worker(library, model, monkeypatch)
+    worker.discover()
+    drain(worker)
+    assert len(model.requests) == app.TAGGING_MAX_RETRIES + 1
+    assert worker.counters["retries"] == app.TAGGING_MAX_RETRIES
+    assert worker.counters["tokens"] == 100 * (app.TAGGING_MAX_RETRIES + 1)  # Paid for all the same
+    assert worker.queue.counts() == {"failed": 1}
+    assert app.get_metadata_store().get("a.jpg")["tags"] == "untagged"
+
+    # Failed jobs stay failed until they are retried explicitly
+    assert worker.discover() == 0
+    drain(worker)
+    assert len(model.requests) == app.TAGGING_MAX_RETRIES + 1
+    model.replies = ["beach, sea"]
+    assert worker.queue.retry_failed() == 1
+    drain(worker)
+    worker.queue.close()
+    assert app.get_metadata_store().get("a.jpg")["tags"] == "beach, sea"
+
+
+def test_api_errors_are_retried(library, monkeypatch):
+    add_images(library, {"a.jpg": b"a"})
+    model = StubModel(ConnectionError("reset"), TimeoutError("slow"), "cat, box")
+    worker = make_worker(library, model, monkeypatch)
+    worker.discover()
+    drain(worker)
+    worker.queue.close()
+    assert len(model.requests) == 3
+    assert app.get_metadata_store().get("a.jpg")["tags"] == "cat, box"
+
+
+def test_attempts_and_unflushed_jobs_survive_a_restart(library, monkeypatch):
+    add_images(library, {"a.jpg": b"a", "b.jpg": b"b"})
+    model = StubModel(ConnectionError("down"))
+    worker = make_worker(library, model, monkeypatch)
+    worker.discover()
+    # Both allowed requests fail for a.jpg, and the process dies before the job is marked failed
+    monkeypatch.setattr(app, "TAGGING_MAX_RETRIES", 1)
+    path, attempts = worker.queue.claim()
+    assert worker.request_tags(path, str(library / path), attempts) == ("failed", "down")
+    # b.jpg is tagged but its result is still buffered when the process dies
+    model.replies = ["dog"]
+    worker.process(*worker.queue.claim())
+    assert worker.results
+    worker.queue.conn.close()  # A crash: nothing flushed, both jobs left running
+
+    monkeypatch.setattr(app, "TAGGING_MAX_RETRIES", 3)
+    model = StubModel(ConnectionError("still down"))
+    resumed = make_worker(library, model, monkeypatch)
+    assert resumed.queue.counts() == {"pending": 2}
+    drain(resumed)
+    # Each job picks up where it left off: a.jpg had used 2 of its 4 requests and b.jpg 1, whose result was
+    # lost with the buffer, so b.jpg is sent again
+    assert len(model.requests) == 2 + 3
+    assert resumed.queue.counts() == {"failed": 2}
+    model.replies = ["cat"]
+    resumed.queue.retry_failed()
+    drain(resumed)
+    resumed.queue.close()
+    store = app.get_metadata_store()
+    assert store.get("a.jpg")["tags"] == store.get("b.jpg")["tags"] == "cat"
+
+
+def test_worker_threads_tag_the_library(library, monkeypatch):
+    add_images(library, {f"{i}.jpg": bytes([i]) for i in range(6)})
+    model = StubModel("tree, sky")
+    worker = make_worker(library, model, monkeypatch)
+    worker.workers = 3
+    worker.start()
+    try:
+        for _ in range(100):
+            if worker.queue.counts().get("done") == 6:
+                break
+            threading.Event().wait(0.1)
+        status = worker.status()
+    finally:
+        worker.stop()
+    assert status["done"] == status["tagged"] == 6
+    assert len(model.requests) == 6
+    assert {entry["tags"] for entry in app.get_metadata_store().get_all().values()} == {"tree, sky"}
+
+
+@pytest.mark.skipif(app.Image is None, reason="needs Pillow")
+def test_small_originals_are_sent_unchanged(library):
+    app.Image.new("RGB", (200, 100), (10, 120, 200)).save(library / "flat.png")  # Compresses far better than JPEG
+    data, mime_type = app.prepare_image_payload(str(library / "flat.png"))
+    assert (data, mime_type) == ((library / "flat.png").read_bytes(), "image/png")
+
+
+@pytest.mark.skipif(app.Image is None, reason="needs Pillow")
+def test_large_or_exif_originals_are_reencoded(library):
+    edge = app.TAGGING_MAX_EDGE * 2
+    app.Image.new("RGB", (edge, edge // 2), (10, 120, 200)).save(library / "big.png")
+    data, mime_type = app.prepare_image_payload(str(library / "big.png"))
+    assert mime_type == f"image/{app.TAGGING_IMAGE_FORMAT}"
+    with app.Image.open(app.io.BytesIO(data)) as img:
+        assert img.size == (app.TAGGING_MAX_EDGE, app.TAGGING_MAX_EDGE // 2)
+
+    exif = app.Image.Exif()
+    exif[0x010F] = "Camera maker"
+    app.Image.new("RGB", (200, 100), (10, 120, 200)).save(library / "camera.png", exif=exif)
+    data, mime_type = app.prepare_image_payload(str(library / "camera.png"))
+    assert mime_type == f"image/{app.TAGGING_IMAGE_FORMAT}"
+    with app.Image.open(app.io.BytesIO(data)) as img:
+        assert not img.getexif()